@@ -4,7 +4,6 @@ import os,sys
 
 from lxml import objectify,etree
 import numpy as np
-import numpy.lib.recfunctions as npr
 import math
 import re
 import string
@@ -12,9 +11,30 @@ import datetime
 import dateutil.parser
 import zipfile
 import pickle
+import itertools
+import tempfile
+import ast
+import socket
+import operator
+import zlib
+import heapq
+import weakref
+import gc
+import ctypes
+import threading
 
 from fitparse.base import FitFile
 from fitparse import Activity
+try:
+    import numexpr
+    hasNumexpr=True
+except ImportError:
+    hasNumexpr=False
+try:
+    import psutil
+    hasPsutil=True
+except ImportError:
+    hasPsutil=False
 
 #units. only ascii chars, utf8 fails
 units={   'SI'  :('System International units (m, s)',1.0),\
@@ -34,8 +54,1342 @@ units={   'SI'  :('System International units (m, s)',1.0),\
           'hr'  :('hours',1/3600),\
           'deg'   :('degrees',1.0)}
 
+# storage type of columns (see GpxObj.set_precision()), other numeric columns are float64/int64.
+# lat/lon need float64 (1e-7 degree is 1 cm). sensors and angles fit in float32 (7 significant digits),
+# which also keeps nan for missing values (fit files)
+precision={'lat':'float64','lon':'float64',
+           'hr':'float32','heart_rate':'float32','heartrate':'float32',
+           'cad':'float32','cadence':'float32','power':'float32',
+           'atemp':'float32','temp':'float32','temperature':'float32',
+           'course':'float32','slope':'float32'}
+
+# columns holding angles (degrees), interpolated along the shortest arc (see GpxObj.resample())
+circular=['course','wind_dir']
+
+# bucket periods (s) of time rollups (see GpxObj.get_rollup()), each one a multiple of the previous one
+rollup_periods=[1,10,60,600]
+
+def haversine(lat1,lon1,lat2,lon2):
+    # vectorized haversine distance (m) between points given in degrees
+    lat1,lon1,lat2,lon2=[np.asarray(x)*np.pi/180.0 for x in (lat1,lon1,lat2,lon2)]
+    dlon = (lon2 - lon1)
+    dlat = (lat2 - lat1)
+    a = (np.sin(dlat/2))**2 + np.cos(lat1) * np.cos(lat2) * (np.sin(dlon/2.0))**2
+    return 6371000 * 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0-a))
+
+def bearing(lat1,lon1,lat2,lon2):
+    # vectorized course (degrees, 0..360) from points 1 to points 2 given in degrees
+    lat1,lon1,lat2,lon2=[np.asarray(x)*np.pi/180.0 for x in (lat1,lon1,lat2,lon2)]
+    dlon = (lon2 - lon1)
+    b=np.arctan2(np.sin(dlon)*np.cos(lat2),np.cos(lat1)*np.sin(lat2)-np.sin(lat1)*np.cos(lat2)*np.cos(dlon))
+    return np.mod((360+b*180/np.pi),360)
+
+def smoothed_slope(ele,dist,conv,starts=[0]):
+    # slope from elevation and horizontal distance between points, both averaged over conv points.
+    # point i only depends on points i-1 to i+conv-1 of its segment (starts: first row of each segment).
+    # averages are differences of cumulative sums, windows stop at the end of their segment
+    n=len(ele)
+    starts=np.asarray(starts,dtype='int')
+    ends=np.append(starts[1:],n)[np.searchsorted(starts,np.arange(n),'right')-1]
+    stop=np.minimum(np.arange(n)+conv,ends)
+    def average(x):
+        c=np.concatenate(([0.0],np.cumsum(x)))
+        return (c[stop]-c[:-1])/conv
+    s=np.ediff1d(average(ele),to_begin=0)/average(dist)
+    s[starts[starts<n]]=0.0
+    return s
+
+def parse_iso8601(values):
+    # vectorized ISO-8601 parser: YYYY-MM-DD[T| ]hh:mm:ss[.fffffffff][Z|+hh:mm|-hh:mm|+hhmm|+hh] to datetime64[ns] (UTC)
+    # all strings are parsed at once through a (rows,chars) array of digits. strings which do not
+    # follow this pattern are handed over to dateutil, NaT if it fails too.
+    s=np.asarray(values,dtype='S')
+    n=s.shape[0]
+    w=max(s.dtype.itemsize,19)+7                                # room for the end of string and offset
+    c=np.zeros((n,w),dtype='uint8')
+    if n>0:
+        c[:,:s.dtype.itemsize]=s.view('uint8').reshape(n,s.dtype.itemsize)
+    dig=c-np.uint8(48)                                          # non digits wrap around to values >9
+    isdig=dig<=9
+    dig=dig.astype('int64')
+    def num(a,b):
+        return np.dot(dig[:,a:b],10**np.arange(b-a-1,-1,-1))
+    ok=isdig[:,[0,1,2,3,5,6,8,9,11,12,14,15,17,18]].all(1)&(c[:,4]==45)&(c[:,7]==45)&(c[:,13]==58)&(c[:,16]==58)
+    ok&=(c[:,10]==84)|(c[:,10]==32)
+    # fractional seconds, nanosecond resolution (extra digits are ignored)
+    hasfrac=(c[:,19]==46)|(c[:,19]==44)
+    run=np.logical_and.accumulate(isdig[:,20:],axis=1)&hasfrac[:,None]
+    ndig=run.sum(1)
+    k=min(9,run.shape[1])
+    frac=np.dot(dig[:,20:20+k]*run[:,:k],10**np.arange(8,8-k,-1))
+    # time zone
+    pos=19+hasfrac+ndig
+    rows=np.arange(n)
+    tz=c[rows,pos]
+    sign=np.where(tz==45,-1,1)
+    signed=(tz==43)|(tz==45)
+    # offset +hh, +hhmm or +hh:mm
+    colon=c[rows,pos+3]==58
+    m=np.where(colon,pos+4,pos+3)
+    hasmin=isdig[rows,m]&isdig[rows,m+1]
+    oh=dig[rows,pos+1]*10+dig[rows,pos+2]
+    om=np.where(hasmin,dig[rows,m]*10+dig[rows,m+1],0)
+    offset=np.where(signed,sign*(oh*3600+om*60),0)
+    end=np.where(signed,np.where(hasmin,m+2,pos+3),np.where(tz==90,pos+1,pos))
+    ok&=(tz==0)|(tz==90)|signed
+    ok&=~signed|(isdig[rows,pos+1]&isdig[rows,pos+2])
+    ok&=c[rows,end]==0
+    # values out of range (month 13, february 30, 24:00,...) would roll over: they go to dateutil
+    month,day=num(5,7),num(8,10)
+    ok&=(month>=1)&(month<=12)&(day>=1)&(num(11,13)<=23)&(num(14,16)<=59)&(num(17,19)<=59)
+    t=(num(0,4)-1970).astype('M8[Y]').astype('M8[M]')+(np.clip(month,1,12)-1)
+    ok&=day<=((t+1).astype('M8[D]')-t.astype('M8[D]')).astype('int64')
+    t=t.astype('M8[D]')+(day-1)
+    sec=(num(11,13)*60+num(14,16))*60+num(17,19)-offset
+    t=t.astype('M8[ns]')+(sec*1000000000+frac).astype('m8[ns]')
+    for i in np.flatnonzero(~ok):
+        try:
+            dt=dateutil.parser.parse(s[i])
+            if dt.tzinfo is not None:
+                dt=dt.replace(tzinfo=None)-dt.utcoffset()
+            t[i]=np.datetime64(dt,'ns')
+        except (ValueError,OverflowError):
+            t[i]=np.datetime64('NaT')
+    return t
+
+def format_iso8601(t):
+    # datetime64 (scalar or array) to ISO-8601 string(s), UTC. milliseconds are shown only when needed
+    t=np.asarray(t,dtype='M8[ns]')
+    unit='s' if (t.astype('int64')%1000000000==0).all() else 'ms'
+    res=np.datetime_as_string(t,unit=unit,timezone='UTC')
+    if res.ndim==0:
+        return str(res)
+    return res
+
+def edit_size(edit):
+    # memory (bytes) held by an undo/redo journal entry
+    size=0
+    for x in edit[1:]:
+        if isinstance(x,np.ndarray):
+            size+=x.nbytes
+        elif isinstance(x,ColumnStore):
+            size+=sum(c.nbytes for c in x.columns.values())
+        elif isinstance(x,dict):
+            size+=sum(idx.nbytes+values.nbytes for (idx,values) in x.values())
+        elif isinstance(x,list):
+            size+=sum(edit_size(e) for e in x)
+    return size
+
 # scale and units are dictionnaries indexed by column keys
-# d is an np.array
+# d is a ColumnStore
+
+# global write counter. each write to a column stamps it with a new value, so that
+# a stamp is never reused, even when a column is replaced by a new array
+stamps=itertools.count(1)
+
+def index_range(key,n):
+    # rows (lo,hi) addressed by an index into a column of n rows. (0,None) if unknown
+    if isinstance(key,(int,long,np.integer)):
+        if key<0:
+            key+=n
+        return (key,key+1)
+    if isinstance(key,slice):
+        start,stop,step=key.indices(n)
+        if step<0:
+            start,stop=stop+1,start+1
+        return (start,max(start,stop))
+    if isinstance(key,(list,np.ndarray)):
+        idx=np.asarray(key)
+        if idx.dtype==np.bool_:
+            idx=np.flatnonzero(idx)
+        if idx.size==0:
+            return (0,0)
+        if idx.dtype.kind in 'iu':
+            idx=np.where(idx<0,idx+n,idx)
+            return (int(idx.min()),int(idx.max())+1)
+    return (0,None)
+
+class WriteLog(object):
+    # version stamp of a column (shared with its views) and rows written by the last writes,
+    # so that derived columns can be patched instead of recomputed (see GpxObj.refresh())
+    def __init__(self):
+        self.stamp=next(stamps)
+        self.floor=self.stamp                       # writes before floor are forgotten
+        self.ranges=[]                              # (stamp,lo,hi). hi is None when the whole column was written
+
+    def write(self,lo=0,hi=None):
+        self.stamp=next(stamps)
+        self.ranges.append((self.stamp,lo,hi))
+        if len(self.ranges)>32:
+            self.floor=self.ranges.pop(0)[0]
+
+    def changed_since(self,stamp):
+        # (lo,hi) rows written since stamp, None if unknown (whole column, or forgotten)
+        if stamp<self.floor:
+            return None
+        lo,hi=None,None
+        for (s,a,b) in self.ranges:
+            if s>stamp:
+                if b==None:
+                    return None
+                if a<b:
+                    lo=a if lo==None else min(lo,a)
+                    hi=b if hi==None else max(hi,b)
+        return (0,0) if lo==None else (lo,hi)
+
+class Column(np.ndarray):
+    # ndarray which records writes (item assignment, fill, in-place ufuncs) in its WriteLog.
+    # views (slices) share the log of the column they come from, so gpx['ok'][10:20]=False is seen
+    # (as a write to the whole column, since a view does not know where it starts).
+    # results of arithmetics are plain ndarrays
+    def __new__(cls,data):
+        col=np.asarray(data).view(cls)
+        col.log=WriteLog()
+        col.root=True
+        return col
+
+    def __array_finalize__(self,obj):
+        self.root=False
+        if self.base is not None:
+            self.log=getattr(obj,'log',None)
+        else:
+            self.log=WriteLog()                     # new memory (empty_like, copy,...) is not the column
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        inputs=tuple(np.asarray(x) if isinstance(x,Column) else x for x in inputs)
+        if 'out' in kwargs:
+            for o in kwargs['out']:
+                if isinstance(o,Column):
+                    o.touch()
+            kwargs['out']=tuple(np.asarray(o) if isinstance(o,Column) else o for o in kwargs['out'])
+        return getattr(ufunc,method)(*inputs,**kwargs)
+
+    def __setitem__(self,key,value):
+        np.ndarray.__setitem__(self,key,value)
+        if self.root:
+            self.touch(*index_range(key,self.shape[0]))
+        else:
+            self.touch()
+
+    def __repr__(self):
+        return repr(np.asarray(self))
+
+    def fill(self,value):
+        np.ndarray.fill(self,value)
+        self.touch()
+
+    def touch(self,lo=0,hi=None):
+        if self.log!=None:
+            self.log.write(lo,hi)
+
+def code_type(n):
+    # smallest type for the codes of a dictionary of n texts
+    return 'uint8' if n<=256 else 'uint16' if n<=65536 else 'int32'
+
+def is_text(value):
+    return isinstance(value,basestring) or np.asarray(value).dtype.kind in 'SUO'
+
+class Categories(object):
+    # dictionary of categorical columns: text of each code and code of each text. texts are only ever
+    # appended, so one dictionary can be shared by a column and its copies (rows kept for undo,...)
+    def __init__(self):
+        self.values=[]
+        self.codes={}
+        self.array=np.zeros(0,dtype='S1')
+
+    def encode(self,values):
+        # codes of values (a text or an array of texts), unknown texts are added. numbers are stored as text
+        values=np.asarray(values)
+        if not values.dtype.kind in 'SUO':
+            values=values.astype('S')
+        unique,inverse=np.unique(values.ravel(),return_inverse=True)
+        for value in unique:
+            if not value in self.codes:
+                self.codes[value]=len(self.values)
+                self.values.append(value)
+        lookup=np.array([self.codes[value] for value in unique],dtype='int64')
+        return lookup[inverse].reshape(values.shape)
+
+    def find(self,values):
+        # codes of values, -1 for texts which are not in the dictionary (nothing is added)
+        if isinstance(values,basestring):
+            return self.codes.get(values,-1)
+        return np.array([self.codes.get(value,-1) for value in np.asarray(values).ravel()],dtype='int64').reshape(np.shape(values))
+
+    def decode(self,codes):
+        if len(self.array)!=len(self.values):
+            self.array=np.array(self.values)
+        return self.array[codes]
+
+class Categorical(Column):
+    # text column stored as integer codes (one byte up to 256 different texts, then two) into a Categories
+    # dictionary. == and != with texts compare codes. reading one row, repr() and decode() give texts
+    def __new__(cls,codes,categories):
+        col=Column.__new__(cls,codes)
+        col.categories=categories
+        col.owner=None
+        return col
+
+    @classmethod
+    def from_values(cls,values,categories=None):
+        categories=Categories() if categories==None else categories
+        codes=categories.encode(values)
+        return cls(codes.astype(code_type(len(categories.values))),categories)
+
+    def __array_finalize__(self,obj):
+        Column.__array_finalize__(self,obj)
+        self.categories=getattr(obj,'categories',None)
+        self.owner=None                             # (weak reference to the ColumnStore, key), see ColumnStore.__getitem__
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        if ufunc in (np.equal,np.not_equal):
+            inputs=tuple(self.categories.find(x) if not isinstance(x,Categorical) and is_text(x) else x for x in inputs)
+        return Column.__array_ufunc__(self,ufunc,method,*inputs,**kwargs)
+
+    def __getitem__(self,key):
+        col=self.current()
+        if col is not self:
+            return col[key]
+        value=np.ndarray.__getitem__(self,key)
+        if isinstance(value,Categorical):
+            return value
+        return self.categories.values[value]
+
+    def __setitem__(self,key,value):
+        col=self.current()
+        codes=col.codes_of(value)
+        if np.size(codes) and np.max(codes)>np.iinfo(col.dtype).max:
+            # more texts than the codes can hold: the column is replaced in its store by one with wider codes
+            if col.owner==None or col.owner[0]()==None:
+                raise OverflowError("too many texts for the codes of this column, assign the whole column (gpx.d[key]=values)")
+            col=col.owner[0]().widen(col.owner[1])
+        Column.__setitem__(col,key,codes)
+
+    def current(self):
+        # the column which replaced this one in its store (wider codes), so that a column held by a script
+        # keeps reading and writing the stored one. itself otherwise
+        store=self.owner[0]() if self.owner!=None else None
+        col=store.columns.get(self.owner[1]) if store!=None else None
+        return col if isinstance(col,Categorical) and col.log is self.log else self
+
+    def __repr__(self):
+        return repr(self.decode())
+
+    def __str__(self):
+        return str(self.decode())
+
+    def fill(self,value):
+        self[...]=value
+
+    def codes_of(self,values):
+        # codes in this column's dictionary of texts or categorical values. numbers are stored as text
+        if isinstance(values,Categorical):
+            if values.categories is self.categories:
+                return np.asarray(values)
+            values=values.decode()
+        return self.categories.encode(values)
+
+    def decode(self):
+        return self.categories.decode(np.asarray(self.current()))
+
+def categorical_like(col,codes):
+    # codes computed from column col (rows taken, deleted,...) keep its dictionary
+    if isinstance(col,Categorical):
+        return Categorical(codes.astype(code_type(len(col.categories.values)),copy=False),col.categories)
+    return codes
+
+class ColumnStore(object):
+    # columnar storage: one contiguous array per column, plus a schema (ordered names and types)
+    # adding or dropping a column does not touch the other columns, and reading a column returns
+    # the stored array itself (no copy). Indexing with rows (slice, index array, mask) returns a new store
+    # with a cachedir, columns are np.memmap files in that directory instead of RAM, so that tracks larger
+    # than memory can be opened: the os pages columns in and out as they are read.
+    def __init__(self,rows=0,cachedir=None):
+        self.rows=rows
+        self.names=[]
+        self.columns={}
+        self.cachedir=cachedir
+        self.files=[]                               # column files which could not be unlinked while mapped (windows)
+        self.buffers={}                             # growth buffers of appended columns (see append_rows)
+
+    @classmethod
+    def from_records(cls,rec,cachedir=None):
+        store=cls(rec.shape[0],cachedir)
+        for key in rec.dtype.names:
+            store.columns[key]=store.new_column(rec[key])
+            store.names.append(key)
+        return store
+
+    def to_records(self,keys=None,rows=None):
+        # categorical columns are decoded to text. rows: slice of the rows to convert (all if None)
+        if keys==None:
+            keys=self.names
+        rows=slice(None) if rows==None else rows
+        cols=dict((k,self.columns[k].categories.decode(np.asarray(self.columns[k])[rows]) if isinstance(self.columns[k],Categorical) \
+                        else self.columns[k][rows]) for k in keys)
+        rec=np.empty(len(xrange(*rows.indices(self.rows))),dtype=[(k,cols[k].dtype) for k in keys])
+        for k in keys:
+            rec[k]=cols[k]
+        return rec
+
+    @property
+    def dtype(self):
+        return np.dtype([(k,self.columns[k].dtype) for k in self.names])
+
+    @property
+    def shape(self):
+        return (self.rows,)
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self,key):
+        return key in self.columns
+
+    def __getitem__(self,key):
+        if isinstance(key,basestring):
+            col=self.columns[key]
+            if isinstance(col,Categorical):
+                col.owner=(weakref.ref(self),key)   # so that writing a new text can widen its codes
+            return col
+        if isinstance(key,list) and len(key)>0 and isinstance(key[0],basestring):
+            return self.to_records(key)
+        if isinstance(key,(int,np.integer)):
+            # one row: only this row of each column is read
+            row=key+self.rows if key<0 else key
+            if not 0<=row<self.rows:
+                raise IndexError("row %d out of range (%d rows)"%(key,self.rows))
+            return self.to_records(rows=slice(row,row+1))[0]
+        return self.take(key)
+
+    def __setitem__(self,key,value):
+        col=self.columns[key]
+        try:
+            col[...]=value
+        except OverflowError:
+            # more texts than the codes of a categorical column can hold: wider codes
+            Column.__setitem__(self.widen(key),Ellipsis,col.codes_of(value))
+
+    def widen(self,key):
+        # categorical column key with codes wide enough for its dictionary. it keeps its write log
+        col=self.columns[key]
+        self.columns[key]=self.new_column(categorical_like(col,np.asarray(col)))
+        self.columns[key].log=col.log
+        return self.columns[key]
+
+    def swap(self,key,data):
+        # replaces column key by a copy of data (same type) at once, instead of writing it in place: the column
+        # keeps its write log, readers get either the old array or the new one
+        col=self.columns[key]
+        if isinstance(col,Categorical):
+            new=self.new_column(categorical_like(col,col.codes_of(data)))
+        else:
+            new=self.new_column(np.asarray(data,dtype=col.dtype))
+        new.log=col.log
+        new.touch()
+        self.columns[key]=new
+
+    def __repr__(self):
+        return repr(self.to_records())
+
+    def append(self,key,typ,data=None):
+        if isinstance(typ,basestring) and typ=='category':
+            # text stored as codes (see Categorical). categorical data keeps its dictionary
+            if isinstance(data,Categorical):
+                col=categorical_like(data,np.asarray(data))
+            else:
+                col=Categorical.from_values(['']*self.rows if data is None else data)
+            self.columns[key]=self.new_column(col)
+            if not key in self.names:
+                self.names.append(key)
+            return
+        dt=np.dtype(typ)
+        if data is not None:
+            col=np.ascontiguousarray(data,dtype=dt)
+        elif dt.itemsize==0:
+            # flexible types without size ('str','a'): same width as a float converted to string
+            col=np.zeros(self.rows).astype(dt)
+        else:
+            col=np.zeros(self.rows,dtype=dt)
+        self.columns[key]=self.new_column(col)
+        if not key in self.names:
+            self.names.append(key)
+
+    def new_column(self,data):
+        # copies data to a Column, in a memmapped file of cachedir if there is one
+        if isinstance(data,Categorical):
+            return Categorical(self.new_column(np.asarray(data)),data.categories)
+        data=np.asarray(data)
+        if self.cachedir==None or data.size==0 or data.dtype.hasobject:
+            return Column(np.ascontiguousarray(data))
+        fd,path=tempfile.mkstemp(suffix='.col',dir=self.cachedir)
+        os.close(fd)
+        mm=np.memmap(path,dtype=data.dtype,mode='w+',shape=data.shape)
+        mm[...]=data
+        try:
+            os.remove(path)                         # the mapping keeps the file alive until the column is freed
+        except OSError:
+            self.files.append(path)
+        return Column(mm)
+
+    def to_cachedir(self,cachedir):
+        # moves all columns to memmapped files in cachedir (or back to RAM if cachedir is None)
+        self.cachedir=cachedir
+        for k in self.names:
+            self.columns[k]=self.new_column(self.columns[k])
+
+    def cleanup(self):
+        # removes the column files left over by new_column(). the columns must not be used afterwards
+        self.columns={}
+        self.buffers={}
+        self.names=[]
+        self.rows=0
+        for path in self.files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.files=[]
+
+    def drop(self,key):
+        del self.columns[key]
+        self.names.remove(key)
+
+    def rename(self,oldkey,newkey):
+        self.names[self.names.index(oldkey)]=newkey
+        self.columns[newkey]=self.columns.pop(oldkey)
+
+    def take(self,rows):
+        store=ColumnStore(0,self.cachedir)
+        store.files=self.files                      # shared, so that the owner of the store removes them
+        for k in self.names:
+            store.columns[k]=store.new_column(categorical_like(self.columns[k],np.asarray(self.columns[k])[rows]))
+            store.names.append(k)
+        store.rows=store.columns[self.names[0]].shape[0] if len(self.names) else 0
+        return store
+
+    def delete(self,rows):
+        for k in self.names:
+            self.columns[k]=self.new_column(categorical_like(self.columns[k],np.delete(np.asarray(self.columns[k]),rows)))
+        self.rows=self.columns[self.names[0]].shape[0] if len(self.names) else 0
+
+    def compress(self,keep):
+        # keeps rows where boolean mask keep is True, one pass per column
+        for k in self.names:
+            self.columns[k]=self.new_column(categorical_like(self.columns[k],np.asarray(self.columns[k])[keep]))
+        self.rows=int(np.count_nonzero(keep))
+
+    def spare(self,key,rows):
+        # growth buffer of column key if it still holds the column and has room for rows
+        buf=self.buffers.get(key)
+        col=self.columns[key]
+        if buf is None or len(buf)<rows or buf.dtype!=col.dtype or len(col)==0 \
+                or buf.__array_interface__['data'][0]!=col.__array_interface__['data'][0]:
+            return None
+        return buf
+
+    def append_rows(self,values):
+        # columns grow by chunks (half their size, at least 1024 rows), so that appending a few rows at a time
+        # (live tracking) copies each row a bounded number of times. new rows are recorded in the column logs,
+        # so derived columns are only updated for them
+        old=self.rows
+        rows=old+len(np.atleast_1d(values[self.names[0]])) if len(self.names) else old
+        for k in self.names:
+            col=self.columns[k]
+            data=categorical_like(col,col.codes_of(values[k])) if isinstance(col,Categorical) else np.asarray(values[k],dtype=col.dtype)
+            buf=self.spare(k,rows)
+            if buf is None or buf.dtype!=data.dtype:     # full, replaced, or codes of a categorical got wider
+                buf=np.asarray(self.new_column(np.zeros(max(rows+rows//2,1024),dtype=data.dtype)))
+                buf[:old]=np.asarray(col)
+                self.buffers[k]=buf
+            buf[old:rows]=np.asarray(data)
+            self.columns[k]=Column(buf[:rows]) if not isinstance(col,Categorical) else Categorical(buf[:rows],col.categories)
+            self.columns[k].log=col.log
+            self.columns[k].touch(old,rows)
+        self.rows=rows
+
+def douglas_peucker_rank(x,y,starts=[0]):
+    # Douglas-Peucker importance of each point of the lines starting at rows starts: the largest tolerance
+    # (unit of x,y) at which the point is kept, inf for the ends of lines. keeping rank>tolerance gives the
+    # Douglas-Peucker simplification at that tolerance. all the ranges of one level are split at once
+    n=len(x)
+    rank=np.zeros(n)
+    if n==0:
+        return rank
+    lo=np.asarray(starts,dtype='int')
+    hi=np.append(lo[1:],n)-1
+    rank[lo]=np.inf
+    rank[hi]=np.inf
+    cap=np.full(len(lo),np.inf)                     # a point is never more important than its parent
+    while True:
+        keep=hi-lo>1
+        lo,hi,cap=lo[keep],hi[keep],cap[keep]
+        if len(lo)==0:
+            return rank
+        # inner points of all ranges, and their distance to the chord of their range
+        length=hi-lo-1
+        offsets=np.cumsum(length)-length
+        rid=np.repeat(np.arange(len(lo)),length)
+        a,b=lo[rid],hi[rid]
+        p=np.arange(len(rid))-offsets[rid]+a+1
+        dx,dy=x[b]-x[a],y[b]-y[a]
+        px,py=x[p]-x[a],y[p]-y[a]
+        l2=dx*dx+dy*dy
+        t=np.clip((px*dx+py*dy)/np.where(l2>0,l2,1.0),0.0,1.0)
+        d=np.hypot(px-t*dx,py-t*dy)
+        d[~np.isfinite(d)]=0.0
+        # farthest point of each range (first one if several)
+        dmax=np.maximum.reduceat(d,offsets)
+        at=np.flatnonzero(d==dmax[rid])
+        at=at[np.concatenate(([True],rid[at][1:]!=rid[at][:-1]))]
+        split=p[at]
+        r=np.minimum(dmax,cap)
+        rank[split]=r
+        lo,hi,cap=np.concatenate((lo,split)),np.concatenate((split,hi)),np.concatenate((r,r))
+
+class SpikeCleaner(object):
+    # finds the points of a track which break limits of speed (m/s), acceleration (m/s2) and turn rate (deg/s).
+    # all points are checked at once, then only the flagged ones (candidates) are looked at in turn: removing
+    # a spike (a run of 1 to maxrun points) is worth it when the checks around it are better without it.
+    # runs which most improve their neighbourhood per removed point go first, and the neighbours of a removed
+    # run are checked again with their new neighbours (points are linked through prev and next)
+    maxrun=3
+
+    def __init__(self,lat,lon,t,starts,max_speed=None,max_accel=None,max_turn_rate=None):
+        # lat,lon in degrees and t in seconds of the points to check; starts: first points of segments
+        self.lat,self.lon,self.t=lat,lon,t
+        self.limits=(max_speed,max_accel,max_turn_rate)
+        n=len(t)
+        self.linked=np.ones(n,dtype='bool')        # linked[k]: k follows k-1 in its segment
+        self.linked[np.asarray(starts,dtype='int')]=False
+        self.prevs,self.nexts={},{}
+        self.edges={}
+        self.dropped={}
+
+    def candidates(self):
+        # points concerned by a check which fails: the two ends of a fast edge, and the inner point of
+        # two edges with too much acceleration or turn rate (or the end of the segment next to it)
+        max_speed,max_accel,max_turn_rate=self.limits
+        lat,lon,t=self.lat,self.lon,self.t
+        n=len(t)
+        flag=np.zeros(n,dtype='bool')
+        if n<2:
+            return np.flatnonzero(flag)
+        # short edges: equirectangular distance and course are close enough to flag points
+        link=self.linked[1:]
+        dy=np.diff(lat)*(np.pi/180.0*6371000)
+        dx=np.diff(lon)*(np.pi/180.0*6371000)*np.cos(np.radians(lat[1:]))
+        d=np.hypot(dx,dy)
+        dt=np.diff(t)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            v=np.where(dt>0,d/dt,np.where(d>0,np.inf,0.0))
+            bad=link&(v>max_speed) if max_speed!=None else np.zeros(n-1,dtype='bool')
+            inner=link[:-1]&link[1:]
+            mid=(dt[:-1]+dt[1:])/2.0
+            point=np.zeros(n-2,dtype='bool')
+            if max_accel!=None:
+                point|=inner&(np.abs(v[1:]-v[:-1])/mid>max_accel)
+            if max_turn_rate!=None:
+                c=np.degrees(np.arctan2(dx,dy))
+                point|=inner&(np.abs(np.mod(c[1:]-c[:-1]+180.0,360.0)-180.0)/mid>max_turn_rate)
+        flag[:-1]|=bad
+        flag[1:]|=bad
+        flag[1:-1]|=point
+        first,last=~self.linked,np.append(~self.linked[1:],True)
+        flag[:-1]|=first[:-1]&flag[1:]
+        flag[1:]|=last[1:]&flag[:-1]
+        return np.flatnonzero(flag)
+
+    def prev(self,k):
+        if k in self.prevs:
+            return self.prevs[k]
+        return k-1 if self.linked[k] else -1
+
+    def next(self,k):
+        if k in self.nexts:
+            return self.nexts[k]
+        return k+1 if k+1<len(self.t) and self.linked[k+1] else -1
+
+    def edge(self,a,b):
+        # (speed,duration,course) from point a to point b, kept as edges are checked several times
+        try:
+            return self.edges[(a,b)]
+        except KeyError:
+            pass
+        la1,la2=math.radians(self.lat[a]),math.radians(self.lat[b])
+        dlon=math.radians(self.lon[b]-self.lon[a])
+        h=math.sin((la2-la1)/2)**2+math.cos(la1)*math.cos(la2)*math.sin(dlon/2)**2
+        d=6371000*2.0*math.atan2(math.sqrt(h),math.sqrt(max(1.0-h,0.0)))
+        dt=float(self.t[b]-self.t[a])
+        c=math.degrees(math.atan2(math.sin(dlon)*math.cos(la2),math.cos(la1)*math.sin(la2)-math.sin(la1)*math.cos(la2)*math.cos(dlon)))
+        e=self.edges[(a,b)]=(d/dt if dt>0 else (float('inf') if d>0 else 0.0),dt,c)
+        return e
+
+    def severity(self,chain):
+        # (speed,accel,turn) excess of the path through points chain: speed of its edges, acceleration and
+        # turn rate at its inner points, as ratios of the limits (capped, so that a zero duration counts but
+        # does not hide everything else)
+        max_speed,max_accel,max_turn_rate=[limit if limit!=None else np.inf for limit in self.limits]
+        speed=accel=turn=0.0
+        last=None
+        for i in range(len(chain)-1):
+            v,dt,c=e=self.edge(chain[i],chain[i+1])
+            if v>max_speed:
+                speed+=min(v/max_speed-1.0,100.0)
+            if last!=None and last[1]+dt>0:
+                mid=(last[1]+dt)/2.0
+                a=abs(v-last[0])/mid
+                if a>max_accel:
+                    accel+=min(a/max_accel-1.0,100.0)
+                r=abs((c-last[2]+180.0)%360.0-180.0)/mid
+                if r>max_turn_rate:
+                    turn+=min(r/max_turn_rate-1.0,100.0)
+            last=e
+        return (speed,accel,turn)
+
+    def best_run(self,k):
+        # (gain per removed point,run,reason) of the spike starting at point k: the shortest run after which
+        # the checks around it all pass, else k alone. gain is 0 if removing it does not improve the checks
+        left,x=[],self.prev(k)
+        while x>=0 and len(left)<2:
+            left.insert(0,x)
+            x=self.prev(x)
+        run=[k]
+        single=(0.0,run,None)
+        while True:
+            right,x=[],self.next(run[-1])
+            while x>=0 and len(right)<2:
+                right.append(x)
+                x=self.next(x)
+            if len(left)+len(right)>=2:         # some points must remain around it to judge
+                before=self.severity(left+run+right)
+                if len(run)==1 and sum(before)==0:
+                    return single
+                after=self.severity(left+right)
+                gain=(sum(before)-sum(after))/len(run)
+                if gain>0 and (sum(after)==0 or len(run)==1):
+                    best=(gain,run,('speed','accel','turn')[int(np.argmax([b-a for b,a in zip(before,after)]))])
+                    if sum(after)==0:
+                        return best
+                    single=best
+            if len(run)>=self.maxrun or len(right)==0:
+                return single
+            run=run+[right[0]]
+
+    def run(self,candidates):
+        # removed points among candidates (and their neighbours), as {point:reason}
+        heap=[]
+        for k in candidates:
+            gain=self.best_run(k)[0]
+            if gain>0:
+                heap.append((-gain,k))
+        heapq.heapify(heap)
+        while heap:
+            gain,k=heapq.heappop(heap)
+            if k in self.dropped:
+                continue
+            best=self.best_run(k)
+            if best[0]<=0:
+                continue
+            if best[0]!=-gain:                  # neighbourhood changed since k was queued
+                heapq.heappush(heap,(-best[0],k))
+                continue
+            gain,run,reason=best
+            for x in run:
+                self.dropped[x]=reason
+            a,c=self.prev(run[0]),self.next(run[-1])
+            if a>=0:
+                self.nexts[a]=c
+            if c>=0:
+                self.prevs[c]=a
+            # checks of the two points on each side changed
+            around,x=[],a
+            while x>=0 and len(around)<2:
+                around.append(x)
+                x=self.prev(x)
+            x=c
+            while x>=0 and len(around)<4:
+                around.append(x)
+                x=self.next(x)
+            for x in around:
+                g=self.best_run(x)[0]
+                if g>0:
+                    heapq.heappush(heap,(-g,x))
+        return self.dropped
+
+# points appended to a track (live tracking) are added to its spatial index and to its simplification
+# without building them again, until there are tail_rows of them (a quarter of the track for the index)
+tail_rows=1024
+
+def grown(buf,n):
+    # buf, or a copy of it with room for n rows (half its size more, at least 1024 rows)
+    if len(buf)>=n:
+        return buf
+    new=np.empty(max(n+n//2,1024),dtype=buf.dtype)
+    new[:len(buf)]=buf
+    return new
+
+class SpatialIndex(object):
+    # grid over points projected in meters (equirectangular around the mean latitude). point numbers are
+    # sorted by cell, with the first position of each non empty cell, so that a query only reads the
+    # cells around it. cells hold about 16 points (smaller cells where the track goes several times).
+    # rows added after the grid was built (see extend()) are kept apart in tail, and always looked at
+    def __init__(self,lat,lon,cell=None):
+        lat=np.asarray(lat,dtype='float64')
+        lon=np.asarray(lon,dtype='float64')
+        valid=np.isfinite(lat)&np.isfinite(lon)
+        self.lat0=lat[valid].mean() if valid.any() else 0.0
+        self.x,self.y=self.project(lat,lon)
+        self.xbuf,self.ybuf=self.x,self.y
+        self.points=np.flatnonzero(valid)
+        self.indexed=len(lat)
+        self.tail=np.zeros(0,dtype='int')
+        x,y=self.x[valid],self.y[valid]
+        if cell==None:
+            steps=np.hypot(np.diff(x),np.diff(y))
+            steps=steps[steps>0]
+            extent=max(np.ptp(x),np.ptp(y),1.0) if len(x) else 1.0
+            cell=max(16*np.median(steps) if len(steps) else 1.0,extent/4096)
+            self.build(x,y,cell)
+            if len(x)>32*len(self.cells):
+                self.build(x,y,max(cell*np.sqrt(16.0*len(self.cells)/len(x)),extent/4096))
+        else:
+            self.build(x,y,cell)
+
+    def build(self,x,y,cell):
+        self.cell=cell
+        self.x0,self.y0=(x.min(),y.min()) if len(x) else (0.0,0.0)
+        cx,cy=self.cellof(x,y)
+        self.nx,self.ny=(cx.max()+1,cy.max()+1) if len(x) else (0,0)
+        ids=cy*self.nx+cx
+        order=np.argsort(ids,kind='mergesort')
+        self.sorted=self.points[order]
+        self.cells,self.first=np.unique(ids[order],return_index=True)
+        self.last=np.append(self.first[1:],len(self.sorted))
+        # centers of non empty cells
+        self.cx=self.x0+(self.cells%max(self.nx,1)+0.5)*cell
+        self.cy=self.y0+(self.cells//max(self.nx,1)+0.5)*cell
+
+    def extend(self,lat,lon,lo):
+        # rows lo.. of lat and lon (lo>=indexed) were written or appended: they are projected again, and
+        # go to the tail
+        m=len(lat)
+        self.xbuf,self.ybuf=grown(self.xbuf,m),grown(self.ybuf,m)
+        self.xbuf[lo:m],self.ybuf[lo:m]=self.project(lat[lo:m],lon[lo:m])
+        self.x,self.y=self.xbuf[:m],self.ybuf[:m]
+        self.tail=self.indexed+np.flatnonzero(np.isfinite(self.x[self.indexed:])&np.isfinite(self.y[self.indexed:]))
+
+    def project(self,lat,lon):
+        r=6371000*np.pi/180
+        return (np.asarray(lon,dtype='float64')*r*np.cos(self.lat0*np.pi/180),np.asarray(lat,dtype='float64')*r)
+
+    def cellof(self,x,y):
+        return (np.floor((x-self.x0)/self.cell).astype('int'),np.floor((y-self.y0)/self.cell).astype('int'))
+
+    def gather(self,cx,cy):
+        # points of cells (cx,cy), as one array
+        inside=(cx>=0)&(cx<self.nx)&(cy>=0)&(cy<self.ny)
+        ids=cy[inside]*self.nx+cx[inside]
+        k=np.minimum(np.searchsorted(self.cells,ids),max(len(self.cells)-1,0))
+        k=k[self.cells[k]==ids] if len(self.cells) else k[:0]
+        lengths=self.last[k]-self.first[k]
+        pos=np.arange(lengths.sum())-np.repeat(np.cumsum(lengths)-lengths-self.first[k],lengths)
+        return self.sorted[pos]
+
+    def distance(self,points,x,y):
+        return np.hypot(self.x[points]-x,self.y[points]-y)
+
+    def nearest(self,lat,lon,k=1,mask=None):
+        # indices of the k points nearest to (lat,lon), nearest first. mask: points which may be returned
+        x,y=self.project(lat,lon)
+        found=self.nearest_grid(x,y,k,mask)
+        if len(self.tail)>0:
+            found=np.concatenate((found,self.tail if mask is None else self.tail[mask[self.tail]]))
+            found=found[np.argsort(self.distance(found,x,y),kind='mergesort')[:k]]
+        return found
+
+    def nearest_grid(self,x,y,k,mask):
+        qx,qy=self.cellof(x,y)
+        # rings of cells around the query (near the track)
+        r=0
+        found=np.zeros(0,dtype='int')
+        while True:
+            if r>4:
+                return self.nearest_far(x,y,k,mask)
+            if r==0:
+                cx,cy=np.array([qx]),np.array([qy])
+            else:
+                side=np.arange(-r,r+1)
+                inner=side[1:-1]
+                cx=qx+np.concatenate((side,side,np.full(len(inner),-r),np.full(len(inner),r)))
+                cy=qy+np.concatenate((np.full(len(side),-r),np.full(len(side),r),inner,inner))
+            points=self.gather(cx,cy)
+            if mask is not None:
+                points=points[mask[points]]
+            found=np.concatenate((found,points))
+            if len(found)>=k:
+                # points of next rings are at least r cells away
+                d=np.sort(self.distance(found,x,y))[k-1]
+                if d<=r*self.cell:
+                    break
+            r+=1
+        return found[np.argsort(self.distance(found,x,y),kind='mergesort')[:k]]
+
+    def nearest_far(self,x,y,k,mask):
+        # nearest points for queries far from the track: cells are taken by their distance to (x,y),
+        # until the k-th point found is closer than the remaining cells
+        half=self.cell/2
+        bound=np.hypot(np.maximum(np.abs(self.cx-x)-half,0),np.maximum(np.abs(self.cy-y)-half,0))
+        if len(bound)==0:
+            return self.points[:0]
+        limit=bound.min()+self.cell*np.sqrt(2)    # a point of the nearest cell is closer than that
+        while True:
+            cells=self.cells[bound<=limit]
+            points=self.gather(cells%self.nx,cells//self.nx)
+            if mask is not None:
+                points=points[mask[points]]
+            d=self.distance(points,x,y)
+            if len(points)>=k and np.partition(d,k-1)[k-1]<=limit:
+                return points[np.argsort(d,kind='mergesort')[:k]]
+            if limit>bound.max():
+                return points[np.argsort(d,kind='mergesort')[:k]]
+            limit=max(2*limit,np.partition(d,k-1)[k-1] if len(points)>=k else 0)
+
+    def within(self,lat,lon,radius,mask=None):
+        # indices of points closer than radius (m) from (lat,lon)
+        x,y=self.project(lat,lon)
+        points=self.cellrange(x-radius,y-radius,x+radius,y+radius,mask)
+        return points[self.distance(points,x,y)<=radius]
+
+    def bbox(self,lat1,lon1,lat2,lon2,margin=0.0,mask=None):
+        # indices of points in the box (lat1,lon1)-(lat2,lon2), extended by margin (m) on each side
+        x1,y1=self.project(min(lat1,lat2),min(lon1,lon2))
+        x2,y2=self.project(max(lat1,lat2),max(lon1,lon2))
+        points=self.cellrange(x1-margin,y1-margin,x2+margin,y2+margin,mask)
+        keep=(self.x[points]>=x1-margin)&(self.x[points]<=x2+margin)&(self.y[points]>=y1-margin)&(self.y[points]<=y2+margin)
+        return points[keep]
+
+    def cellrange(self,x1,y1,x2,y2,mask=None):
+        # points of cells overlapping the box, in increasing order
+        (cx1,cy1),(cx2,cy2)=self.cellof(x1,y1),self.cellof(x2,y2)
+        cx1,cy1=max(cx1,0),max(cy1,0)
+        cx2,cy2=min(cx2,self.nx-1),min(cy2,self.ny-1)
+        if cx2<cx1 or cy2<cy1:
+            points=self.points[:0]
+        elif (cx2-cx1+1)*(cy2-cy1+1)>len(self.cells):
+            points=self.sorted                      # large box: all points
+        else:
+            cx,cy=np.meshgrid(np.arange(cx1,cx2+1),np.arange(cy1,cy2+1))
+            points=self.gather(cx.ravel(),cy.ravel())
+        points=np.concatenate((points,self.tail))
+        if mask is not None:
+            points=points[mask[points]]
+        return np.sort(points)
+
+# filter expressions (see GpxObj.where()): python syntax over column names, evaluated by chunks of
+# where_chunk rows (a few hundred kB per column, which stays in cache) so that no full size temporary
+# is built. name_unit is column name in unit (speed_kts, speed_kmh, deltaxy_km), '/' being dropped from unit
+where_chunk=1<<16
+where_functions={'abs':np.abs,'sqrt':np.sqrt,'exp':np.exp,'log':np.log,'sin':np.sin,'cos':np.cos,
+                 'tan':np.tan,'arctan2':np.arctan2,'where':np.where}
+where_operators={ast.And:'&',ast.Or:'|',ast.Add:'+',ast.Sub:'-',ast.Mult:'*',ast.Div:'/',ast.Pow:'**',
+                 ast.Mod:'%',ast.Eq:'==',ast.NotEq:'!=',ast.Lt:'<',ast.LtE:'<=',ast.Gt:'>',ast.GtE:'>=',
+                 ast.Not:'~',ast.Invert:'~',ast.USub:'-',ast.UAdd:'+'}
+
+def compile_where(expr,columns):
+    # translates expr to an array expression (numpy or numexpr syntax) over variables c0,c1...
+    # returns the expression and the (column,scale) of each variable. columns: {name:column}.
+    # texts compared (== or !=) to a categorical column are replaced by their code
+    names={}
+    aliases=dict((u.replace('/',''),s) for u,(d,s) in units.items())
+    def column(name):
+        if name in columns:
+            return name,1.0
+        col,sep,unit=name.rpartition('_')
+        if sep and col in columns and unit in aliases:
+            return col,aliases[unit]
+        raise KeyError("unknown column or unit in filter expression: "+name)
+    def source(node):
+        if isinstance(node,ast.BoolOp):
+            return '('+(' '+where_operators[type(node.op)]+' ').join(source(v) for v in node.values)+')'
+        if isinstance(node,ast.BinOp) and type(node.op) in where_operators:
+            return '('+source(node.left)+where_operators[type(node.op)]+source(node.right)+')'
+        if isinstance(node,ast.UnaryOp) and type(node.op) in where_operators:
+            return '('+where_operators[type(node.op)]+source(node.operand)+')'
+        if isinstance(node,ast.Compare):
+            # chained comparisons (5<speed_kts<10) are and'ed
+            operands=[node.left]+node.comparators
+            terms=['('+operand(a,op,b)+where_operators[type(op)]+operand(b,op,a)+')' for a,op,b in zip(operands,node.ops,operands[1:])]
+            return terms[0] if len(terms)==1 else '('+' & '.join(terms)+')'
+        if isinstance(node,ast.Num):
+            return repr(node.n)
+        if isinstance(node,ast.Name):
+            if node.id in ('True','False'):
+                return node.id
+            col,scale=column(node.id)
+            var=names.setdefault((col,scale),'c%d'%len(names))
+            return var if scale==1.0 else '('+var+'*'+repr(scale)+')'
+        if isinstance(node,ast.Call) and isinstance(node.func,ast.Name) and node.func.id in where_functions \
+                and not node.keywords:
+            return node.func.id+'('+','.join(source(a) for a in node.args)+')'
+        raise ValueError("unsupported filter expression: "+expr)
+    def operand(node,op,other):
+        if not isinstance(node,ast.Str):
+            return source(node)
+        if isinstance(other,ast.Name) and type(op) in (ast.Eq,ast.NotEq):
+            col=columns.get(column(other.id)[0])
+            if isinstance(col,Categorical):
+                return repr(int(col.categories.find(node.s)))
+        raise ValueError("texts can only be compared (== or !=) to text columns: "+expr)
+    src=source(ast.parse(expr.strip(),mode='eval').body)
+    return src,dict((var,key) for key,var in names.items())
+
+def as_ns(t):
+    # datetime64, iso8601 text or datetime (single value or array) to int64 nanoseconds since epoch
+    a=np.asarray(t)
+    if a.dtype.kind in 'SU':
+        a=parse_iso8601(np.atleast_1d(a)).reshape(a.shape)
+    return a.astype('M8[ns]').view('int64')
+
+class TimeIndex(object):
+    # rows ordered by time (NaT excluded), for O(log n) lookups with searchsorted. when times are
+    # already increasing (the usual case) the column is used as is, and rows are not stored
+    def __init__(self,time):
+        t=np.asarray(time,dtype='M8[ns]').view('int64')
+        valid=t!=np.iinfo('int64').min
+        if valid.all() and np.all(t[1:]>=t[:-1]):
+            self.order=None
+            self.times=t
+        else:
+            rows=np.flatnonzero(valid)
+            self.order=rows[np.argsort(t[rows],kind='mergesort')]
+            self.times=t[self.order]
+
+    def rows(self,k):
+        return k if self.order is None else self.order[k]
+
+    def index_at(self,t):
+        # row of the last point at or before t, -1 if t is before the first point
+        k=np.searchsorted(self.times,as_ns(t),'right')-1
+        return np.where(k>=0,self.rows(np.maximum(k,0)),-1) if len(self.times) else np.full(np.shape(k),-1)
+
+    def range(self,t0,t1):
+        # rows of points between t0 and t1 (included), in increasing order
+        lo=np.searchsorted(self.times,as_ns(t0),'left')
+        hi=np.searchsorted(self.times,as_ns(t1),'right')
+        return np.sort(self.rows(np.arange(lo,max(lo,hi))))
+
+    def nearest(self,t):
+        # row of the point closest in time to t, -1 if there are no points
+        q=as_ns(t)
+        if len(self.times)==0:
+            return np.full(np.shape(q),-1)
+        k=np.clip(np.searchsorted(self.times,q),1,max(len(self.times)-1,1))
+        before=np.abs(q-self.times[k-1])<=np.abs(self.times[np.minimum(k,len(self.times)-1)]-q)
+        return self.rows(np.where(before,k-1,np.minimum(k,len(self.times)-1)))
+
+class Rolling(object):
+    # time windows over a column (see GpxObj.rolling()): row i aggregates the points of its segment
+    # less than seconds before it, itself included (or within seconds/2 on each side if center is True).
+    # sums come from prefix sums, max/min from maxima over 2**k points (sparse table), so every
+    # aggregation is a few vectorized passes whatever the sampling rate. nan values are ignored
+    def __init__(self,values,time,seconds,starts=[0],center=False):
+        self.values=np.asarray(values,dtype='float64')
+        t=np.asarray(time,dtype='M8[ns]').view('int64')
+        n=len(t)
+        w=int(round(seconds*1e9))
+        rows=np.arange(n)
+        starts=np.asarray(starts,dtype='int')
+        seg=np.searchsorted(starts,rows,'right')-1
+        if center:
+            lo=np.searchsorted(t,t-w//2,'left')
+            hi=np.searchsorted(t,t+w//2,'right')
+        else:
+            lo=np.searchsorted(t,t-w,'right')
+            hi=rows+1
+        self.lo=np.maximum(lo,starts[seg]) if n else lo
+        self.hi=np.minimum(hi,np.append(starts[1:],n)[seg]) if n else hi
+        self.valid=np.isfinite(self.values)
+
+    def window_sum(self,values):
+        s=np.concatenate(([0.0],np.cumsum(values)))
+        return s[self.hi]-s[self.lo]
+
+    def count(self):
+        return self.window_sum(self.valid)
+
+    def sum(self):
+        return self.window_sum(np.where(self.valid,self.values,0.0))
+
+    def mean(self):
+        with np.errstate(invalid='ignore',divide='ignore'):
+            return self.sum()/self.count()
+
+    def std(self):
+        # values are centered first, so that sums of squares do not lose precision. a window of one
+        # value has no spread (its difference of prefix sums is not exactly 0)
+        centered=np.where(self.valid,self.values-np.mean(self.values[self.valid]) if self.valid.any() else 0.0,0.0)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            count=self.count()
+            mean=self.window_sum(centered)/count
+            std=np.sqrt(np.maximum(self.window_sum(centered*centered)/count-mean*mean,0.0))
+        std[count==1]=0.0
+        return std
+
+    def extremum(self,ufunc,fill):
+        level=np.where(self.valid,self.values,fill)
+        length=self.hi-self.lo
+        k=np.zeros(len(length),dtype='int')
+        k[length>0]=np.floor(np.log2(length[length>0])).astype('int')
+        result=np.full(len(length),np.nan)
+        for j in range(k.max()+1 if len(k) else 0):
+            # level[i] is the extremum of values[i:i+2**j]
+            rows=np.flatnonzero((k==j)&(length>0))
+            result[rows]=ufunc(level[self.lo[rows]],level[self.hi[rows]-(1<<j)])
+            level=ufunc(level[:-(1<<j)],level[(1<<j):])
+        result[self.count()==0]=np.nan
+        return result
+
+    def max(self):
+        return self.extremum(np.maximum,-np.inf)
+
+    def min(self):
+        return self.extremum(np.minimum,np.inf)
+
+def bucket_ids(time,period):
+    # time bucket (seconds since epoch//period) of each point, points without time are in the bucket of
+    # the previous one. raises ValueError if points are not in time order
+    t=np.asarray(time,dtype='M8[ns]').view('int64')
+    nat=np.iinfo('int64').min
+    valid=t!=nat
+    if np.any(np.diff(t[valid])<0):
+        raise ValueError("points are not in time order")
+    ids=np.maximum.accumulate(np.where(valid,t//np.int64(period*10**9),nat)) if len(t) else np.zeros(0,dtype='int64')
+    ids[ids==nat]=ids[valid][0] if valid.any() else 0
+    return ids
+
+def reduce_buckets(values,ok,starts,end):
+    # min, max (nan if no value), sum and count of the enabled, finite values of buckets of rows starts[k]..starts[k+1]-1
+    # (the last one ends at row end)
+    if len(starts)==0:
+        return {'min':np.zeros(0),'max':np.zeros(0),'sum':np.zeros(0),'count':np.zeros(0,dtype='int64')}
+    a=starts[0]
+    v=np.asarray(values[a:end],dtype='float64')
+    valid=np.asarray(ok[a:end],dtype='bool')&np.isfinite(v)
+    rel=np.asarray(starts)-a
+    return {'min':np.fmin.reduceat(np.where(valid,v,np.nan),rel),
+            'max':np.fmax.reduceat(np.where(valid,v,np.nan),rel),
+            'sum':np.add.reduceat(np.where(valid,v,0.0),rel),
+            'count':np.add.reduceat(valid.astype('int64'),rel)}
+
+class Rollup(object):
+    # min, max, sum and count of the enabled, finite values of a column per time bucket of each period (s).
+    # buckets are aligned on the epoch so that they nest: the first level is reduced from the points, the
+    # others from the first level. only buckets holding points are kept. levels[p] is a dict of arrays:
+    # id (seconds since epoch//p), start (first row), min, max, sum, count (see reduce_buckets())
+    def __init__(self,values=None,ok=None,time=None,periods=rollup_periods):
+        self.periods=list(periods)
+        self.levels={}
+        self.rows=0
+        if values is not None:
+            self.update(values,ok,time)
+
+    @classmethod
+    def like(cls,other,values,ok):
+        # rollup of another column of the same points, with the buckets of rollup other
+        rollup=cls(periods=other.periods)
+        first=other.levels[other.periods[0]]
+        level=reduce_buckets(values,ok,first['start'],other.rows)
+        level['id'],level['start']=first['id'],first['start']
+        rollup.levels[rollup.periods[0]]=level
+        rollup.rows=other.rows
+        rollup.coarsen()
+        return rollup
+
+    def update(self,values,ok,time,lo=0,hi=None,retime=True):
+        # rows lo..hi-1 were written. if their times were (retime), first level buckets are built again from
+        # the one holding row lo to the end, otherwise only the buckets holding rows lo..hi-1 are
+        n=len(values)
+        hi=n if hi==None else hi
+        p=self.periods[0]
+        level=self.levels.get(p)
+        if level==None or (self.rows!=n and not retime):
+            lo,retime=0,True
+        if retime:
+            k0=max(np.searchsorted(level['start'],lo,'right')-1,0) if lo>0 else 0
+            a=level['start'][k0] if k0>0 else 0
+            ids=bucket_ids(time[a:],p)
+            rel=np.flatnonzero(ids[1:]!=ids[:-1])+1
+            starts=a+np.concatenate(([0],rel)) if len(ids) else np.zeros(0,dtype='int')
+            new=reduce_buckets(values,ok,starts,n)
+            new['id'],new['start']=ids[starts-a],starts
+            if k0>0:
+                new=dict((k,np.concatenate((level[k][:k0],new[k]))) for k in new)
+            self.levels[p]=new
+        else:
+            start=level['start']
+            k0=np.searchsorted(start,lo,'right')-1
+            k1=np.searchsorted(start,hi-1,'right')
+            new=reduce_buckets(values,ok,start[k0:k1],start[k1] if k1<len(start) else n)
+            for k in new:
+                level[k][k0:k1]=new[k]
+        self.rows=n
+        self.coarsen()
+
+    def coarsen(self):
+        # levels of the larger periods from the first one (a few thousand buckets at most)
+        p=self.periods[0]
+        first=self.levels[p]
+        for q in self.periods[1:]:
+            ids=first['id']*p//q
+            k=np.concatenate(([0],np.flatnonzero(ids[1:]!=ids[:-1])+1)) if len(ids) else np.zeros(0,dtype='int')
+            if len(k)==0:
+                self.levels[q]=dict((key,first[key][:0]) for key in first)
+                continue
+            self.levels[q]={'id':ids[k],'start':first['start'][k],
+                            'min':np.fmin.reduceat(first['min'],k),'max':np.fmax.reduceat(first['max'],k),
+                            'sum':np.add.reduceat(first['sum'],k),'count':np.add.reduceat(first['count'],k)}
+
+    def time(self,period):
+        # start time of the buckets of period
+        return (self.levels[period]['id']*np.int64(period*10**9)).view('M8[ns]')
+
+    def summary(self,values,ok,lo,hi,periods=None):
+        # (min,max,sum,count) of rows lo..hi-1, from the whole buckets of the largest period which fit, then
+        # from the smaller periods and the points at both ends
+        periods=sorted(self.periods,reverse=True) if periods==None else periods
+        if hi<=lo:
+            return (np.nan,np.nan,0.0,0)
+        if len(periods)==0:
+            s=reduce_buckets(values,ok,np.array([lo]),hi)
+            return (s['min'][0],s['max'][0],s['sum'][0],s['count'][0])
+        level=self.levels[periods[0]]
+        start=level['start']
+        end=np.append(start[1:],self.rows)
+        ka=np.searchsorted(start,lo,'left')         # first bucket starting at lo or later
+        kb=np.searchsorted(end,hi,'right')          # buckets before kb end at hi or before
+        if kb<=ka:
+            return self.summary(values,ok,lo,hi,periods[1:])
+        parts=[self.summary(values,ok,lo,start[ka],periods[1:]),
+               (np.fmin.reduce(level['min'][ka:kb]),np.fmax.reduce(level['max'][ka:kb]),level['sum'][ka:kb].sum(),level['count'][ka:kb].sum()),
+               self.summary(values,ok,end[kb-1],hi,periods[1:])]
+        return (np.fmin.reduce([x[0] for x in parts]),np.fmax.reduce([x[1] for x in parts]),
+                sum(x[2] for x in parts),sum(x[3] for x in parts))
+
+def preview_stride(total,maxpoints):
+    # one point out of stride gives at most maxpoints points (all points if maxpoints is None)
+    return max(1,-(-total//maxpoints)) if maxpoints else 1
+
+def rollup_file(filename):
+    # rollups saved next to a npz file (see GpxObj.save_rollups())
+    return os.path.splitext(filename)[0]+'.rollup.npz'
+
+def nmea_degrees(value,hemisphere):
+    # (d)ddmm.mmmm and N/S/E/W to signed degrees
+    value=float(value)
+    degrees=int(value/100)+(value-100*int(value/100))/60.0
+    return -degrees if hemisphere in ('S','W') else degrees
+
+def parse_nmea(lines,altitude=None):
+    # points of NMEA 0183 sentences: position, date and time of RMC sentences with a valid fix, and altitude
+    # of the GGA sentence of the same fix (nan if there is none). sentences with a wrong checksum are skipped.
+    # altitude (time -> altitude of GGA sentences) may be kept from one call to the next.
+    # returns {'lat','lon','ele','time'} arrays, ready for GpxObj.append_rows()
+    fixes=[]
+    altitude={} if altitude==None else altitude
+    for line in lines:
+        line=line.strip()
+        if not line.startswith('$') or not '*' in line:
+            continue
+        body,checksum=line[1:].rsplit('*',1)
+        try:
+            if int(checksum[:2],16)!=reduce(operator.xor,bytearray(body),0):
+                continue
+            f=body.split(',')
+            if f[0][2:]=='GGA' and f[6] not in ('','0') and f[9]!='':
+                altitude[f[1]]=float(f[9])
+            elif f[0][2:]=='RMC' and f[2]=='A':
+                fixes.append((f[1],f[9],nmea_degrees(f[3],f[4]),nmea_degrees(f[5],f[6])))
+        except (ValueError,IndexError):
+            continue
+    times=['%s%s-%s-%sT%s:%s:%sZ'%('19' if d[4:6]>='80' else '20',d[4:6],d[2:4],d[0:2],t[0:2],t[2:4],t[4:]) for t,d,lat,lon in fixes]
+    return {'lat':np.array([f[2] for f in fixes],dtype='float'),
+            'lon':np.array([f[3] for f in fixes],dtype='float'),
+            'ele':np.array([altitude.get(f[0],np.nan) for f in fixes],dtype='float'),
+            'time':parse_iso8601(times) if len(times) else np.zeros(0,dtype='M8[ns]')}
+
+class NmeaSocket(object):
+    # non blocking reader of NMEA sentences sent over tcp (gpsd, a gps shared on the network, or any test server)
+    # read() returns the points of the sentences received since last call (see parse_nmea())
+    def __init__(self,host='localhost',port=2947,gpsd=None):
+        self.sock=socket.create_connection((host,port),5)
+        if gpsd or (gpsd==None and port==2947):
+            self.sock.sendall('?WATCH={"enable":true,"nmea":true}\n')
+        self.sock.setblocking(0)
+        self.pending=''
+        self.altitude={}                            # GGA sentences may come before the RMC of the same fix
+        self.closed=False
+
+    def read(self):
+        try:
+            while True:
+                data=self.sock.recv(65536)
+                if not data:
+                    self.closed=True
+                    break
+                self.pending+=data
+        except socket.error:
+            pass                                    # nothing more to read for now
+        lines=self.pending.split('\n')
+        self.pending=lines.pop()                    # incomplete sentence
+        if len(self.altitude)>16:
+            self.altitude.clear()
+        return parse_nmea(lines,self.altitude)
+
+    def close(self):
+        self.sock.close()
+
+def weak(gpx):
+    # what widgets and plugins keep of the track they show: a proxy which does not keep it alive once the
+    # application let it go (see GpxObj.close())
+    if isinstance(gpx,weakref.ProxyTypes) or gpx==None:
+        return gpx
+    return weakref.proxy(gpx)
+
+def get_rss():
+    # memory used by the process (resident set size, bytes). None if it can't be read (no /proc, no psutil)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (IOError,OSError,ValueError,AttributeError):
+        pass
+    if hasPsutil:
+        return psutil.Process(os.getpid()).memory_info().rss
+    return None
+
+def trim_memory():
+    # gives the memory freed by closed tracks back to the system (glibc keeps it for later allocations)
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError,AttributeError):
+        pass                                        # not glibc
+
+def leak_check(cycle,cycles=5,tolerance=16*1024*1024):
+    # calls cycle() (which opens a track, then closes or replaces it) once, then cycles more times.
+    # returns (rss after the first call, rss after each next one, True if they all stay within tolerance bytes
+    # of the first), or (None,[],None) if rss can't be read
+    cycle()
+    trim_memory()
+    baseline=get_rss()
+    if baseline==None:
+        return None,[],None
+    sizes=[]
+    for i in range(cycles):
+        cycle()
+        trim_memory()
+        sizes.append(get_rss())
+    return baseline,sizes,all(size-baseline<=tolerance for size in sizes)
 
 class GpxObj:
     def __init__(self):
@@ -46,23 +1400,125 @@ class GpxObj:
         self.offset={}
         self.d=None
         self.finename=None
+        # index of enabled points and masked views, valid as long as 'ok' stamp is okversion
+        self.okversion=None
+        self.okcache={}
+        # columns multiplied by their scale, valid as long as (stamp,unit,scale) is unchanged
+        self.scaledcache={}
+        # undo/redo journal (see record())
+        self.journal=[]
+        self.redolist=[]
+        self.journalgroup=None
+        self.journalpaused=False
+        self.journalbudget=64*1024*1024
+        # derived columns (see derive()): key -> (inputs,function), and stamps of inputs when last computed
+        self.recipes={}
+        self.derivedstamp={}
+        # directory for memmapped column files (see set_cachedir()). None keeps columns in memory
+        self.cachedir=None
+        # storage type of columns (see set_precision())
+        self.precision=dict(precision)
+        # first row of each track segment (see set_segments())
+        self.segments=np.zeros(1,dtype='int')
+        # spatial index of points, valid as long as lat and lon stamps are spatialstamp
+        self.spatialindex=None
+        self.spatialstamp=None
+        # time index, valid as long as time stamp is timeindexstamp
+        self.timeindex=None
+        self.timeindexstamp=None
+        # Douglas-Peucker rank of points, valid as long as lat and lon stamps are simplifystamp and segments
+        # are simplifysegments. rows from simplifyfrozen on are ranked again when written (see get_simplify_rank())
+        self.simplifyrank=None
+        self.simplifystamp=None
+        self.simplifysegments=None
+        self.simplifyfrozen=0
+        self.simplifybuf=np.zeros(0)
+        # time rollups of columns (see get_rollup()): key -> (Rollup, stamps of time, ok and key)
+        self.rollups={}
+        # one point out of stride was read (preview of a large file, see open_gpx())
+        self.stride=1
+        # points averaged by the slope column (see set_slope_window())
+        self.slopewindow=200
+        # columns computed on worker threads (see recompute()): key -> generation of its last job,
+        # and jobs done, waiting for swap_ready()
+        self.jobs={}
+        self.jobsdone=[]
+        self.jobslock=threading.Lock()
 
     def __getitem__(self,tup):
         if not isinstance(tup, tuple):
+            if isinstance(tup,basestring):
+                self.refresh(tup)
+            else:
+                self.update_derived()               # rows of all columns
             return self.d[tup]                      # don't bother...
         else:
             tup=tup+(False,False)                   # make sure our tuple has at least 3 items
             key,scaled,ok=tup[0],tup[1],tup[2]
+            self.refresh(key)
+            if scaled and self.d[key].dtype.kind=='M':
+                scaled=False                        # times are never scaled
             if not ok and not scaled:
                 return self.d[key]
             if not ok and scaled:
-                return self.d[key]*self.scale[key]
-            if ok and not scaled:
-                return self.d[key][np.where(self.d['ok']==True)]
-            if ok and scaled:
-                return self.d[key][np.where(self.d['ok']==True)]*self.scale[key]
+                return self.get_scaled_view(key)
+            if ok:
+                return self.get_ok_view(key,scaled)
             ## by the way, you can filter your data using something like
             #self.d['ok'][np.where(self.d[('speed',1,0)]>x,yz)]=0
+            ## or, without temporaries, gpx.set_ok(gpx.where("speed_kts>x"),False)
+
+    def get_version(self,key):
+        return self.d[key].log.stamp
+
+    def touch(self,key):
+        # to be called if a column was modified without item assignment (through a view obtained with np.asarray...)
+        self.d[key].touch()
+
+    def get_ok_index(self):
+        # indices of enabled points. computed once, then reused until 'ok' is written
+        if self.okversion!=self.get_version('ok'):
+            self.okcache={}
+            self.okversion=self.get_version('ok')
+            idx=np.flatnonzero(self.d['ok'])
+            idx.flags.writeable=False
+            self.okcache[None]=idx
+        return self.okcache[None]
+
+    def get_ok_view(self,key,scaled=False):
+        # enabled points of column key (scaled or not). returned arrays are shared, hence read only
+        self.refresh(key)
+        idx=self.get_ok_index()
+        stamp=(self.get_version(key),self.unit.get(key),self.scale[key]) if scaled else (self.get_version(key),)
+        if not (key,scaled) in self.okcache or self.okcache[(key,scaled)][0]!=stamp:
+            if scaled:
+                view=self.get_scaled_view(key)[idx]
+            else:
+                view=categorical_like(self.d[key],np.asarray(self.d[key])[idx])
+            view.flags.writeable=False
+            self.okcache[(key,scaled)]=(stamp,view)
+        return self.okcache[(key,scaled)][1]
+
+    def get_scaled_view(self,key):
+        # column key multiplied by its scale, shared by all widgets until the column, its unit or its scale
+        # change, hence read only. after a few rows were written, only these rows are scaled again
+        self.refresh(key)
+        stamp=(self.get_version(key),self.unit.get(key),self.scale[key])
+        entry=self.scaledcache.get(key)
+        if entry==None or entry[0]!=stamp:
+            rows=None
+            if entry!=None and entry[0][1:]==stamp[1:] and len(entry[1])==self.get_row_count():
+                rows=self.d[key].log.changed_since(entry[0][0])
+            # scaled values are float64, whatever the storage type of the column
+            if rows==None:
+                view=np.multiply(self.d[key],self.scale[key],dtype='float64')
+            else:
+                view=entry[1]
+                view.flags.writeable=True
+                view[rows[0]:rows[1]]=np.multiply(self.d[key][rows[0]:rows[1]],self.scale[key],dtype='float64')
+            view.flags.writeable=False
+            self.scaledcache[key]=(stamp,view)
+        return self.scaledcache[key][1]
 
     def __setitem__(self,key,value):
         self.d[key]=value
@@ -70,28 +1526,42 @@ class GpxObj:
     def __repr__(self):
         print self.d
 
-    def open_gpx(self, filename):
+    def open_gpx(self, filename, maxpoints=None):
+        # maxpoints: preview of a large file, with about maxpoints points evenly spread (see adopt())
         print filename
         self.gpxdoc = etree.parse(filename)
         self.filename=filename
-        self.parse_trkpts()
+        self.parse_trkpts(maxpoints=maxpoints)
 
     def close_gpx(self):
-        self.gpxdoc = None
-        del self.d
-        del self.scale
-        del self.unit
+        self.close()
+
+    def close(self):
+        # frees the columns and all that was computed from them (caches, indexes, rollups, undo journal, xml
+        # document) now, whoever still holds the object: it is left as an empty track (no column, no row)
+        if self.d!=None:
+            self.d.cleanup()
+        self.__dict__.clear()
+        self.__init__()
+        self.d=ColumnStore(0)
 
-    def save_gpx(self,filename,fields=None,indices=None):
-        self.save_xml(filename,fields,indices)
+    def save_gpx(self,filename,fields=None,indices=None,tolerance=None):
+        self.save_xml(filename,fields,indices,tolerance)
 
     def open_npz(self,filename):
         loadeddata=np.load(filename)
-        self.d=loadeddata['d']
+        self.d=ColumnStore.from_records(loadeddata['d'],self.cachedir)
         self.unit=dict(zip(list(loadeddata['keys']),list(loadeddata['unit'])))
         self.scale=dict(zip(list(loadeddata['keys']),list(loadeddata['scale'])))
+        if self.has_field('time') and self.d['time'].dtype.kind in 'SU':
+            self.d.append('time','M8[ns]',parse_iso8601(self.d['time']))     # files saved with string times
+        self.apply_precision()
+        self.set_segments(loadeddata['segments'] if 'segments' in loadeddata.files else [0])
+        self.clear_journal()
+        if os.path.exists(rollup_file(filename)):
+            self.load_rollups(rollup_file(filename))
 
-    def save_npz(self,filename):
+    def save_npz(self,filename,rollups=False):
         if False:
             keys = np.array(list(self.unit.keys()))
             unit = np.array(list(self.unit.values()))
@@ -99,12 +1569,15 @@ class GpxObj:
             np.savez(filename,keys=keys,unit=unit,scale=scale,d=self.d)
         else:
         ## the same filtering out unwanted columns (starting with underscore: private data for plugins)
+            self.update_derived()
             exportedkeys=[k for k in self.unit.keys() if not k.startswith('_')]
             keys = np.array([k for k in exportedkeys if not k.startswith('idx')])
             unit = np.array([self.unit[k] for k in exportedkeys])
             scale = np.array([self.scale[k] for k in exportedkeys])
             d =self.d[[k for k in exportedkeys+['ok']]]
-            np.savez(filename,keys=keys,unit=unit,scale=scale,d=d)
+            np.savez(filename,keys=keys,unit=unit,scale=scale,d=d,segments=self.segments)
+            if rollups:
+                self.save_rollups(rollup_file(filename),[k for k in exportedkeys if not k.startswith('idx')])
 
     def get_trkseg_count(self):
         return sum(1 for _ in self.gpxdoc.iter('{*}trkseg'))
@@ -123,6 +1596,10 @@ class GpxObj:
             print child
             if re.sub(r'\{.*?\}', '', child.tag) in ['extensions','TrackPointExtension'] :
                 continue
+            if re.sub(r'\{.*?\}', '', child.tag)=='time':
+                # times are stored as datetime64 (UTC), and parsed all at once (see parse_iso8601())
+                types.append(('time','M8[ns]'))
+                continue
             try:
                 x=int(child.text)
                 types.append((re.sub(r'\{.*?\}', '', child.tag),'int'))
@@ -131,10 +1608,7 @@ class GpxObj:
                     x=float(child.text)
                     types.append((re.sub(r'\{.*?\}', '', child.tag),'float'))
                 except  ValueError:
-                    # specially for time, you may encounter points with 1/10 of seconds, 
-                    # in which case the Z will disappear, which will prevent correct computations
-                    # another solution woul be to enzure the last charater of 'time' field is always 'Z'
-                    types.append((re.sub(r'\{.*?\}', '', child.tag),'a'+str(len(child.text)+5)))    
+                    types.append((re.sub(r'\{.*?\}', '', child.tag),'category'))
                 pass
         return types
 
@@ -148,56 +1622,563 @@ class GpxObj:
         nam,typ=zip(*tags)
         return typ
 
-    def parse_trkpts(self,keys=None,trkseg=-1):
+    def parse_trkpts(self,keys=None,trkseg=-1,maxpoints=None):
         if (keys==None) or (len(keys) == 0):
             keys=self.get_trkpt_elements()
-        row=self.get_trkpt_count(trkseg)
-        self.d=np.ones(row,dtype={'names':['ok'],'formats':['bool']})
+        total=self.get_trkpt_count(trkseg)
+        counts=[len(seg.findall('.//{*}trkpt')) for seg in self.gpxdoc.iter('{*}trkseg')]
+        # preview: one point out of stride in each segment, first points of segments included
+        self.stride=preview_stride(total,maxpoints)
+        if sum(counts)==total:
+            keep=(np.arange(total)-np.repeat(np.cumsum([0]+counts)[:-1],counts))%self.stride==0
+        else:
+            keep=np.arange(total)%self.stride==0
+        rows=np.flatnonzero(keep)
+        row=len(rows)
+        self.d=ColumnStore(row,self.cachedir)
+        self.d.append('ok','bool',np.ones(row,dtype='bool'))
         for key,typ in ([('lat','float'),('lon','float')]+keys):
-            self.d=npr.rec_append_fields(self.d,key,np.zeros(row),typ)
-            self.scale[key]=1.0
-            self.unit[key]="SI"
+            self.append_column(key,typ)
+        # datetime and text columns are collected as text, then parsed (or encoded) in a single pass
+        texts=dict((key,['']*row) for key,typ in keys if not typ in ('float','int'))
         idx=0
-        for trkpt in self.gpxdoc.iter('{*}trkpt'):
+        for i,trkpt in enumerate(self.gpxdoc.iter('{*}trkpt')):
+            if not keep[i]:
+                continue
             self.d['lat'][idx] = float(trkpt.get('lat'))        # lat and lon are the only mandatory elements
             self.d['lon'][idx] = float(trkpt.get('lon'))        # lat and lon are the only mandatory elements
             for child in trkpt.findall('.//{*}*'):
                 key=re.sub(r'\{.*?\}', '', child.tag)
-                if key in self.d.dtype.names:
+                if key in self.d:
                     typ=dict(keys)[key]
                     if typ=='float':
                         self.d[key][idx]=float(child.text)
                     elif typ=='int':
                         self.d[key][idx]=int(child.text)
+                    elif key in texts:
+                        texts[key][idx]=child.text
                     else:
                         self.d[key][idx]=child.text
             idx+=1
+        for key in texts:
+            if self.d[key].dtype.kind=='M':
+                self.d[key]=parse_iso8601(texts[key])
+            else:
+                self.d.append(key,self.storage_type(key,dict(keys)[key]),texts[key])
+        self.set_segments(np.searchsorted(rows,np.cumsum([0]+counts)[:-1]))
         self.append_column('idx','int')
-        self['idx']=np.arange(self.get_row_count())
+        self['idx']=rows                            # row of each point in the whole file
+        self.clear_journal()
 
     def append_column(self,key,typ):
-        self.d=npr.rec_append_fields(self.d,key,np.zeros(self.d.shape[0]),typ)
+        self.recipes.pop(key,None)                  # a new column is plain data, until derive() says otherwise
+        self.derivedstamp.pop(key,None)
+        if self.has_field(key):
+            self.record(('insertcol',key,self.d.names.index(key),self.d[key],self.unit[key],self.scale[key]))
+        else:
+            self.record(('dropcol',key))
+        self.d.append(key,self.storage_type(key,typ))
         self.scale[key]=1.0
         self.unit[key]="SI"
 
     def drop_column(self,key):
-        self.d=npr.rec_drop_fields(self.d,key)
+        self.record(('insertcol',key,self.d.names.index(key),self.d[key],self.unit[key],self.scale[key]))
+        self.scaledcache.pop(key,None)
+        self.d.drop(key)
         del self.scale[key]
         del self.unit[key]
 
     def move_column(self, oldkey, newkey):
-        headers=list(self.d.dtype.names)
-        headers[headers.index(oldkey)]=newkey
-        self.d.dtype.names=tuple(headers)
+        self.record(('movecol',newkey,oldkey))
+        self.d.rename(oldkey,newkey)
+        self.scaledcache.pop(oldkey,None)
+        if oldkey in self.recipes:
+            self.recipes[newkey]=self.recipes.pop(oldkey)
+            self.derivedstamp[newkey]=self.derivedstamp.pop(oldkey)
         self.scale[newkey]=self.scale.pop(oldkey)
         self.unit[newkey]=self.unit.pop(oldkey)
 
     def append_row(self, values):
-        self.d = np.append(self.d, values)
+        self.d.append_rows(values)
+        self.clear_journal()                        # recorded row positions are not valid anymore
+
+    ## live tracking
+    # open_live() starts an empty track, append_rows() adds the points received since last call. columns grow
+    # by chunks, and derived columns are only computed for the new rows (their inputs logs tell which rows)
+    def open_live(self,keys=[('time','M8[ns]'),('ele','float')]):
+        self.filename=None
+        self.d=ColumnStore(0,self.cachedir)
+        self.d.append('ok','bool')
+        for key,typ in [('lat','float'),('lon','float')]+keys:
+            self.append_column(key,typ)
+        self.append_column('idx','int')
+        self.segments=np.zeros(1,dtype='int')
+        self.clear_journal()
+
+    def append_rows(self,values,newsegment=False):
+        # appends points (dict of arrays, or records). missing columns are nan, NaT, 0 or '' (derived columns are
+        # computed afterwards), points are enabled. newsegment starts a track segment at the first new point.
+        # returns the first new row
+        first=self.get_row_count()
+        names=values.dtype.names if hasattr(values,'dtype') else values.keys()
+        n=len(np.atleast_1d(values[names[0]]))
+        rows={'ok':np.ones(n,dtype='bool'),'idx':np.arange(first,first+n)}
+        for key in self.d.names:
+            if key in names:
+                rows[key]=values[key]
+            elif not key in rows:
+                kind=self.d[key].dtype.kind
+                rows[key]='' if isinstance(self.d[key],Categorical) else \
+                          np.full(n,np.nan) if kind=='f' else np.full(n,np.datetime64('NaT'),dtype='M8[ns]') if kind=='M' else 0
+        self.d.append_rows(rows)
+        if newsegment and first>0:
+            self.segments=np.append(self.segments,first)    # rows before first are not affected
+        self.clear_journal()                        # recorded row positions are not valid anymore
+        return first
 
     def drop_row(self,rownum):
-        self.d=np.delete(self.d, (rownum), axis=0)
-        self['idx']=np.arange(self.get_row_count())
+        self.drop_rows([rownum])
+
+    def row_mask(self,rows):
+        # converts rows to a boolean mask. rows may be a boolean mask, a slice, a (start,stop) tuple,
+        # a list of (start,stop) tuples or a list/array of row indices
+        mask=np.zeros(self.get_row_count(),dtype='bool')
+        if isinstance(rows,np.ndarray) and rows.dtype==np.bool_:
+            mask[:]=rows
+        elif isinstance(rows,slice):
+            mask[rows]=True
+        elif isinstance(rows,tuple):
+            mask[rows[0]:rows[1]]=True
+        elif len(rows)>0 and isinstance(rows[0],tuple):
+            for (start,stop) in rows:
+                mask[start:stop]=True
+        else:
+            mask[np.asarray(rows,dtype='int')]=True
+        return mask
+
+    def drop_rows(self,rows):
+        # deletes all rows at once (see row_mask() for allowed values). Deltas of the first point after
+        # each removed block are recomputed, then cumulative distance and duration in a single pass
+        drop=self.row_mask(rows)
+        if not drop.any():
+            return
+        self.record(self.apply_edit(('droprows',np.packbits(drop),len(drop))))
+
+    def set_ok(self,rows,value):
+        # enables/disables rows (see row_mask()). use this instead of gpx['ok'][rows]=value to be able to undo
+        mask=self.row_mask(rows)
+        sel=np.flatnonzero(mask)
+        if len(sel)==0:
+            return
+        lo,hi=sel[0],sel[-1]+1
+        self.record(('setok',lo,hi,np.packbits(self['ok'][lo:hi])))
+        self['ok'][mask]=value
+
+    def where(self,expr,indices=False):
+        # mask (or indices if indices is True) of rows where expr holds, e.g. "speed_kts>10 and hr<170 and ok"
+        # and/or/not are elementwise. evaluated with numexpr if available, by chunks of where_chunk rows
+        src,variables=compile_where(expr,self.d.columns)
+        for col,scale in variables.values():
+            self.refresh(col)
+        columns=dict((var,np.asarray(self.d[col])) for var,(col,scale) in variables.items())
+        usenumexpr=hasNumexpr and all(c.dtype.name in ('bool','int32','int64','float32','float64') for c in columns.values())
+        code=None if usenumexpr else compile(src,'<where>','eval')
+        n=self.get_row_count()
+        result=[] if indices else np.zeros(n,dtype='bool')
+        for lo in range(0,n,where_chunk):
+            hi=min(lo+where_chunk,n)
+            chunk=dict((var,c[lo:hi]) for var,c in columns.items())
+            if usenumexpr:
+                m=numexpr.evaluate(src,local_dict=chunk)
+            else:
+                chunk.update(where_functions)
+                m=eval(code,{'__builtins__':{},'True':True,'False':False},chunk)
+            m=np.broadcast_to(m,(hi-lo,))
+            if indices:
+                result.append(np.flatnonzero(m)+lo)
+            else:
+                result[lo:hi]=m
+        if indices:
+            return np.concatenate(result) if len(result) else np.zeros(0,dtype='int')
+        return result
+
+    def enable_where(self,expr,value=True):
+        # enables (or disables if value is False) rows where expr holds (undoable)
+        self.set_ok(self.where(expr),value)
+
+    def disable_where(self,expr):
+        self.enable_where(expr,False)
+
+    ## undo/redo journal
+    # each edit is recorded as the edit that reverts it, holding only what was touched:
+    # ('setok',lo,hi,bits)                  ok[lo:hi] values (packed bits)
+    # ('droprows',bits,n)                   mask of rows to drop (packed bits)
+    # ('insertrows',bits,n,store,fixed,seg) rows to insert back, deltas that were overwritten, and segments
+    # ('dropcol',key)
+    # ('insertcol',key,pos,data,unit,scale)
+    # ('movecol',oldkey,newkey)
+    # ('setunit',key,unit,scale)
+    # ('setsegments',starts)
+    # ('group',[edits])                     several edits undone at once
+    # applying an edit returns the edit that reverts it, which goes to the redo list (and back)
+    def record(self,edit):
+        if self.journalpaused:
+            return
+        if self.journalgroup!=None:
+            self.journalgroup.append(edit)
+            return
+        self.journal.append(edit)
+        self.redolist=[]
+        # forget oldest edits when memory budget is exceeded
+        while len(self.journal)>0 and self.get_journal_size()>self.journalbudget:
+            self.journal.pop(0)
+
+    def start_group(self):
+        self.journalgroup=[]
+
+    def end_group(self):
+        group,self.journalgroup=self.journalgroup,None
+        if group!=None and len(group)>0:
+            self.record(('group',group))
+
+    def clear_journal(self):
+        self.journal=[]
+        self.redolist=[]
+        self.journalgroup=None
+
+    def set_journal_budget(self,size):
+        # maximum memory (bytes) kept for undo/redo
+        self.journalbudget=size
+        while len(self.journal)>0 and self.get_journal_size()>self.journalbudget:
+            self.journal.pop(0)
+
+    def get_journal_size(self):
+        return sum(edit_size(e) for e in self.journal+self.redolist)
+
+    def can_undo(self):
+        return len(self.journal)>0
+
+    def can_redo(self):
+        return len(self.redolist)>0
+
+    def undo(self):
+        if len(self.journal)>0:
+            self.redolist.append(self.apply_edit(self.journal.pop()))
+
+    def redo(self):
+        if len(self.redolist)>0:
+            self.journal.append(self.apply_edit(self.redolist.pop()))
+
+    def apply_edit(self,edit):
+        self.journalpaused=True
+        try:
+            kind=edit[0]
+            if kind=='setok':
+                (lo,hi,bits)=edit[1:]
+                inverse=('setok',lo,hi,np.packbits(self['ok'][lo:hi]))
+                self['ok'][lo:hi]=np.unpackbits(bits)[:hi-lo].astype('bool')
+            elif kind=='droprows':
+                (bits,n)=edit[1:]
+                drop=np.unpackbits(bits)[:n].astype('bool')
+                keep=~drop
+                # first kept point following a dropped one, in old numbering, then in new numbering
+                fixed=np.flatnonzero(keep & np.concatenate(([True],drop[:-1])))
+                joins=np.searchsorted(np.flatnonzero(keep),fixed)
+                saved={}
+                for key in ['deltaxy','deltat']:
+                    if self.has_field(key) and not self.is_derived(key):
+                        saved[key]=(fixed,np.asarray(self[key])[fixed])
+                inverse=('insertrows',bits,n,self.d.take(drop),saved,self.segments)
+                self.d.compress(keep)
+                self['idx']=np.arange(self.get_row_count())
+                # a segment now starts at its first kept point. segments with no point left disappear
+                kept=np.flatnonzero(keep)
+                segments=np.unique(np.searchsorted(kept,self.segments))
+                self.segments=np.union1d([0],segments[segments<len(kept)])
+                starts=joins[self.is_segment_start(joins)]
+                # derived columns will be recomputed on next access. others are patched at the junctions
+                if self.get_row_count()>0:
+                    if self.has_field('deltaxy') and not self.is_derived('deltaxy'):
+                        self['deltaxy'][joins]=haversine(self['lat'][joins-1],self['lon'][joins-1],self['lat'][joins],self['lon'][joins])
+                        self['deltaxy'][starts]=0.0
+                        self['deltaxy'][0]=0.0
+                    if self.has_field('deltat') and not self.is_derived('deltat') and self.has_field('time'):
+                        self['deltat'][joins]=(self['time'][joins]-self['time'][joins-1])/np.timedelta64(1,'s')
+                        self['deltat'][starts]=0.0
+                        self['deltat'][0]=0.0
+                self.update_cumulative()
+            elif kind=='insertrows':
+                (bits,n,store,saved,segments)=edit[1:]
+                mask=np.unpackbits(bits)[:n].astype('bool')
+                for key in self.d.names:
+                    col=np.zeros(n,dtype=self.d[key].dtype)
+                    col[~mask]=self.d[key]
+                    if key in store:
+                        col[mask]=store[key]
+                    self.d.columns[key]=self.d.new_column(categorical_like(self.d[key],col))
+                self.d.rows=n
+                self.segments=segments
+                self['idx']=np.arange(n)
+                for key in saved:
+                    if self.has_field(key):
+                        self[key][saved[key][0]]=saved[key][1]
+                self.update_cumulative()
+                inverse=('droprows',bits,n)
+            elif kind=='dropcol':
+                key=edit[1]
+                inverse=('insertcol',key,self.d.names.index(key),self.d[key],self.unit[key],self.scale[key])
+                self.drop_column(key)
+            elif kind=='insertcol':
+                (key,pos,data,unit,scale)=edit[1:]
+                inverse=('dropcol',key)
+                self.d.append(key,'category' if isinstance(data,Categorical) else data.dtype,data)
+                self.d.names.remove(key)
+                self.d.names.insert(pos,key)
+                self.unit[key]=unit
+                self.scale[key]=scale
+            elif kind=='movecol':
+                (oldkey,newkey)=edit[1:]
+                inverse=('movecol',newkey,oldkey)
+                self.move_column(oldkey,newkey)
+            elif kind=='setunit':
+                (key,unit,scale)=edit[1:]
+                inverse=('setunit',key,self.unit[key],self.scale[key])
+                self.unit[key]=unit
+                self.scale[key]=scale
+            elif kind=='setsegments':
+                inverse=('setsegments',self.segments)
+                self.set_segments(edit[1])
+            elif kind=='group':
+                inverse=('group',[self.apply_edit(e) for e in reversed(edit[1])])
+        finally:
+            self.journalpaused=False
+        return inverse
+
+    def update_cumulative(self):
+        # cumulative distance and duration from deltas
+        if self.has_field('distance') and not self.is_derived('distance') and self.has_field('deltaxy'):
+            self['distance']=np.cumsum(self['deltaxy'])
+        if self.has_field('duration') and not self.is_derived('duration') and self.has_field('deltat'):
+            self['duration']=np.cumsum(self['deltat'])
+
+    ## derived columns
+    # a derived column is computed by func() from its inputs (other columns, possibly derived) on first
+    # access, then kept until one of its inputs is written. unused columns cost nothing but their storage.
+    # if given, update(lo,hi) patches the column after rows lo..hi-1 of its inputs were written, so that
+    # editing a few points does not recompute whole columns
+    def derive(self,key,inputs,func,typ='float',update=None):
+        if not self.has_field(key):
+            self.append_column(key,typ)
+        self.recipes[key]=(inputs,func,update)
+        self.derivedstamp[key]=None
+
+    def is_derived(self,key):
+        return key in self.recipes
+
+    def refresh(self,key):
+        # (re)computes key if it is a derived column and one of its inputs changed since last computation
+        if not key in self.recipes or not key in self.d:
+            return
+        inputs,func,update=self.recipes[key]
+        for k in inputs:
+            if not k in self.d:
+                return
+            self.refresh(k)
+        stamp=tuple(self.get_version(k) for k in inputs)
+        old=self.derivedstamp[key]
+        if old!=stamp:
+            rows=None
+            if old!=None and update!=None:
+                rows=self.changed_rows(inputs,old)
+            if rows==None:
+                self.d[key]=func()
+            elif rows[0]<rows[1]:
+                update(rows[0],rows[1])
+            self.derivedstamp[key]=stamp
+
+    def changed_rows(self,keys,since):
+        # rows (lo,hi) of columns keys written after stamps since (one per key). None if not known
+        lo,hi=self.get_row_count(),0
+        for k,stamp in zip(keys,since):
+            r=self.d[k].log.changed_since(stamp)
+            if r==None:
+                return None
+            if r[0]<r[1]:
+                lo,hi=min(lo,r[0]),max(hi,r[1])
+        return (lo,hi) if lo<hi else (0,0)
+
+    def update_derived(self):
+        for key in self.recipes.keys():
+            self.refresh(key)
+
+    def derive_standard_columns(self):
+        # registers the standard indicators which were not read from file (for example doppler speed):
+        # deltat    time between two adjacent points. some GPS do not log at equally spaced times
+        # deltaxy   horizontal distance between two ajacent points.
+        # distance  cumulative distance calculated from haversine formula   (m)
+        # duration  cumulative duration calculated from time tag            (s)
+        # course    course calculated from haversine formula                (degrees)
+        # speed     instantaneous speed calculated from deltaxy and deltat
+        # slope     only if an elevation 'ele' tag is found                 instantaneous slope!!not reliable
+        # each one comes with the function which patches it when rows lo..hi-1 of its inputs were modified
+        # the first point of a segment has no previous point: atstart(rows) gives its value
+        def pairwise(key,func,atstart):
+            # columns computed from each point and the previous one: rows lo..hi are affected,
+            # and lo-1 if it starts a segment (atstart may look at the next point)
+            def update(lo,hi):
+                rows=np.arange(max(lo-1,0),min(hi+1,self.get_row_count()))
+                if len(rows)>0:
+                    values=func(rows-1,rows)
+                    start=self.is_segment_start(rows)
+                    values[start]=atstart(rows[start])
+                    self.d[key][rows]=values
+            return update
+        def cumulative(key,delta):
+            def update(lo,hi):
+                start=self.d[key][lo-1] if lo>0 else 0.0
+                self.d[key][lo:]=np.cumsum(np.concatenate(([start],self[delta][lo:])))[1:]
+            return update
+        def speed(lo=0,hi=None):
+            # the first point of a segment takes the speed of the next one (nan for single point segments).
+            # segment starts divide 0 by 0 before being replaced: no warning
+            if hi==None:
+                deltaxy,deltat=np.asarray(self['deltaxy']),np.asarray(self['deltat'])
+                with np.errstate(divide='ignore',invalid='ignore'):
+                    d=deltaxy/deltat
+                if len(d)>0:
+                    d[self.segments]=d[np.minimum(self.segments+1,self.get_row_count()-1)]
+                return d
+            lo=max(lo-1,0)
+            starts=self.get_segment_starts(lo,hi)
+            following=np.minimum(starts+1,self.get_row_count()-1)
+            deltaxy,deltat=np.asarray(self['deltaxy']),np.asarray(self['deltat'])
+            with np.errstate(divide='ignore',invalid='ignore'):
+                self.d['speed'][lo:hi]=deltaxy[lo:hi]/deltat[lo:hi]
+                self.d['speed'][starts]=deltaxy[following]/deltat[following]
+        def slope(lo=0,hi=None):
+            conv=self.slopewindow
+            if hi==None:
+                return self.compute_slope()
+            a,b=max(lo-conv+1,0),min(hi+1,self.get_row_count())
+            first=max(a-1,0)
+            starts=np.union1d([0],self.get_segment_starts(first,b+conv-1)-first)
+            s=smoothed_slope(self['ele'][first:b+conv-1],self['deltaxy'][first:b+conv-1],conv,starts)[a-first:b-first]
+            s[~np.isfinite(s)]=0.0
+            self.d['slope'][a:b]=s
+        standard=[('deltat',['time'],self.duration,
+                        pairwise('deltat',lambda i,j:(self['time'][j]-self['time'][i])/np.timedelta64(1,'s'),lambda i:0.0)),
+                  ('deltaxy',['lat','lon'],self.hv_distance,
+                        pairwise('deltaxy',lambda i,j:haversine(self['lat'][i],self['lon'][i],self['lat'][j],self['lon'][j]),lambda i:0.0)),
+                  ('distance',['deltaxy'],lambda:np.cumsum(self['deltaxy']),cumulative('distance','deltaxy')),
+                  ('duration',['deltat'],lambda:np.cumsum(self['deltat']),cumulative('duration','deltat')),
+                  ('course',['lat','lon'],self.hv_course,
+                        pairwise('course',lambda i,j:bearing(self['lat'][i],self['lon'][i],self['lat'][j],self['lon'][j]),self.start_course)),
+                  ('speed',['deltaxy','deltat'],speed,speed),
+                  ('slope',['ele','deltaxy'],slope,slope)]
+        for key,inputs,func,update in standard:
+            if not self.has_field(key) and all(self.has_field(k) for k in inputs):
+                self.derive(key,inputs,func,update=update)
+
+    ## background computation
+    # long computations of columns run on a worker thread from a snapshot (copies) of their inputs, so
+    # that the ui keeps drawing the current columns meanwhile (numpy releases the gil in its kernels).
+    # the new columns are put in place together by swap_ready(), called from the ui thread
+    def snapshot(self,keys):
+        # track holding copies of columns keys and ok (derived ones computed first), with segments, units and scales
+        snap=GpxObj()
+        snap.d=ColumnStore(self.get_row_count())
+        for k in set(keys)|set(['ok']):
+            col=self[k]
+            if isinstance(col,Categorical):
+                snap.d.append(k,'category',col)
+            else:
+                snap.d.append(k,col.dtype,np.array(col))
+        snap.segments=self.segments.copy()
+        snap.unit=dict(self.unit)
+        snap.scale=dict(self.scale)
+        snap.offset=dict(self.offset)
+        snap.slopewindow=self.slopewindow
+        return snap
+
+    def recompute(self,keys,inputs,func,typ='float',done=None):
+        # computes columns keys (a key or a list) as func(snapshot of inputs), which returns an array per key,
+        # on a worker thread. columns are created (typ) if needed. done() is called from the worker thread
+        # when the result is ready: the application then calls swap_ready() from the ui thread.
+        # a later recompute() of the same columns supersedes this one
+        keys=[keys] if isinstance(keys,basestring) else list(keys)
+        snap=self.snapshot(inputs)
+        stamp=tuple(self.get_version(k) for k in inputs)
+        generation=next(stamps)
+        for k in keys:
+            self.jobs[k]=generation
+        job=(keys,inputs,func,typ,done,stamp,generation)
+        def run():
+            try:
+                values=func(snap)
+                values=[values] if len(keys)==1 else list(values)
+            except Exception as e:
+                values=e
+            with self.jobslock:
+                self.jobsdone.append((job,values))
+            if done!=None:
+                done()
+        worker=threading.Thread(target=run)
+        worker.daemon=True
+        worker.start()
+        return generation
+
+    def is_computing(self,key=None):
+        # True while a job computes column key (any column if None)
+        return len(self.jobs)>0 if key==None else key in self.jobs
+
+    def swap_ready(self):
+        # puts the columns of finished jobs in place, all columns of a job at once. a job whose inputs were
+        # written meanwhile is started again. returns the keys swapped in (one ValChanged for all of them).
+        # errors raised by func() are raised here
+        with self.jobslock:
+            finished,self.jobsdone=self.jobsdone,[]
+        swapped=[]
+        error=None
+        for job,values in finished:
+            keys,inputs,func,typ,done,stamp,generation=job
+            if any(self.jobs.get(k)!=generation for k in keys):
+                continue                            # superseded
+            if isinstance(values,Exception):
+                for k in keys:
+                    del self.jobs[k]
+                error=values
+                continue
+            if not all(self.has_field(k) for k in inputs):
+                for k in keys:
+                    del self.jobs[k]
+                continue
+            if tuple(self.get_version(k) for k in inputs)!=stamp:
+                self.recompute(keys,inputs,func,typ,done)
+                continue
+            for k,v in zip(keys,values):
+                if not self.has_field(k):
+                    self.append_column(k,typ)
+                self.d.swap(k,v)
+                if k in self.recipes:
+                    # computed from the current inputs: up to date
+                    self.derivedstamp[k]=tuple(self.get_version(i) for i in self.recipes[k][0])
+                del self.jobs[k]
+            swapped+=keys
+        if error!=None:
+            raise error
+        return swapped
+
+    def set_slope_window(self,conv,done=None):
+        # number of points averaged by the slope column. slope is computed again in the background
+        # (see recompute()): the current one is kept until the new one is swapped in
+        self.slopewindow=conv
+        if self.is_derived('slope'):
+            self.recompute('slope',['ele','deltaxy'],lambda s:s.compute_slope(),done=done)
+
+    def compute_slope(self):
+        s=smoothed_slope(self['ele'],self['deltaxy'],self.slopewindow,self.segments)
+        s[~np.isfinite(s)]=0.0
+        return s
 
     def get_last_row_idx(self):
         return (self.get_row_count()-1)
@@ -209,10 +2190,7 @@ class GpxObj:
         return self.d.dtype
 
     def get_header_names(self):
-        res=[]
-        for (name,typ) in self.get_headers().descr:
-            res.append(name)
-        return res
+        return list(self.d.names)
 
     def get_header_types(self):
         res=[]
@@ -220,6 +2198,82 @@ class GpxObj:
             res.append(typ)
         return res
 
+    def set_cachedir(self,cachedir):
+        # columns of tracks opened afterwards (and of the current one) are memmapped files in cachedir
+        self.cachedir=cachedir
+        if self.d!=None:
+            self.d.to_cachedir(cachedir)
+            self.okversion=None
+            self.okcache={}
+            self.scaledcache={}
+
+    ## track segments
+    # points of all segments are stored one after the other, self.segments holds the first row of each.
+    # deltas are 0 at the first point of a segment, so that pauses are not counted as moves
+    def set_segments(self,starts):
+        starts=np.asarray(starts,dtype='int')
+        old,self.segments=self.segments,np.union1d([0],starts[(starts>0)&(starts<self.get_row_count())])
+        self.record(('setsegments',old))
+        for key in self.derivedstamp:
+            self.derivedstamp[key]=None             # computed with the old segments
+
+    def get_segment_count(self):
+        return len(self.segments)
+
+    def get_segment_starts(self,lo=0,hi=None):
+        # first rows of segments starting between rows lo and hi-1
+        if hi==None:
+            hi=self.get_row_count()
+        return self.segments[np.searchsorted(self.segments,lo):np.searchsorted(self.segments,hi)]
+
+    def is_segment_start(self,rows):
+        k=np.minimum(np.searchsorted(self.segments,rows),len(self.segments)-1)
+        return self.segments[k]==rows
+
+    def get_segment_ids(self):
+        # segment number of each row
+        ids=np.zeros(self.get_row_count(),dtype='int')
+        ids[self.segments[1:]]=1
+        return np.cumsum(ids)
+
+    def storage_type(self,key,typ):
+        # type in which column key is stored: the precision policy for numeric columns, 'category' for text
+        # (see Categorical), typ otherwise
+        if isinstance(typ,basestring) and typ=='category' or np.dtype(typ).kind in 'SU':
+            return 'category'
+        if key in self.precision and np.dtype(typ).kind in 'iuf':
+            return self.precision[key]
+        return typ
+
+    def set_precision(self,policy):
+        # policy: {key:type} ('float32','int16','uint8',...). existing columns are converted.
+        # values which do not fit in the new type (nan in integers, overflows) are lost
+        self.precision.update(policy)
+        self.apply_precision()
+
+    def apply_precision(self):
+        if self.d==None:
+            return
+        for key in self.d.names:
+            if isinstance(self.d[key],Categorical):
+                continue
+            typ=self.storage_type(key,self.d[key].dtype)
+            if isinstance(typ,basestring) and typ=='category' or np.dtype(typ)!=self.d[key].dtype:
+                self.d.append(key,typ,self.d[key])
+                self.scaledcache.pop(key,None)
+
+    def get_memory_usage(self):
+        # (bytes used by columns, bytes they would use stored as float64/int64)
+        used,full=0,0
+        for key in self.d.names:
+            col=self.d[key]
+            used+=col.nbytes
+            if isinstance(col,Categorical):
+                full+=col.size*max([len(v) for v in col.categories.values]+[1])      # as fixed width text
+            else:
+                full+=col.size*8 if col.dtype.kind in 'iuf' else col.nbytes
+        return (used,full)
+
     def has_field(self,field):
         return str(field) in self.get_header_names()
 
@@ -227,10 +2281,12 @@ class GpxObj:
         return len(self.get_header_names())
 
     def get_row_count(self):
-        (r,)=self.d.shape
-        return r
+        return self.d.rows
 
     def set_unit(self,key,value):
+        if key in self.unit and self.unit[key]!=value:
+            self.record(('setunit',key,self.unit[key],self.scale[key]))
+            self.scaledcache.pop(key,None)
         try:
             self.unit[key]=value
             self.scale[key]=units[value][1]
@@ -263,35 +2319,28 @@ class GpxObj:
             return 1.0
 
     def set_scale(self, key, value):
+        if key in self.scale and self.scale[key]!=value:
+            self.record(('setunit',key,self.unit[key],self.scale[key]))
+            self.scaledcache.pop(key,None)
         try:
             self.scale[key]=value
         except KeyError:
             self.scale[key]= 1.0
 
     def duration(self):
+        # time elapsed since previous point of the segment (s)
         d=np.zeros(self.get_row_count())
-        for i in xrange(1,self.get_row_count()):
-            #t1=datetime.datetime.strptime(self['time'][i-1],"%Y-%m-%dT%H:%M:%SZ")
-            #t2=datetime.datetime.strptime(self['time'][i],"%Y-%m-%dT%H:%M:%SZ")
-            t1=dateutil.parser.parse(self['time'][i-1])
-            t2=dateutil.parser.parse(self['time'][i])
-            d[i] =(t2-t1).total_seconds()
+        d[1:]=np.diff(np.asarray(self['time']))/np.timedelta64(1,'s')
+        if len(d)>0:
+            d[self.segments]=0.0
         return d
 
     def hv_distance(self):
         # vectorized version
-        d=np.zeros(self.get_row_count())
-        lat2=self.d['lat'] * np.pi / 180.0
-        lon2=self.d['lon'] * np.pi / 180.0
-        lat1=np.roll(self.d['lat'],1) * np.pi / 180.0
-        lon1=np.roll(self.d['lon'],1) * np.pi / 180.0
-        # haversine formula #### Same, but atan2 named arctan2 in numpy
-        dlon = (lon2 - lon1)
-        dlat = (lat2 - lat1)
-        a = (np.sin(dlat/2))**2 + np.cos(lat1) * np.cos(lat2) * (np.sin(dlon/2.0))**2
-        c = 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0-a))
-        c[0]=0.0
-        return 6371000 * c
+        c=haversine(np.roll(self.d['lat'],1),np.roll(self.d['lon'],1),self.d['lat'],self.d['lon'])
+        if len(c)>0:
+            c[self.segments]=0.0
+        return c
         #loop version much slower than above vectorized version
         #d=np.zeros(self.get_row_count())
         #for i in xrange(1,self.get_row_count()):
@@ -308,17 +2357,15 @@ class GpxObj:
 
     def hv_course(self):
         #vectorized version
-        d=np.zeros(self.get_row_count())
-        lat2=self.d['lat'] * np.pi / 180.0
-        lon2=self.d['lon'] * np.pi / 180.0
-        lat1=np.roll(self.d['lat'],1) * np.pi / 180.0
-        lon1=np.roll(self.d['lon'],1) * np.pi / 180.0
-        # vectorized haversine formula
-        dlon = (lon2 - lon1)
-        dlat = (lat2 - lat1)
-        b=np.arctan2(np.sin(dlon)*np.cos(lat2),np.cos(lat1)*np.sin(lat2)-np.sin(lat1)*np.cos(lat2)*np.cos(dlon))
-        bd=b*180/np.pi
-        return np.mod((360+b*180/np.pi),360)
+        c=bearing(np.roll(self.d['lat'],1),np.roll(self.d['lon'],1),self.d['lat'],self.d['lon'])
+        if len(c)>0:
+            c[self.segments]=self.start_course(self.segments)
+        return c
+
+    def start_course(self,rows):
+        # course of the first points of segments: toward the next point
+        following=np.minimum(rows+1,self.get_row_count()-1)
+        return bearing(self.d['lat'][rows],self.d['lon'][rows],self.d['lat'][following],self.d['lon'][following])
         #loop version much slower than above vectorized version
         #d=np.zeros(self.get_row_count())
         #for i in xrange(1,self.get_row_count()):
@@ -334,12 +2381,14 @@ class GpxObj:
         #return d
 
     def hv_speed(self,skipnan=True):
-        # numpy vectorized version. we have to caclulate duration,  and hence parse datetime, which is slooowww!
-        # if you already have a duration column then simply calculate hv_distance()/gpx['duration']
+        # numpy vectorized version. times are datetime64, so duration is a simple difference
+        # with skipnan, the first point of a segment takes the speed of the next one
         if 'time' in self.get_header_names():
-            d=self.hv_distance()/self.duration()
-            if skipnan:
-                d[0]=d[1]
+            deltaxy,deltat=self.hv_distance(),self.duration()
+            with np.errstate(divide='ignore',invalid='ignore'):
+                d=deltaxy/deltat
+            if skipnan and len(d)>0:
+                d[self.segments]=d[np.minimum(self.segments+1,self.get_row_count()-1)]
                 #d[0]=0.0
             return d
         #loop version
@@ -368,28 +2417,84 @@ class GpxObj:
     def hv_slope(self,conv=10,skipnan=False):
         if not self.has_field('ele'):
             return np.zeros(self.get_row_count())
-        d=np.zeros(self.get_row_count())
         #can't compute slope without convolving data a lot!
-        vert=(1.0)*np.convolve(self[('ele',0,0)], np.ones((conv,))/conv)[(conv-1):]
-        horiz=(1.0)*np.convolve(self.hv_distance(), np.ones((conv,))/conv)[(conv-1):]
-        slope=np.ediff1d(vert,to_begin=0)/horiz
+        slope=smoothed_slope(self[('ele',0,0)],self.hv_distance(),conv,self.segments)
         if skipnan:
             slope[np.where(~np.isfinite(slope))]=0.0
         return slope
 
-    def hv_nearest(self, lat, lon):
-        d=np.zeros(self.get_row_count())
-        for i in xrange(0,self.get_row_count()):
-            lat1, lon1 = lat,lon
-            lat2, lon2 = self['lat'][i],self['lon'][i]
-            dlat = math.radians(lat2-lat1)
-            dlon = math.radians(lon2-lon1)
-            radius = 6371000    #meters
-            a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) \
-                * math.cos(math.radians(lat2)) * math.sin(dlon/2) * math.sin(dlon/2)
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-            d[i] = radius * c
-        return np.argmin(d)
+    def get_spatial_index(self):
+        # built on first query, and again after lat or lon were modified
+        # when only rows after the grid were written (live tracking), they are added to its tail instead
+        stamp=(self.get_version('lat'),self.get_version('lon'))
+        if self.spatialstamp!=stamp:
+            index=self.spatialindex
+            rows=self.changed_rows(['lat','lon'],self.spatialstamp) if index!=None else None
+            n=self.get_row_count()
+            lo=None if rows==None else min(rows[0],len(index.x)) if rows[0]<rows[1] else len(index.x)
+            if lo!=None and lo>=index.indexed and len(index.x)<=n<=index.indexed+max(tail_rows,index.indexed//4):
+                index.extend(self.d['lat'],self.d['lon'],lo)
+            else:
+                self.spatialindex=SpatialIndex(self.d['lat'],self.d['lon'])
+            self.spatialstamp=stamp
+        return self.spatialindex
+
+    def get_time_index(self):
+        # gpx.get_time_index().range(t0,t1): rows between times t0 and t1 (datetime64, text or datetime)
+        stamp=self.get_version('time')
+        if self.timeindexstamp!=stamp:
+            self.timeindex=TimeIndex(self.d['time'])
+            self.timeindexstamp=stamp
+        return self.timeindex
+
+    def get_simplify_rank(self):
+        # Douglas-Peucker rank (m) of each point (see douglas_peucker_rank()), computed on first use
+        # and again after lat, lon or segments were modified. rows written after the first simplifyfrozen
+        # (new points of a live track) are ranked again on their own, as a line which is frozen once it
+        # holds tail_rows points
+        index=self.get_spatial_index()
+        stamp=(self.get_version('lat'),self.get_version('lon'))
+        if self.simplifystamp!=stamp or not np.array_equal(self.simplifysegments,self.segments):
+            n=self.get_row_count()
+            lo=0
+            if self.simplifystamp!=None:
+                rows=self.changed_rows(['lat','lon'],self.simplifystamp)
+                frozen,old=self.simplifyfrozen,self.simplifysegments
+                if rows!=None and (rows[0]>=rows[1] or rows[0]>=frozen) and n>=frozen and \
+                        np.array_equal(old[old<frozen],self.segments[self.segments<frozen]):
+                    lo=frozen
+            self.simplifybuf=grown(self.simplifybuf if lo>0 else np.zeros(0),n)
+            starts=np.union1d([0],self.segments[self.segments>=lo]-lo)
+            self.simplifybuf[lo:n]=douglas_peucker_rank(index.x[lo:n],index.y[lo:n],starts)
+            self.simplifyrank=self.simplifybuf[:n]
+            self.simplifyfrozen=n if n-lo>=tail_rows else lo
+            self.simplifystamp=stamp
+            self.simplifysegments=self.segments.copy()
+        return self.simplifyrank
+
+    def simplify(self,tolerance,okonly=False):
+        # indices of the points needed to draw the track within tolerance (m). no computation per call
+        keep=self.get_simplify_rank()>tolerance
+        if okonly:
+            keep&=np.asarray(self.d['ok'])
+        return np.flatnonzero(keep)
+
+    def hv_nearest(self,lat,lon,okonly=False):
+        # index of the point nearest to (lat,lon). None if there is no (enabled) point
+        found=self.hv_knearest(lat,lon,1,okonly)
+        return found[0] if len(found)>0 else None
+
+    def hv_knearest(self,lat,lon,k,okonly=False):
+        # indices of the k points nearest to (lat,lon), nearest first
+        return self.get_spatial_index().nearest(lat,lon,k,np.asarray(self['ok']) if okonly else None)
+
+    def hv_within(self,lat,lon,radius,okonly=False):
+        # indices of points closer than radius (m) from (lat,lon)
+        return self.get_spatial_index().within(lat,lon,radius,np.asarray(self['ok']) if okonly else None)
+
+    def hv_bbox(self,lat1,lon1,lat2,lon2,margin=0.0,okonly=False):
+        # indices of points within a lat/lon box, extended by margin (m)
+        return self.get_spatial_index().bbox(lat1,lon1,lat2,lon2,margin,np.asarray(self['ok']) if okonly else None)
 
     def hv_pace(self,dist,ahead=False):
         d=np.cumsum(self.hv_distance())
@@ -415,11 +2520,199 @@ class GpxObj:
                     pass
         return r
 
+    def clean(self,max_speed=None,max_accel=None,max_turn_rate=None,hdop_limit=None,apply=True):
+        # disables GPS spikes: enabled points with hdop over hdop_limit, then the ones which break max_speed (m/s),
+        # max_accel (m/s2) or max_turn_rate (deg/s) when their neighbours would not without them (see SpikeCleaner).
+        # returns (ok,report): the resulting ok mask, and {'rows':disabled rows, 'candidates':points looked at,
+        # 'hdop','speed','accel','turn':number of points disabled for each reason}. the track is only
+        # changed if apply is True (undoable)
+        ok=np.array(self['ok'],dtype='bool')
+        report={'rows':np.zeros(0,dtype='int'),'candidates':0,'hdop':0,'speed':0,'accel':0,'turn':0}
+        if hdop_limit!=None and self.has_field('hdop'):
+            noisy=ok&(np.asarray(self['hdop'],dtype='float')>hdop_limit)
+            report['hdop']=int(noisy.sum())
+            ok&=~noisy
+        if (max_speed,max_accel,max_turn_rate)!=(None,None,None):
+            t=np.asarray(self['time'],dtype='M8[ns]').view('int64')
+            rows=np.flatnonzero(ok&(t!=np.iinfo('int64').min))
+            if len(rows)>0:
+                seg=np.searchsorted(self.segments,rows,'right')
+                cleaner=SpikeCleaner(np.asarray(self['lat'])[rows],np.asarray(self['lon'])[rows],(t[rows]-t[rows[0]])/1e9,
+                                     np.flatnonzero(np.concatenate(([True],seg[1:]!=seg[:-1]))),
+                                     max_speed,max_accel,max_turn_rate)
+                candidates=cleaner.candidates()
+                report['candidates']=len(candidates)
+                for k,reason in cleaner.run(candidates).items():
+                    ok[rows[k]]=False
+                    report[reason]+=1
+        report['rows']=np.flatnonzero(np.asarray(self['ok'],dtype='bool')&~ok)
+        if apply:
+            self.set_ok(report['rows'],False)
+        return ok,report
+
+    ## time rollups
+    # min, max, sum and count of enabled points per 1, 10, 60 and 600 s bucket (see Rollup): statistics of a
+    # range of rows read a few thousand buckets instead of all points
+    def get_rollup(self,key):
+        # built on first use, then updated for the rows written since (from the first row whose time was
+        # written to the end). raises ValueError if points are not in time order
+        self.refresh(key)
+        keys=['time','ok',key]
+        stamp=tuple(self.get_version(k) for k in keys)
+        entry=self.rollups.get(key)
+        if entry==None or entry[1]!=stamp:
+            rows=self.changed_rows(keys,entry[1]) if entry!=None else None
+            timerows=self.changed_rows(['time'],entry[1][:1]) if entry!=None else None
+            if rows==None or timerows==None:
+                rollup=Rollup(self.d[key],self.d['ok'],self.d['time'])
+            else:
+                rollup=entry[0]
+                if timerows[0]<timerows[1]:
+                    rollup.update(self.d[key],self.d['ok'],self.d['time'],min(rows[0],timerows[0]))
+                elif rows[0]<rows[1]:
+                    rollup.update(self.d[key],self.d['ok'],self.d['time'],rows[0],rows[1],retime=False)
+            self.rollups[key]=(rollup,stamp)
+        return self.rollups[key][0]
+
+    def build_rollups(self,keys=None):
+        # rollups of keys (numeric columns read from file by default, derived ones are rolled up when first
+        # used), all with the buckets of the first one
+        if keys==None:
+            keys=[k for k in self.get_header_names() if self.is_numeric(k) and k!='idx' and not self.is_derived(k)]
+        first=None
+        for key in keys:
+            if first==None or key in self.rollups:
+                first=self.get_rollup(key)
+            else:
+                self.refresh(key)
+                self.rollups[key]=(Rollup.like(first,self.d[key],self.d['ok']),tuple(self.get_version(k) for k in ['time','ok',key]))
+
+    def range_stats(self,key,lo=0,hi=None,scaled=False):
+        # (min,max,sum,count) of the enabled, finite values of rows lo..hi-1, from rollups when points have times
+        hi=self.get_row_count() if hi==None else hi
+        try:
+            stats=self.get_rollup(key).summary(self.d[key],self.d['ok'],lo,hi)
+        except (KeyError,ValueError):
+            # no time, or points not in time order
+            s=reduce_buckets(self[key],self.d['ok'],np.array([lo]),hi) if hi>lo else {'min':[np.nan],'max':[np.nan],'sum':[0.0],'count':[0]}
+            stats=(s['min'][0],s['max'][0],s['sum'][0],s['count'][0])
+        if scaled:
+            scale=self.get_scale(key)
+            lo,hi=stats[0]*scale,stats[1]*scale
+            stats=(min(lo,hi),max(lo,hi),stats[2]*scale,stats[3])
+        return stats
+
+    def is_numeric(self,key):
+        return self.d[key].dtype.kind in 'fiu' and not isinstance(self.d[key],Categorical)
+
+    def rollup_fingerprint(self):
+        return np.array([self.get_row_count(),zlib.crc32(np.ascontiguousarray(self.d['time'])),zlib.crc32(np.ascontiguousarray(self.d['ok']))])
+
+    def save_rollups(self,filename,keys=None):
+        # rollups of keys (all numeric columns by default) in a npz file, to be read back with the same points
+        if keys==None:
+            keys=[k for k in self.get_header_names() if k!='idx']
+        keys=[k for k in keys if self.is_numeric(k)]
+        self.build_rollups(keys)
+        arrays={'fingerprint':self.rollup_fingerprint(),'keys':np.array(keys),'periods':np.array(rollup_periods)}
+        for key in keys:
+            rollup=self.get_rollup(key)
+            for p in rollup.periods:
+                for name,values in rollup.levels[p].items():
+                    arrays['%s|%d|%s'%(key,p,name)]=values
+        np.savez(filename,**arrays)
+
+    def load_rollups(self,filename):
+        # rollups saved by save_rollups(), if they were computed from the same points (same times and ok)
+        saved=np.load(filename)
+        if not np.array_equal(saved['fingerprint'],self.rollup_fingerprint()):
+            return False
+        periods=list(saved['periods'])
+        for key in saved['keys']:
+            if self.has_field(key):
+                rollup=Rollup(periods=periods)
+                for p in periods:
+                    rollup.levels[p]=dict((name,saved['%s|%d|%s'%(key,p,name)]) for name in ('id','start','min','max','sum','count'))
+                rollup.rows=self.get_row_count()
+                self.rollups[key]=(rollup,tuple(self.get_version(k) for k in ['time','ok',key]))
+        return True
+
+    def rolling(self,key,seconds=10.0,center=False,scaled=False):
+        # time windows over column key: gpx.rolling('speed',10).mean() (or sum, count, std, max, min)
+        if self.get_time_index().order is not None:
+            raise ValueError("rolling windows need points in time order")
+        return Rolling(self[(key,scaled)],self.d['time'],seconds,self.segments,center)
+
+    def resample(self,period=1.0,method='linear'):
+        # new GpxObj with one point every period seconds, from the first to the last point of each segment.
+        # numeric columns are interpolated (method='linear', angles along the shortest arc, see circular)
+        # or take the value of the nearest point (method='nearest', always used for other columns).
+        # computed columns (speed, distance...) are computed again from resampled lat, lon and time
+        index=self.get_time_index()
+        times=index.times
+        rows=index.rows(np.arange(len(times)))
+        if len(times)==0:
+            starts=np.zeros(0,dtype='int')
+        elif index.order is None:
+            starts=self.segments
+        else:
+            starts=np.zeros(1,dtype='int')                  # points were not in time order: segments are lost
+        ends=np.append(starts[1:],len(times))-1
+        # grid times, and surrounding points (k, k1) of each grid point within its segment
+        step=int(round(period*1e9))
+        count=(times[ends]-times[starts])//step+1
+        offsets=np.cumsum(count)-count
+        seg=np.repeat(np.arange(len(starts)),count)
+        grid=times[starts][seg]+(np.arange(count.sum())-offsets[seg])*step
+        k=np.clip(np.searchsorted(times,grid,'right')-1,starts[seg],np.maximum(ends[seg]-1,starts[seg]))
+        k1=np.minimum(k+1,ends[seg])
+        span=(times[k1]-times[k]).astype('float64')
+        frac=np.zeros(len(grid))
+        np.divide((grid-times[k]).astype('float64'),span,out=frac,where=span>0)
+        a,b,nearest=rows[k],rows[k1],rows[np.where(frac<0.5,k,k1)]
+        gpx=GpxObj()
+        gpx.filename=getattr(self,'filename',None)
+        gpx.cachedir=self.cachedir
+        gpx.precision=dict(self.precision)
+        gpx.d=ColumnStore(len(grid),self.cachedir)
+        for key in self.get_header_names():
+            if key in self.recipes:
+                continue
+            col=np.asarray(self.d[key])
+            if key=='time':
+                values=grid.view('M8[ns]')
+            elif method=='linear' and col.dtype.kind=='f' and key in circular:
+                values=np.mod(col[a]+(np.mod(col[b]-col[a]+180,360)-180)*frac,360)
+            elif method=='linear' and col.dtype.kind=='f':
+                values=col[a]+(col[b]-col[a])*frac
+            else:
+                values=categorical_like(self.d[key],col[nearest])
+            gpx.d.append(key,'category' if isinstance(values,Categorical) else col.dtype,values)
+        gpx.segments=np.asarray(offsets,dtype='int') if len(offsets) else np.zeros(1,dtype='int')
+        if len(self.recipes):
+            gpx.derive_standard_columns()
+        for key in self.get_header_names():
+            if not gpx.has_field(key):                     # derived by other means: interpolated values
+                col=np.asarray(self[key])
+                gpx.d.append(key,col.dtype,col[a]+(col[b]-col[a])*frac if col.dtype.kind=='f' else col[nearest])
+        gpx.unit=dict(self.unit)
+        gpx.scale=dict(self.scale)
+        gpx.clear_journal()
+        return gpx
+
     def sort_asc(self,key):
         self.d=self[self[key].argsort()]
+        self.recipes={}                             # columns of a sorted table are plain data
+        self.derivedstamp={}
+        self.segments=np.zeros(1,dtype='int')
+        self.clear_journal()
 
     def sort_desc(self,key):
         self.d=self[self[key].argsort()][::-1]
+        self.recipes={}
+        self.derivedstamp={}
+        self.segments=np.zeros(1,dtype='int')
+        self.clear_journal()
         # as explained below
         # data[:,n] -- get entire column of index n
         # argsort() -- get the indices that would sort it
@@ -432,7 +2725,7 @@ class GpxObj:
         #sort array, in descending order ("[::-1]) and return the first n ([5:])
 
     def ok(self):
-        return np.where(self['ok']==True)
+        return (self.get_ok_index(),)
 
     def discard(self):
         return np.where(self['ok']==False)
@@ -441,29 +2734,31 @@ class GpxObj:
         #quick hack as nanmean gives inmprobable results
         return np.ma.masked_invalid(a).mean()
 
-    def open_fit(self,filename):
+    def open_fit(self,filename,maxpoints=None):
+        # maxpoints: preview of a large file (see open_gpx())
         self.filename=filename
         a = Activity(filename)
         a.parse()
         records = list(a.get_records_by_type('record'))
+        self.stride=preview_stride(len(records),maxpoints)
+        records=records[::self.stride]
         row= len(records)
         if row!=0:
             keys=[]
-            self.d=np.ones(row,dtype={'names':['ok'],'formats':['bool']})
+            self.d=ColumnStore(row,self.cachedir)
+            self.d.append('ok','bool',np.ones(row,dtype='bool'))
             for field in records[0].fields:
                 if field.type.name=='date_time':
-                    keys.append((field.name,'a20'))
+                    keys.append((field.name,'M8[ns]'))
                 else:
                     keys.append((field.name,'float'))
             for key,typ in (keys):
-                self.d=npr.rec_append_fields(self.d,key,np.zeros(row),typ)
-                self.scale[key]=1.0
-                self.unit[key]="SI"
+                self.append_column(key,typ)
         idx=0;
-        for r in a.get_records_by_type('record'):
+        for r in records:
             for f in r.fields:
                 if f.type.name=='date_time':
-                    self.d[f.name][idx]=f.data.isoformat()+'Z'
+                    self.d[f.name][idx]=np.datetime64(f.data,'ns')
                 else:
                     self.d[f.name][idx]=float(f.data)
             idx+=1
@@ -474,10 +2769,32 @@ class GpxObj:
         self.move_column('position_long','lon')
         self.move_column('altitude','ele')
         self.move_column('timestamp','time')
+        # a new segment starts at the first record following each timer restart
+        events=[e for e in a.get_records_by_type('event') if e.get_data('event')=='timer' and e.get_data('timestamp')!=None]
+        restarts=[np.datetime64(e.get_data('timestamp'),'ns') for e,previous in zip(events[1:],events[:-1])
+                        if e.get_data('event_type')=='start' and previous.get_data('event_type')!='start']
+        self.set_segments(np.searchsorted(np.asarray(self.d['time']),np.array(restarts,dtype='M8[ns]')))
         self.append_column('idx','int')
-        self['idx']=np.arange(self.get_row_count())
+        self['idx']=np.arange(self.get_row_count())*self.stride
+        self.clear_journal()
 
-    def save_xml(self,filename,fields=None,indices=None):
+    def adopt(self,other):
+        # takes the points of other, the same track at full resolution loaded while this preview was shown.
+        # widgets holding this object see the new points at once (after ValChanged). units, scales and
+        # derived columns of the preview are kept, edits of the preview are not
+        old,unit,scale,recipes=self.d,self.unit,self.scale,self.recipes
+        self.__dict__.update(other.__dict__)
+        for key in recipes:
+            if not self.has_field(key):
+                self.d.append(key,'category' if isinstance(old[key],Categorical) else old[key].dtype)
+        self.recipes=recipes
+        self.derivedstamp=dict((key,None) for key in recipes)
+        for key in unit:
+            if self.has_field(key):
+                self.unit[key],self.scale[key]=unit[key],scale[key]
+        old.cleanup()
+
+    def save_xml(self,filename,fields=None,indices=None,tolerance=None):
         # todo: in order to be gpx compliant, any data other than ele, time, speed, course, geoidheight, hdop, vdop, pdop, magmar, sat,...
         # should be embedded in an xml tag
         # see http://www.topografix.com/gpx_manual.asp to get a full list of allowed optional info for trkpt
@@ -494,6 +2811,14 @@ class GpxObj:
             fields=self.get_header_names()
         if indices==None:
             indices=range(0,self.get_row_count())
+        if tolerance:
+            # simplify on export: only the points needed to keep the track within tolerance (m)
+            indices=np.asarray(indices,dtype='int')
+            indices=indices[self.get_simplify_rank()[indices]>tolerance]
+        for h in fields:
+            self.refresh(h)
+        # datetime columns are converted to text once
+        text=dict((h,format_iso8601(self.d[h])) for h in self.get_header_names() if self.d[h].dtype.kind=='M')
         optional='name|desc|url|urlname|time|course|speed|ele|magvar|geoidheight|cmt|src|sym|type|fix|sat|hdop|vdop|pdop|ageofdgpsdata|dgpsid'.split('|')
         #extensions='hr|pwr|power|distance|cad|atemp|wtemp|cal'
         # remove fields which are automatically generated when a file is opened, as well as lat and lon which are properties and not elements
@@ -501,26 +2826,150 @@ class GpxObj:
         if 'idx' in fields: fields.remove('idx')
         if 'lat' in fields: fields.remove('lat')
         if 'lon' in fields: fields.remove('lon')
+        # a trkseg is closed before each exported point which starts a new segment
+        segid=self.get_segment_ids()[indices]
+        newseg=np.concatenate(([False],segid[1:]!=segid[:-1]))
         header = '''<?xml version="1.0" encoding="UTF-8"?>\n<gpx version="1.0"\n\tcreator="wxgpgpsport"\n\txmlns="http://www.topografix.com/GPX/1/0"\n\txmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n<trk>\n<trkseg\n>\n'''
         footer='''</trkseg>\n</trk>\n</gpx>'''
         f=open(filename,'w')
         f.write(header)
         print fields
-        for idx in indices:
+        for n,idx in enumerate(indices):
+            if newseg[n]:
+                f.write('</trkseg>\n<trkseg>\n')
             f.write('<trkpt lat="{}" lon="{}">\n'.format(self.d['lat'][idx],self.d['lon'][idx]))
             # two passes are required, first for optional params, then for extra params that should be treadted as an extension
             # optional parameters
             for h in fields:
                 if h in self.get_header_names() and h in optional:
-                    f.write('<{}>{}</{}>\n'.format(h,self.d[h][idx],h))
+                    f.write('<{}>{}</{}>\n'.format(h,text[h][idx] if h in text else self.d[h][idx],h))
             # extensions
             if len (set(fields)-set(optional))>0:
                 f.write('<extensions>\n<gpxtpx:TrackPointExtension>\n')
                 for h in fields:
                     if h in self.get_header_names() and h not in optional:
-                        f.write('<{}>{}</{}>\n'.format('gpxtpx:'+h,self.d[h][idx],'gpxtpx:'+h))
+                        f.write('<{}>{}</{}>\n'.format('gpxtpx:'+h,text[h][idx] if h in text else self.d[h][idx],'gpxtpx:'+h))
                 f.write('</gpxtpx:TrackPointExtension>\n</extensions>\n')
             f.write('</trkpt>\n')
         f.write(footer)
         f.close()
 
+
+class GpxCollection:
+    # several activities (files) in a single ColumnStore, one after the other: rows of activity i are
+    # offsets[i]:offsets[i+1]. queries over a whole season are then single numpy passes, for example
+    # total distance above 10 kts per activity: season.sum('deltaxy',season['speed']>5.144)
+    def __init__(self,cachedir=None):
+        self.names=[]
+        self.offsets=np.zeros(1,dtype='int')
+        self.segments=np.zeros(1,dtype='int')       # segments of all activities (each activity starts one)
+        self.cachedir=cachedir
+        self.d=ColumnStore(0,cachedir)
+
+    def __getitem__(self,key):
+        # gpx['key'] for all activities, (key,i) for activity i
+        if isinstance(key,tuple):
+            return self.d[key[0]][self.offsets[key[1]]:self.offsets[key[1]+1]]
+        return self.d[key]
+
+    def open(self,filenames,keys=None):
+        # reads files (gpx, fit or npz). widgets are not involved, and columns are concatenated once
+        gpxs=[]
+        for filename in filenames:
+            gpx=GpxObj()
+            gpx.set_cachedir(self.cachedir)
+            if filename[-4:].lower()=='.fit':
+                gpx.open_fit(filename)
+            elif filename[-4:].lower()=='.npz':
+                gpx.open_npz(filename)
+            else:
+                gpx.open_gpx(filename)
+            gpx.derive_standard_columns()
+            gpxs.append(gpx)
+        self.append(gpxs,filenames,keys)
+
+    def append(self,gpxs,names=None,keys=None):
+        # appends activities (GpxObj). keys defaults to all columns found in any activity, values
+        # missing in an activity are nan (NaT for times, 0 for integers)
+        if names==None:
+            names=[gpx.filename for gpx in gpxs]
+        parts=[]
+        if self.get_row_count()>0:
+            parts.append((list(self.d.names),dict((k,self.d[k]) for k in self.d.names),self.get_row_count(),self.segments))
+        for gpx in gpxs:
+            parts.append((gpx.get_header_names(),dict((k,gpx[k]) for k in gpx.get_header_names()),gpx.get_row_count(),gpx.segments))
+        if keys==None:
+            keys=[]
+            for (header,cols,n,segments) in parts:
+                keys+=[k for k in header if not k in keys]
+        rows=[n for (header,cols,n,segments) in parts]
+        store=ColumnStore(sum(rows),self.cachedir)
+        for key in keys:
+            if any(isinstance(cols.get(key),Categorical) for (header,cols,n,segments) in parts):
+                store.append(key,'category',np.concatenate([cols[key].decode() if isinstance(cols[key],Categorical) else np.asarray(cols[key])
+                                                        if key in cols else np.full(n,'',dtype='S1') for (header,cols,n,segments) in parts]))
+                continue
+            typ=np.result_type(*[cols[key].dtype for (header,cols,n,segments) in parts if key in cols])
+            missing=np.nan if typ.kind=='f' else np.datetime64('NaT') if typ.kind=='M' else 0
+            store.append(key,typ,np.concatenate([np.asarray(cols[key],dtype=typ) if key in cols else np.full(n,missing,dtype=typ)
+                                                        for (header,cols,n,segments) in parts]))
+        starts=np.cumsum([0]+rows)
+        self.segments=np.concatenate([segments+start for (header,cols,n,segments),start in zip(parts,starts)])
+        self.offsets=np.append(self.offsets[:-1],self.offsets[-1]+np.cumsum([0]+[gpx.get_row_count() for gpx in gpxs]))
+        self.names+=list(names)
+        self.d=store
+
+    def get_row_count(self):
+        return self.d.rows
+
+    def get_activity_count(self):
+        return len(self.offsets)-1
+
+    def get_activity_ids(self):
+        # activity number of each row
+        ids=np.zeros(self.get_row_count(),dtype='int')
+        ids[self.offsets[1:-1]]=1
+        return np.cumsum(ids)
+
+    def reduceat(self,values,ufunc=np.add,where=None,empty=0):
+        # ufunc reduction of values (array or key) over the rows of each activity, in one pass.
+        # rows where where is False count as empty, activities without rows give empty
+        if isinstance(values,basestring):
+            values=self.d[values]
+        values=np.asarray(values)
+        if where is not None:
+            values=np.where(where,values,empty)
+        r=np.full(self.get_activity_count(),empty,dtype=np.result_type(values,empty))
+        filled=np.diff(self.offsets)>0
+        if filled.any():
+            r[filled]=ufunc.reduceat(values,self.offsets[:-1][filled])
+        return r
+
+    def sum(self,key,where=None):
+        return self.reduceat(key,np.add,where)
+
+    def count(self,where=None):
+        if where is None:
+            return np.diff(self.offsets)
+        return self.reduceat(np.asarray(where,dtype='int'),np.add)
+
+    def mean(self,key,where=None):
+        with np.errstate(invalid='ignore',divide='ignore'):
+            return self.sum(key,where)/self.count(where)
+
+    def best_run(self,dist):
+        # speed (m/s) of the run of at least dist meters starting at each point, without crossing a
+        # segment or activity gap (nan when there is none). season best: np.nanargmax(season.best_run(500))
+        d=np.cumsum(self.d['deltaxy'])
+        t=np.cumsum(self.d['deltat'])
+        stop=np.searchsorted(d,d+dist)
+        valid=stop<self.get_row_count()
+        stop=np.minimum(stop,self.get_row_count()-1)
+        segid=np.zeros(self.get_row_count(),dtype='int')
+        segid[self.segments[1:]]=1
+        segid=np.cumsum(segid)
+        valid&=segid[stop]==segid
+        with np.errstate(invalid='ignore',divide='ignore'):
+            r=(d[stop]-d)/(t[stop]-t)
+        r[~valid]=np.nan
+        return r
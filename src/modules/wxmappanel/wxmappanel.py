@@ -328,8 +328,9 @@ class WxGLArtist(glcanvas.GLCanvas):
         glDrawArrays (GL_LINES, 0, len(vertices))
         glDeleteBuffers(1, GLuint(vbo))
         
-    def RGBALines(self,vertices):
+    def RGBALines(self,vertices,first=None,count=None):
         #we suppose taht vertices is an array [x,y,r,g,b,a,...]
+        #if given, first and count are the first vertex and number of vertices of each strip
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         glPolygonMode(GL_FRONT, GL_LINE)
@@ -346,7 +347,10 @@ class WxGLArtist(glcanvas.GLCanvas):
         glVertexPointer (2, GL_FLOAT, 6*4, ctypes.c_void_p(0*4))                            #size,type,stride,pointer to first vertex
         glColorPointer (4,GL_FLOAT,6*4,ctypes.c_void_p(2*4))
         glLineWidth(self.pensize)
-        glDrawArrays (GL_LINE_STRIP, 0, len(vertices)/6)
+        if first is None:
+            glDrawArrays (GL_LINE_STRIP, 0, len(vertices)/6)
+        else:
+            glMultiDrawArrays (GL_LINE_STRIP, first, count, len(first))     #all strips in a single call
         glDeleteBuffers(1, GLuint(vbo))
 
     def Rect(self,l,t,r,b):
@@ -622,10 +626,13 @@ class WxDCArtist(wx.Panel):
         for i in range(0,len(vertices)/4):
             dc.DrawLine(vertices[4*i],vertices[4*i+1],vertices[4*i+2],vertices[4*i+3])
 
-    def RGBALines(self,vertices):
+    def RGBALines(self,vertices,first=None,count=None):
         dc=wx.GCDC(wx.MemoryDC(self._curbuffer))
         self._preparedc(dc)
+        breaks=set(first[1:]) if first is not None else set()
         for i in xrange(0,len(vertices)/6-1):
+                if i+1 in breaks:
+                    continue                        # no line toward the first vertex of a strip
                 dc.SetPen(wx.Pen(wx.Colour(vertices[i*6+2]*255,vertices[i*6+3]*255,vertices[i*6+4]*255,vertices[i*6+5]*255),self.pensize))
                 dc.DrawLine(vertices[6*i],vertices[6*i+1],vertices[6*(i+1)],vertices[6*(i+1)+1])
 
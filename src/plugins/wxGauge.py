@@ -54,7 +54,7 @@ class WxGauge(wx.Panel):
         pub.subscribe(self.OnSigValChanged, "ValChanged")
             
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         #high=math.ceil(np.percentile(self.gpx[(self.key,1,1)],90))
         #low=math.ceil(np.percentile(self.gpx[(self.key,1,1)],25))
         #self.peakmeter.SetRangeValue(low,high,math.ceil(self.gpx[(self.key,1,1)].max()))
@@ -68,7 +68,7 @@ class WxGauge(wx.Panel):
         #                             math.ceil(self.gpx[(self.key,1,1)].max()))
 
     def DetachGpx(self):
-        pass
+        self.gpx=None
         
     def OnSigSelChanged(self,arg1,arg2,arg3):
         if arg1==self.id:
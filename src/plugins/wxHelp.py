@@ -59,7 +59,7 @@ class WxHelp(wx.Panel):
         pub.subscribe(self.OnSigValChanged, "ValChanged")
 
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
 
     def DetachGpx(self):
         self.gpx=None
@@ -86,8 +86,9 @@ class WxHistogram(wx.Panel):
                         'orientation':'vertical'}
     
     def Plot(self,lo=None,hi=None,bins=50,xrange=None,yrange=None):
-        self.lo=min(self.gpx[(self.barsrc,1,1)]) if lo==None else lo
-        self.hi=max(self.gpx[(self.barsrc,1,1)]) if hi==None else hi
+        (low,high,total,count)=self.gpx.range_stats(self.barsrc,scaled=True)
+        self.lo=low if lo==None else lo
+        self.hi=high if hi==None else hi
         hist, bins = np.histogram(self.gpx[(self.barsrc,1,1)],self.barbins,(self.lo,self.hi))
         width = 0.7 * (bins[1] - bins[0])
         center = (bins[:-1] + bins[1:]) / 2
@@ -104,12 +105,13 @@ class WxHistogram(wx.Panel):
         self.OnSize(None)
         
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         self.Plot()
         self.OnSize(None)
         
     def DetachGpx(self):
         self.gpx=None
+        self.ax.cla()
         
     def OnSigSelChanged(self,arg1,arg2,arg3):
         if arg1==self.id:
@@ -167,8 +169,8 @@ class WxHistogram(wx.Panel):
                  ('wxcheck','Show Grid',None,self.grid,'bool'),
                  ('wxnotebook','Histogram',None,None,None),
                  ('wxcombo','Category',self.XAxisAllowed(),self.barsrc,'str'),
-                 ('wxcombo','Start',str(self.lo)+'|'+str(min(self.gpx[(self.barsrc,1,1)])),str(self.lo),'float'),
-                 ('wxcombo','End',str(self.hi)+'|'+str(max(self.gpx[(self.barsrc,1,1)])),str(self.hi),'float'),
+                 ('wxcombo','Start',str(self.lo)+'|'+str(self.gpx.range_stats(self.barsrc,scaled=True)[0]),str(self.lo),'float'),
+                 ('wxcombo','End',str(self.hi)+'|'+str(self.gpx.range_stats(self.barsrc,scaled=True)[1]),str(self.hi),'float'),
                  ('wxspin','Number of bars','10|100|1',self.barbins,'int'),
                  ('wxcolor','Color',None,self.kwargs['color'],'str'),
                  ('wxentry','Extra arguments',None,{},'str')
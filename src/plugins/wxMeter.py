@@ -65,7 +65,7 @@ class WxMeter(wx.Panel):
         pub.subscribe(self.OnSigValChanged, "ValChanged")
             
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         step=int(math.ceil(self.gpx[(self.key,1,1)].max()/10))
         self.speedmeter.SetIntervals(range(0, step*10+1, step))
         self.speedmeter.SetTicks([str(interval) for interval in range(0, step*10+1, step)])
@@ -73,7 +73,7 @@ class WxMeter(wx.Panel):
         self.speedmeter.SetMiddleText(self.gpx.get_unit(self.key)[0])
 
     def DetachGpx(self):
-        pass
+        self.gpx=None
         
     def OnSigSelChanged(self,arg1,arg2,arg3):
         if arg1==self.id:
@@ -99,12 +99,14 @@ class WxScatter(wx.Panel):
         self.OnSize(None)
 
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         self.Plot()
         self.OnSize(None)
 
     def DetachGpx(self):
         self.gpx=None
+        self.ax.cla()
+        self.ax.set_theta_zero_location("N")
 
     def OnSigSelChanged(self,arg1,arg2,arg3):
         if arg1==self.id:
@@ -106,7 +106,7 @@ class WxShell(wx.Panel):
         self.scriptcombo.SetValue(self.lastscript)
 
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         self.Link()
         # self.pyshell.interp.locals={'gpx' : self.gpx,\
                                     # 'mapview':self.mapwidget,\
@@ -138,6 +138,7 @@ class WxShell(wx.Panel):
 
     def DetachGpx(self):
         self.gpx=None
+        self.pyshell.interp.locals['gpx']=None
 
     def OnRunButtonClicked(self,event):
         if self.scriptcombo.GetValue().endswith("py"):
@@ -53,28 +53,30 @@ class WxStatistics(wx.Panel):
         
     def Statistics(self):
         #todo: return if no point is selected
-        if len(np.where(self.gpx['ok']==True))==0:
+        if len(self.gpx.get_ok_index())==0:
             return
         self.text.Clear()
         self.text.AppendText("Statistics:\n")
         # distance
         # we use unscaled deltaxy and we scale later with 'distance' scale, which may differ from deltaxy
         self.text.AppendText("Distance: ")
-        distance=self.gpx.get_scale('distance')*np.sum(self.gpx[('deltaxy',0,1)])
+        # sums, means and maxima are read from time rollups (see gpx.range_stats)
+        distance=self.gpx.get_scale('distance')*self.gpx.range_stats('deltaxy')[2]
         self.text.AppendText(str(distance))
         self.text.AppendText(" "+self.gpx.get_unit('distance')[0]+"\n")
         # average and max speed
-        self.text.AppendText("Average Speed: "+str(self.gpx.nanmean(self.gpx[('speed',1,1)]))+" "+self.gpx.get_unit('speed')[0]+"\n")
-        self.text.AppendText("Max Speed: "+str(self.gpx[('speed',1,1)].max())+" "+self.gpx.get_unit('speed')[0]+"\n")
+        (low,high,total,count)=self.gpx.range_stats('speed',scaled=True)
+        self.text.AppendText("Average Speed: "+str(total/count if count else np.nan)+" "+self.gpx.get_unit('speed')[0]+"\n")
+        self.text.AppendText("Max Speed: "+str(high)+" "+self.gpx.get_unit('speed')[0]+"\n")
         # duration
-        total=np.sum(self.gpx[('deltat',0,1)])
+        total=self.gpx.range_stats('deltat')[2]
         self.text.AppendText("Total Time: "+str(datetime.timedelta(seconds=total))+" - ("+str(total)+" s)\n")
         # todo: calculate 5xbest 5 s;5xbest 10s; 5xbest 30
-        self.text.AppendText("Best 5 measure average (" +self.gpx.get_unit('speed')[0]+"):\n")
-        a=(1.0)*np.convolve(self.gpx[('speed',1,0)], np.ones((5,))/5)[(5-1):]
+        self.text.AppendText("Best 5 s average (" +self.gpx.get_unit('speed')[0]+"):\n")
+        a=self.gpx.rolling('speed',5,scaled=True).mean()
         # a[a.argsort()[-10:]] will give you the last ten values after sorting the array
         # we need to modify it to retrieve only valid value
-        b=a[np.where(self.gpx['ok'])]
+        b=a[self.gpx.get_ok_index()]
         #top5=b[b[np.where(self.gpx['ok']==True)].argsort()[-5:]]
         top5=b[b.argsort()[-5::]]
         for idx in range(0,len(top5)):
@@ -92,7 +94,7 @@ class WxStatistics(wx.Panel):
         self.Refresh()
         
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         self.Statistics()
         
     def DetachGpx(self):
@@ -29,7 +29,7 @@ import gpxobj
 class WxGpxTable(wx.grid.PyGridTableBase):
     def __init__(self,gpx):
         wx.grid.PyGridTableBase.__init__(self)
-        self.gpx=gpx
+        self.gpx=gpxobj.weak(gpx)
         self._rows = self.GetNumberRows()
         self._cols = self.GetNumberCols()
         
@@ -42,16 +42,28 @@ class WxGpxTable(wx.grid.PyGridTableBase):
     def GetNumberCols(self):
         return self.gpx.get_col_count()
 
+    def GetKind(self, col):
+        # kind of the stored type ('f','i','u','b','M'), whatever its size (see gpx.set_precision()).
+        # text columns are stored as integer codes (see gpxobj.Categorical): 'S'
+        key=self.gpx.get_header_names()[col]
+        if isinstance(self.gpx.d[key],gpxobj.Categorical):
+            return 'S'
+        return self.gpx.d[key].dtype.kind
+
     def GetValue(self, row, col):
         try:
             if col > self.GetNumberCols():
                 raise IndexError
-            typ=self.gpx.get_header_types()[col]
+            kind=self.GetKind(col)
             key=self.gpx.get_header_names()[col]
-            if typ=='|b1':
+            if kind=='b':
                 return int(self.gpx[key][row])
-            elif typ=='<f8':
+            elif kind=='f':
                 return float(self.gpx[(key,1,0)][row])
+            elif kind in 'iu':
+                return int(self.gpx[key][row])
+            elif kind=='M':
+                return gpxobj.format_iso8601(self.gpx[key][row])
             else:
                 return str(self.gpx[key][row])
         except IndexError:
@@ -61,12 +73,12 @@ class WxGpxTable(wx.grid.PyGridTableBase):
         try:
             if col > self.GetNumberCols():
                 raise IndexError
-            typ=self.gpx.get_header_types()[col]
-            if typ=='|b1':
+            kind=self.GetKind(col)
+            if kind=='b':
                 return wx.grid.GRID_VALUE_BOOL
-            elif typ=='<f8':
+            elif kind=='f':
                 return wx.grid.GRID_VALUE_FLOAT
-            elif typ=='<i4':
+            elif kind in 'iu':
                 return wx.grid.GRID_VALUE_NUMBER
             else :
                 return wx.grid.GRID_VALUE_STRING
@@ -74,14 +86,18 @@ class WxGpxTable(wx.grid.PyGridTableBase):
             return None
         
     def SetValue(self, row,col,value):
-        typ=self.gpx.get_header_types()[col]
+        kind=self.GetKind(col)
         key=self.gpx.get_header_names()[col]
-        if typ=='|b1':
+        if kind=='b' and key=='ok':
+            self.gpx.set_ok([row],(value==True))
+        elif kind=='b':
             self.gpx[key][row]=(value==True)
-        elif typ=='<f8':
+        elif kind=='f':
             self.gpx[key][row]=float(value)/float(self.gpx.get_scale(key))
-        elif typ=='<i4':
+        elif kind in 'iu':
             self.gpx[key][row]=int(value)
+        elif kind=='M':
+            self.gpx[key][row]=gpxobj.parse_iso8601([value])[0]
         else:
             self.gpx[key][row]=str(value)
         
@@ -110,18 +126,16 @@ class WxGpxGrid(wx.grid.Grid):
         self.SetTable(self.gpxtable)
         self.SetDefaultCellOverflow(False)
         for col in range(0,gpx.get_col_count()-1):
-            typ=self.gpxtable.gpx.get_header_types()[col]
-            key=self.gpxtable.gpx.get_header_names()[col]
-            if typ=='|b1':
+            kind=self.gpxtable.GetKind(col)
+            if kind=='b':
                 self.SetColFormatBool(col)
                 attr = wx.grid.GridCellAttr()
                 attr.SetEditor(wx.grid.GridCellBoolEditor())
                 attr.SetRenderer(wx.grid.GridCellBoolRenderer())
                 self.SetColAttr(col,attr)
                 self.SetColSize(col,25)
-            else:
-                if key!='time':
-                    self.SetColFormatFloat(col,2,4)
+            elif kind=='f':
+                self.SetColFormatFloat(col,2,4)
         
     def DetachGpx(self):
         self.gpxtable=None
@@ -136,8 +150,7 @@ class WxGpxGrid(wx.grid.Grid):
     def OnLeftMouseDown(self,event):
         row=event.GetRow()
         col=event.GetCol()
-        typ=self.gpxtable.gpx.get_header_types()[col]
-        if typ=='|b1':
+        if self.gpxtable.GetKind(col)=='b':
             self.gpxtable.SetValue(row,col,not self.gpxtable.GetValue(row,col))
             self.ForceRefresh()
             #don't propagete event!
@@ -178,7 +191,8 @@ class WxGpxGrid(wx.grid.Grid):
                 return
             if not hasattr(self,"row_menu"):
                 self.row_menu = wx.Menu()
-                for text in ["Enable selected","Disable selected","Enable non selected", "Disable non selected","Toggle points"]:
+                for text in ["Enable selected","Disable selected","Enable non selected", "Disable non selected","Toggle points",\
+                             "Delete selected","Delete non selected"]:
                     item = self.row_menu.Append(-1, text)
                     self.Bind(wx.EVT_MENU, self.OnRowPopup, item)
             self.PopupMenu(self.row_menu)
@@ -211,17 +225,26 @@ class WxGpxGrid(wx.grid.Grid):
         item = self.row_menu.FindItemById(event.GetId())
         text = item.GetText()
         if text=='Enable selected':
-            self.gpxtable.gpx['ok'][self.GetSelectedRows()]=True
+            self.gpxtable.gpx.set_ok(self.GetSelectedRows(),True)
         if text=='Disable selected':
-            self.gpxtable.gpx['ok'][self.GetSelectedRows()]=False
+            self.gpxtable.gpx.set_ok(self.GetSelectedRows(),False)
         if text=='Enable non selected':
-            ns=list(set(range(self.gpxtable.gpx.get_row_count()))-set(self.GetSelectedRows()))
-            self.gpxtable.gpx['ok'][ns]=True
+            self.gpxtable.gpx.set_ok(np.invert(self.gpxtable.gpx.row_mask(self.GetSelectedRows())),True)
         if text=='Disable non selected':
-            ns=list(set(range(self.gpxtable.gpx.get_row_count()))-set(self.GetSelectedRows()))
-            self.gpxtable.gpx['ok'][ns]=False
+            self.gpxtable.gpx.set_ok(np.invert(self.gpxtable.gpx.row_mask(self.GetSelectedRows())),False)
         if text=='Toggle points':
-            self.gpxtable.gpx['ok']=np.invert(self.gpxtable.gpx['ok'])
+            self.gpxtable.gpx.set_ok(slice(None),np.invert(self.gpxtable.gpx['ok']))
+        if text in ['Delete selected','Delete non selected']:
+            dlg = wx.MessageDialog(None, "Delete Points...?",'Are you sure you want to delete these points',wx.YES_NO|wx.ICON_QUESTION)
+            if dlg.ShowModal()==wx.ID_YES:
+                mask=self.gpxtable.gpx.row_mask(self.GetSelectedRows())
+                if text=='Delete non selected':
+                    mask=np.invert(mask)
+                self.gpxtable.gpx.drop_rows(mask)
+                tmpgpx=self.gpxtable.gpx
+                self.DetachGpx()
+                self.AttachGpx(tmpgpx)
+            dlg.Destroy()
         self.ForceRefresh()
         pub.sendMessage("ValChanged",arg1=self.parent.id)
         
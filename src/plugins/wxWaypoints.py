@@ -32,9 +32,9 @@ from wxquery.wxquery import WxQuery
 def ccw(A,B,C):
     return (C[1]-A[1]) * (B[0]-A[0]) > (B[1]-A[1]) * (C[0]-A[0])
 
-# Return true if line segments AB and CD intersect
+# Return true if line segments AB and CD intersect (works on arrays of points too)
 def intersect(A,B,C,D):
-    return ccw(A,C,D) != ccw(B,C,D) and ccw(A,B,C) != ccw(A,B,D)
+    return (ccw(A,C,D) != ccw(B,C,D)) & (ccw(A,B,C) != ccw(A,B,D))
             
 class wxWaypointLayer(WxMapLayer):
     def __init__(self,parent,name):
@@ -229,10 +229,10 @@ class WxWaypoints(wx.Panel):
         pub.subscribe(self.OnSigValChanged, "ValChanged")
             
     def AttachGpx(self,data):
-        self.gpx=data
+        self.gpx=gpxobj.weak(data)
         
     def DetachGpx(self):
-        pass
+        self.gpx=None
 
     #not working on osx wx.TE_PROCESS_ENTER is ignored. a workaround is proposed below
     def OnTextEnter(self,event):
@@ -270,24 +270,35 @@ class WxWaypoints(wx.Panel):
             sect_door=[]
             sect_idx=[]
             segments=[]
-            for p in xrange(1,self.gpx.get_row_count()):
-                for d in xrange(0,len(self.waypointslayer.doors)):
-                    d1=(self.waypointslayer.doors[d][0],self.waypointslayer.doors[d][1])
-                    d2=(self.waypointslayer.doors[d][2],self.waypointslayer.doors[d][3])
-                    p1=(self.gpx['lat'][p-1],self.gpx['lon'][p-1])
-                    p2=(self.gpx['lat'][p],self.gpx['lon'][p])
-                    if intersect(p1,p2,d1,d2) or intersect(p1,p2,d2,d1) or intersect(p2,p1,d2,d1) or intersect(p2,p1,d2,d1):
-                        sect_door.append(d)
-                        sect_idx.append(p)
+            # a step p-1 -> p which crosses a door ends closer to the door than the longest step:
+            # only these points (from the spatial index) are tested, all at once for each door
+            lat,lon=np.asarray(self.gpx['lat']),np.asarray(self.gpx['lon'])
+            reach=np.nanmax(self.gpx['deltaxy']) if self.gpx.get_row_count()>1 else 0.0
+            for d in xrange(0,len(self.waypointslayer.doors)):
+                d1=(self.waypointslayer.doors[d][0],self.waypointslayer.doors[d][1])
+                d2=(self.waypointslayer.doors[d][2],self.waypointslayer.doors[d][3])
+                p=self.gpx.hv_bbox(d1[0],d1[1],d2[0],d2[1],reach)
+                p=np.union1d(p,p+1)
+                p=p[(p>=1)&(p<self.gpx.get_row_count())]
+                p=p[~self.gpx.is_segment_start(p)]      # no step between segments
+                p1=(lat[p-1],lon[p-1])
+                p2=(lat[p],lon[p])
+                cross=intersect(p1,p2,d1,d2) | intersect(p1,p2,d2,d1) | intersect(p2,p1,d2,d1)
+                sect_idx+=list(p[cross])
+                sect_door+=[d]*int(np.count_nonzero(cross))
+            order=np.lexsort((sect_door,sect_idx))
+            sect_idx=[int(sect_idx[i]) for i in order]
+            sect_door=[sect_door[i] for i in order]
             #then find the right sequences...
             for d in xrange(0,len(sect_door)):
                 if sect_door[d:d+len(self.waypoints)]==self.waypoints:
                     if np.all( self.gpx['ok'][sect_idx[d]-1:sect_idx[d+len(self.waypoints)-1]+1] ):
                         segments.append((sect_idx[d]-1,sect_idx[d+len(self.waypoints)-1]+1))
             if self.disableoutside:
-                self.gpx['ok'][0:self.gpx.get_last_row_idx()+1]=False
+                ok=np.zeros(self.gpx.get_row_count(),dtype='bool')
                 for s in segments:
-                    self.gpx['ok'][s[0]:s[1]]=True
+                    ok[s[0]:s[1]]=True
+                self.gpx.set_ok(slice(None),ok)
                 pub.sendMessage("ValChanged",arg1=self.id)
             data=[]
             lap=0
@@ -295,8 +306,8 @@ class WxWaypoints(wx.Panel):
                 lap+=1
                 #['lap','start','stop','duration','distance','avg speed','top speed']
                 data.append([lap,\
-                            self.gpx['time'][s[0]][11:19],\
-                            self.gpx['time'][s[1]][11:19],\
+                            gpxobj.format_iso8601(self.gpx['time'][s[0]])[11:19],\
+                            gpxobj.format_iso8601(self.gpx['time'][s[1]])[11:19],\
                             np.sum(self.gpx['deltat'][s[0]:s[1]]), \
                             np.sum(self.gpx['deltaxy'][s[0]:s[1]]), 
                             np.sum(self.gpx['deltaxy'][s[0]:s[1]])/np.sum(self.gpx['deltat'][s[0]:s[1]])*self.gpx.get_scale('speed'),\
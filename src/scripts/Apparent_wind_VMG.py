@@ -14,28 +14,23 @@ headers=[x for x in gpx.get_header_names() if not x in ['ok','time','duration','
                  ('wxcombo','column for wind direction','|'.join(headers),'wind_dir','str'),\
                  ('wxcombo','column for boat speed','|'.join(headers),'speed','str'),\
                  ('wxcombo','column for boat direction','|'.join(headers),'course','str')])   
-if not gpx.has_field('app_wind_dir'):
-    gpx.append_column('app_wind_dir','float')
-if not gpx.has_field('app_wind_avg'):
-    gpx.append_column('app_wind_avg','float')
-#loop version
 #Apparent wind angle is given by ArcTan((SIN(TWA)*TWS)/(BS+COS(TWA)*TWS));
 #Apparent wind speed is given by SQRT((SIN(TWA)*TWS)^2+(BS+COS(TWA)*TWS)^2)
-for i in range(0, gpx.get_row_count()):
+def apparent_wind(s):
+    # computed on a worker thread from a copy of the columns: the application stays responsive and
+    # app_wind_avg and app_wind_dir are updated together when both are ready
     # tws true wind speed
     # bs  boat speed
     # twa true wind angle (0=fully upwind; 180=fully downwind)
     # awa apparent wind angle
     # aws apparent wind speed
-    tws=gpx[windspeed][i]        # our wind direction is reversed. compared to usual conventions
-    bs=gpx[boatspeed][i]
-    twa=(gpx[boatdir][i]-gpx[winddir][i]+180)%360
+    tws=np.asarray(s[windspeed],dtype='float')     # our wind direction is reversed. compared to usual conventions
+    bs=np.asarray(s[boatspeed],dtype='float')
+    course=np.asarray(s[boatdir],dtype='float')
+    twa=(course-np.asarray(s[winddir],dtype='float')+180)%360
     twa=twa/180.0*math.pi
-    awa=math.atan((math.sin(twa)*tws)/(bs+math.cos(twa)*tws))
-    aws=math.sqrt((math.sin(twa)*tws)**2+(bs+math.cos(twa)*tws)**2)
-    gpx['app_wind_avg'][i]=aws
-    if (gpx[boatdir][i]-twa)>0:
-        gpx['app_wind_dir'][i]=(gpx[boatdir][i]-awa*180/math.pi)+180
-    else:
-        gpx['app_wind_dir'][i]=(gpx[boatdir][i]+awa*180/math.pi)+180
-sh.upd()
+    awa=np.arctan((np.sin(twa)*tws)/(bs+np.cos(twa)*tws))
+    aws=np.sqrt((np.sin(twa)*tws)**2+(bs+np.cos(twa)*tws)**2)
+    awd=np.where((course-twa)>0,course-awa*180/math.pi,course+awa*180/math.pi)+180
+    return aws,awd
+app.Recompute(['app_wind_avg','app_wind_dir'],[windspeed,winddir,boatspeed,boatdir],apparent_wind)
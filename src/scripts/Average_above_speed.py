@@ -4,9 +4,10 @@
 '''
 Buffer=""
 [filter]=WxQuery("Please specify filter for speed ({})".format(gpx.get_unit_sym('speed')),[('wxentry','Enter threshold',None,1,'float')])
-avg_speed=gpx[('speed',1)][np.where(gpx[('speed',1)]>filter)].mean()
-tot_dist=gpx[('deltaxy',1)][np.where(gpx[('speed',1)]>filter)].sum()
-tot_time=gpx[('deltat',1)][np.where(gpx[('speed',1)]>filter)].sum()
+above=gpx.where("speed*{} > {}".format(gpx.get_scale('speed'),filter),True)
+avg_speed=gpx[('speed',1)][above].mean()
+tot_dist=gpx[('deltaxy',1)][above].sum()
+tot_time=gpx[('deltat',1)][above].sum()
 Buffer+="#################################\n"
 Buffer+="Average speed for points above {} {} ({}): {}\n".format(filter,\
                                                             gpx.get_unit_sym('speed'),\
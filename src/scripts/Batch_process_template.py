@@ -1,9 +1,21 @@
 import os
+import gpxobj
 mydir=WxQuery("Choose directory to process",[('wxdir','Choose',None,"C:\\",'str')])
-for f in os.listdir(mydir[0]):
-    if f.endswith('fit'):
-        app.OpenFile(mydir[0]+os.sep+f)
-        gpx=app.gpx             #mandatory line! as we opened a new gpx file, we need to relink it to gpx shell variable
-        print gpx['speed'].mean()
-        #sh.run("any script")
-        #app.SaveFile('where/you/should/save.ext)
\ No newline at end of file
+files=[mydir[0]+os.sep+f for f in sorted(os.listdir(mydir[0])) if f.lower().endswith('fit')]
+# all files are loaded in a single store, without opening them in the application
+season=gpxobj.GpxCollection()
+season.open(files)
+fast=season['speed']>5.1444                                                            # above 10 kts
+for i,name in enumerate(season.names):
+    print os.path.basename(name),"mean speed: {:3.2f} m/s".format(season.mean('speed')[i]),\
+            "distance above 10 kts: {:3.2f} km".format(season.sum('deltaxy',fast)[i]/1000)
+runs=season.best_run(500)
+best=np.nanargmax(runs)
+print "best 500m of the season: {:3.2f} m/s".format(runs[best]),"in",season.names[season.get_activity_ids()[best]]
+# files can still be processed one at a time in the application (slower, as all widgets are updated)
+#for f in files:
+#    app.OpenFile(f)
+#    gpx=app.gpx             #mandatory line! as we opened a new gpx file, we need to relink it to gpx shell variable
+#    print gpx['speed'].mean()
+#    #sh.run("any script")
+#    #app.SaveFile('where/you/should/save.ext)
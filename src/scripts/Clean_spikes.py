@@ -0,0 +1,17 @@
+'''
+    This script disables GPS spikes: points which break a maximum speed, acceleration
+    or turn rate while their neighbours would not without them, and points whose hdop
+    is above a limit (if the track holds hdop). Leave a limit to 0 to ignore it.
+'''
+[speed,accel,turn,hdop]=WxQuery("Clean GPS spikes",	\
+				[('wxentry','Maximum speed ({})'.format(gpx.get_unit_sym('speed')),None,0,'float'), \
+				('wxentry','Maximum acceleration (m/s2)',None,10,'float'), \
+				('wxentry','Maximum turn rate (deg/s)',None,0,'float'), \
+				('wxentry','Maximum hdop',None,0,'float')] \
+				)
+limits=[x if x>0 else None for x in (speed/gpx.get_scale('speed'),accel,turn,hdop)]
+ok,report=gpx.clean(*limits)
+print "{} points disabled ({} looked at): speed {}, acceleration {}, turn rate {}, hdop {}".format(len(report['rows']),\
+                                                            report['candidates'],report['speed'],report['accel'],\
+                                                            report['turn'],report['hdop'])
+sh.upd()
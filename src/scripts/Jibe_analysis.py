@@ -1,4 +1,5 @@
 import math
+import gpxobj
 from wxmappanel.wxmappanel import Haversine                 # haversine is now included in map panel we don't need to re-define it
 
 def dist_to_line(ax, ay, bx, by, cx, cy):    
@@ -47,7 +48,7 @@ zerocrossing=np.where(np.diff(np.sign(gpx['tack'])))[0]
 for t in zerocrossing[0:]:
     if (t>convolution)   and  ( (gpx[('conv_speed',1)][t-convolution:t+convolution]>=minspeed).all()):
         jibes.append( (t,
-                        gpx['time'][t],
+                        gpxobj.format_iso8601(gpx['time'][t]),
                         np.min(gpx[('speed',1)][t-convolution:t+convolution]),
                         np.max(gpx[('speed',1)][t-convolution:t+convolution]),
                         jibecurve(t,(winddirection)%360,convolution)
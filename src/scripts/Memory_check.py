@@ -0,0 +1,25 @@
+'''
+    This script opens a file several times in a row, as when you open one file after the
+    other, and checks that the memory used by the program (resident set size) comes back
+    to what it was after the first time: a replaced track must not be kept in memory by
+    the widgets, the plugins or the shell.
+'''
+import gpxobj
+[filename,cycles]=WxQuery("Memory check",	\
+				[('wxfile','File to open','*.*',getattr(gpx,'filename',None) or '','str'), \
+				('wxentry','Number of times',None,5,'int')] \
+				)
+# the whole file is read at once, not as a preview completed in the background
+preview=app.config.get("app","preview_points") if app.config.has_option("app","preview_points") else None
+app.config.set("app","preview_points","0")
+(baseline,sizes,ok)=gpxobj.leak_check(lambda:app.OpenFile(filename),cycles)
+if preview!=None:
+    app.config.set("app","preview_points",preview)
+else:
+    app.config.remove_option("app","preview_points")
+if baseline==None:
+    print "Memory used by the program can't be read (install psutil)"
+else:
+    print "Memory after first opening: {:.1f} MB".format(baseline/1048576.0)
+    print "Memory after each next one:",", ".join("{:.1f} MB".format(size/1048576.0) for size in sizes)
+    print "No leak" if ok else "Memory grows: a replaced track is still referenced"
@@ -0,0 +1,7 @@
+'''
+    This script sets the number of points over which the slope is averaged (200 by default).
+    The slope is computed again in the background: the current one is shown until the new
+    one is ready.
+'''
+(conv,)=WxQuery("Slope window",[('wxentry','Points averaged',None,gpx.slopewindow,'int')])
+app.SetSlopeWindow(max(conv,1))
@@ -31,7 +31,7 @@ wind_units='kts'
                  ('wxcombo','Units',"m/s|km/h|kts",'kts','str'),\
                  ('wxcombo','Direction speed',dirs,"O",'str')])   
 if not gpx.has_field('wind_dir'):
-    gpx.append_column('wind_dir','a5')
+    gpx.append_column('wind_dir','float')
 if not gpx.has_field('wind_avg'):
     gpx.append_column('wind_avg','float')
 if not gpx.has_field('wind_mini'):
@@ -49,7 +49,7 @@ gpx['wind_avg'].fill(wind_avg*sf)
 gpx['wind_mini'].fill(wind_min*sf)
 gpx['wind_maxi'].fill(wind_max*sf)
 if wind_dir.isdigit():
-    gpx['wind_dir'].fill(wind_dir)
+    gpx['wind_dir'].fill(float(wind_dir))
 elif wind_dir in dirs.split('|'):
     gpx['wind_dir'].fill(direction_to_degrees[wind_dir])
 
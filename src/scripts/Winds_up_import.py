@@ -4,6 +4,7 @@ import datetime
 import dateutil.parser
 from dateutil.relativedelta import *
 from lxml import objectify,etree
+import gpxobj
 # we could download directly from winds-up. for that, we would need to 
 # parse correct date from gpx file
 # provide an exhaustive list of the spots with correcponding url
@@ -57,11 +58,13 @@ if srcfile!=None:
         gpx.append_column('wind_mini','float')
     if not gpx.has_field('wind_maxi'):
         gpx.append_column('wind_maxi','float')
+    day=gpxobj.format_iso8601(gpx['time'][0])[:11]
+    # measures are listed from latest to earliest. each one covers the points up to the previous one
+    bounds=gpxobj.parse_iso8601([day+meas[i*5][-5:]+":00Z" for i in range(len(meas)//5)])
+    timeindex=gpx.get_time_index()
     for idx in range (0,(len(meas)//5)-1):
-        tmp1=gpx['time'][0][:-9]+meas[idx*5][-5:]+":00Z"
-        tmp2=gpx['time'][0][:-9]+meas[(idx+1)*5][-5:]+":00Z"
-        indices=np.where((tmp1>=gpx['time']) & (gpx['time']>=tmp2))
-        if indices[0].size>0:
+        indices=timeindex.range(bounds[idx+1],bounds[idx])
+        if indices.size>0:
             #in order to cope with our standard settings, we convert wind speed to m/s
             gpx['wind_dir'][indices]=direction_to_degrees[ str(meas[idx*5+1]) ]
             gpx['wind_avg'][indices]=float(meas[idx*5+2])*0.514444
@@ -1,5 +1,6 @@
 ### calcultae best points
 import datetime
+import gpxobj
 savedsel=np.copy(gpx['ok'])                                                                 # save selection, as we will modify it
 
 #todo: push all these measurments in an array! and copy to clipboard
@@ -7,11 +8,12 @@ savedsel=np.copy(gpx['ok'])
 print "Average speed : {:3.2f} kts".format(gpx['speed'][np.where(gpx['ok']==True)].mean() *1.94384)
 print "Distance :  {:3.2f} km".format(gpx['deltaxy'][np.where(gpx['ok']==True)].sum()/1000)
 print "Duration :",str(datetime.timedelta(seconds=gpx['deltat'][np.where(gpx['ok']==True)].sum()))
-print "Date:",gpx['time'][1]
+print "Date:",gpxobj.format_iso8601(gpx['time'][1])
 print "Location : lat:",gpx['lat'].mean(), " -- lon:",gpx['lon'].mean()
-print "Average speed above 10 kts: {:3.2f} kts".format(gpx['speed'][np.where((gpx['speed']>5.1444)&(gpx['ok']==True))].mean() *1.94384)
-print "Distance above 10 kts:  {:3.2f} km".format(gpx['deltaxy'][np.where((gpx['speed']>5.1444)&(gpx['ok']==True))].sum()/1000)
-print "Duration above 10 kts:",str(datetime.timedelta(seconds=gpx['deltat'][np.where((gpx['speed']>5.1444)&(gpx['ok']==True))].sum()))
+above=gpx.where("speed_kts>10 and ok",True)
+print "Average speed above 10 kts: {:3.2f} kts".format(gpx['speed'][above].mean() *1.94384)
+print "Distance above 10 kts:  {:3.2f} km".format(gpx['deltaxy'][above].sum()/1000)
+print "Duration above 10 kts:",str(datetime.timedelta(seconds=gpx['deltat'][above].sum()))
 
 values=[]
 print "\n5 best instant measurments:"
@@ -19,18 +21,18 @@ buffer=np.copy(gpx[('speed',1)])
 for count in range (0,5):
     value=np.max(buffer[gpx['ok']])                                                                                 #get max speed from enabled points
     idx=np.where(buffer == value)[0][0]                                                                             #get the idx of value
-    print count," best measurment at",gpx['time'][idx][11:19],":","{:3.2f}".format(value), " ",gpx.get_unit_sym('speed')   #print results
+    print count," best measurment at",gpxobj.format_iso8601(gpx['time'][idx])[11:19],":","{:3.2f}".format(value), " ",gpx.get_unit_sym('speed')   #print results
     gpx['ok'][idx]=False                                                                                            #disable point
     values.append(value)                                                                                            #save value
 gpx['ok'][:]=savedsel[:]
 
-print "\n5 best 10 measurments average:"
-buffer=np.convolve(gpx[('speed',1)],np.ones(10)/10,mode='same')
+print "\n5 best 10 s average:"
+buffer=gpx.rolling('speed',10,center=True,scaled=True).mean()
 for count in range (0,5):
     value=np.max(buffer[gpx['ok']])                                                                                 #get max speed from enabled points
     idx=np.where(buffer == value)[0][0]                                                                             #get the idx of value
-    print count," best measurment at",gpx['time'][idx][11:19], ":","{:3.2f}".format(value), " ",gpx.get_unit_sym('speed')  #print results
-    gpx['ok'][idx-5:idx+5]=False                                                                                    #disable point
+    print count," best measurment at",gpxobj.format_iso8601(gpx['time'][idx])[11:19], ":","{:3.2f}".format(value), " ",gpx.get_unit_sym('speed')  #print results
+    gpx['ok'][gpx.get_time_index().range(gpx['time'][idx]-np.timedelta64(5,'s'),gpx['time'][idx]+np.timedelta64(5,'s'))]=False   #disable the 10 s
     values.append(value)                                                                                            #save value
 gpx['ok'][:]=savedsel[:]
 
@@ -47,16 +49,16 @@ for count in range (0,5):
     s1=np.where(gpx['distance']<gpx['distance'][idx]-500)[0][-1]                              #get start of the run
     dist=gpx['distance'][idx]-gpx['distance'][s1]                                             #compute run distance
     dur=gpx['duration'][idx]-gpx['duration'][s1]                                              #compute run duration
-    print count," 500 meter run at",gpx['time'][idx][11:19], ":","{:3.1f}".format(dist), " m in ","{:3.0f}".format(dur),"s (","{:3.2f}".format(dist/dur*gpx.get_scale('speed')),gpx.get_unit_sym('speed'),")"
+    print count," 500 meter run at",gpxobj.format_iso8601(gpx['time'][idx])[11:19], ":","{:3.1f}".format(dist), " m in ","{:3.0f}".format(dur),"s (","{:3.2f}".format(dist/dur*gpx.get_scale('speed')),gpx.get_unit_sym('speed'),")"
     gpx['ok'][s1:s2]=False                                                                    #disable points
     values.append(dist/dur*gpx.get_scale('speed'))                                                                #save value
 gpx['ok'][:]=savedsel[:]                                                                      #restore selection
 
 summary=""
 #date
-summary+=str(gpx['time'][1][0:10])
+summary+=gpxobj.format_iso8601(gpx['time'][1])[0:10]
 #time
-summary+="\t"+str(gpx['time'][1][11:19])
+summary+="\t"+gpxobj.format_iso8601(gpx['time'][1])[11:19]
 #average speed in knots
 summary+="\t{:3.2f}".format(gpx['speed'][np.where(gpx['ok']==True)].mean() *gpx.get_scale('speed'))
 #atotal distance in km
@@ -5,6 +5,7 @@ import os,sys
 import numpy as np
 import datetime
 import ConfigParser
+import threading
 
 import wx
 import wx.aui
@@ -55,6 +56,8 @@ if __name__ == "__main__":
             self.id=wx.NewId()
             self.gpx=None
             self.replaytimer=None
+            self.live=None                          # NMEA source and timer of live tracking (see OnLiveMenu)
+            self.livetimer=None
             self.selstart=0
             self.selstop=0
             self.plugins={}
@@ -72,6 +75,14 @@ if __name__ == "__main__":
                 map_cache=os.path.normpath(self.config.get("map","map_cache"))
             else:
                 map_cache=os.path.normpath(thispath()+os.sep+self.config.get("map","map_cache"))
+            # columns of very large tracks can be kept in memmapped files instead of memory
+            self.cache_dir=None
+            if self.config.has_option("app","cache_dir") and self.config.get("app","cache_dir"):
+                self.cache_dir=self.config.get("app","cache_dir")
+                if not os.path.isabs(self.cache_dir):
+                    self.cache_dir=os.path.normpath(thispath()+os.sep+self.cache_dir)
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
 
             #building interface
             self.InitMenus()
@@ -159,6 +170,8 @@ if __name__ == "__main__":
             self.filemenu = wx.Menu()
             item = self.filemenu.Append(wx.ID_OPEN, "&Open\tCTRL+O")
             self.Bind(wx.EVT_MENU, self.OnOpenMenu, item)
+            item = self.filemenu.Append(wx.ID_ANY, "&Live tracking...\tCTRL+L",kind=wx.ITEM_CHECK)
+            self.Bind(wx.EVT_MENU, self.OnLiveMenu, item)
             item = self.filemenu.Append(wx.ID_SAVEAS, "&Save as...\tCTRL+S")
             self.Bind(wx.EVT_MENU, self.OnSaveMenu, item)
             item = self.filemenu.Append(wx.ID_EXIT, "Quit","Quit application")
@@ -166,8 +179,10 @@ if __name__ == "__main__":
             menubar.Append(self.filemenu, "&File")
             self.editmenu = wx.Menu()
             item = self.editmenu.Append(wx.ID_UNDO, "&Undo\tCTRL+Z")
+            self.Bind(wx.EVT_MENU, self.OnUndoMenu, item)
             item.Enable(False)
             item = self.editmenu.Append(wx.ID_REDO, "&Redo\tCTRL+SHIFT+Z")
+            self.Bind(wx.EVT_MENU, self.OnRedoMenu, item)
             item.Enable(False)
             self.editmenu.AppendSeparator()
             item = self.editmenu.Append(wx.ID_CUT, "&Cut\tCTRL+X")
@@ -192,6 +207,22 @@ if __name__ == "__main__":
         def OnQuitMenu(self,event):
             self.Close(True)
 
+        def OnUndoMenu(self,event):
+            self.gpx.undo()
+            pub.sendMessage("ValChanged",arg1=self.id)
+            self.UpdateEditMenu()
+            self.Refresh()
+
+        def OnRedoMenu(self,event):
+            self.gpx.redo()
+            pub.sendMessage("ValChanged",arg1=self.id)
+            self.UpdateEditMenu()
+            self.Refresh()
+
+        def UpdateEditMenu(self):
+            self.editmenu.Enable(wx.ID_UNDO,self.gpx!=None and self.gpx.can_undo())
+            self.editmenu.Enable(wx.ID_REDO,self.gpx!=None and self.gpx.can_redo())
+
         def OnSaveMenu(self,event):
             wildcard = "Compressed Numpy Array (*.npz)|*.npz|"+\
                         "GPX XML file (*.gpx)|*.gpx"
@@ -204,20 +235,21 @@ if __name__ == "__main__":
             if 'wxShell' in self.plugins:
                 self.plugins["wxShell"].run(thispath()+os.sep+"scripts"+os.sep+"onSaveFile.py")
             if filename[-4:]=='.npz' or filename[-4:]=='.NPZ':
-                self.gpx.save_npz(filename)
+                self.gpx.save_npz(filename,self.config.has_option("app","save_rollups") and self.config.getboolean("app","save_rollups"))
             elif filename[-4:]=='.gpx' or filename[-4:]=='.GPX':
                 allowedfields=self.gpx.get_header_names()
                 allowedfields.remove('ok')
                 allowedfields.remove('idx')
                 allowedfields.remove('lat')
                 allowedfields.remove('lon')
-                (fields,save_enabled)=WxQuery("GPX export dialog",[('wxchecklist','Choose fields to export','|'.join(allowedfields),'time|speed','str'),
-                                                                   ('wxcheck','Exported only enabled points',None,False,'bool')])
+                (fields,save_enabled,tolerance)=WxQuery("GPX export dialog",[('wxchecklist','Choose fields to export','|'.join(allowedfields),'time|speed','str'),
+                                                                   ('wxcheck','Exported only enabled points',None,False,'bool'),
+                                                                   ('wxentry','Simplify within (m, 0 keeps all points)',None,0.0,'float')])
                 if save_enabled:
                     # np.where returns a tupple of numpy.ndarray where we need a list
-                    self.gpx.save_xml(filename,fields.split('|'),np.where(self.gpx['ok']==True)[0].tolist())
+                    self.gpx.save_xml(filename,fields.split('|'),self.gpx.get_ok_index().tolist(),tolerance)
                 else:
-                    self.gpx.save_xml(filename,fields.split('|'),None)
+                    self.gpx.save_xml(filename,fields.split('|'),None,tolerance)
 
         def OnOpenMenu(self,event):
             wildcard = "Fit file (*.fit)|*.fit|"+\
@@ -228,62 +260,113 @@ if __name__ == "__main__":
                 self.OpenFile(dialog.GetPath())
 
         def OpenFile(self,filename):
-            self.mapwidget.DetachGpx()
-            self.timewidget.DetachGpx()
-            for k in self.plugins:
-                self.plugins[k].DetachGpx()
-            del self.gpx
+            self.DetachGpx()
             c=0
-            progressdlg = wx.ProgressDialog("Loading", "Loading file", 17,style=wx.PD_SMOOTH|wx.PD_CAN_ABORT|wx.PD_AUTO_HIDE)
-            self.gpx=gpxobj.GpxObj()                            ;c+=1;progressdlg.Update(c)
-            if filename[-4:]=='.fit' or filename[-4:]=='.FIT':
-                self.gpx.open_fit(filename)
-            elif filename[-4:]=='.npz' or filename[-4:]=='.NPZ':
-                self.gpx.open_npz(filename)
-            else:
-                self.gpx.open_gpx(filename)                     ;c+=1;progressdlg.Update(c,"Parsing file")
+            progressdlg = wx.ProgressDialog("Loading", "Loading file", 2,style=wx.PD_SMOOTH|wx.PD_CAN_ABORT|wx.PD_AUTO_HIDE)
+            c+=1;progressdlg.Update(c)
+            # large files are first shown from a preview of preview_points points (see LoadFull)
+            maxpoints=self.config.getint("app","preview_points") if self.config.has_option("app","preview_points") else 0
+            self.gpx=self.LoadGpx(filename,maxpoints)          ;c+=1;progressdlg.Update(c,"Parsing file")
             #   self.gpx.parse_trkpts()                         ;c+=1;progressdlg.Update(c) # now included in open_gpx
-            ## we calculate a few standard indicators:
-            # deltat    time between two adjacent points. some GPS do not log at equally spaced times
-            # deltaxy   horizontal distance between two ajacent points.
-            # distance  cumulative distance calculated from haversine formula   (m)
-            # duration  cumulative duration calculated from time tag            (s)
-            # course   course calculated from haversine formula               (degrees)
-            # speed     instantaneous speed calculated from haversine formula. only if no doppler speed is found
-            # acc       instantaneous acceleration                              calculated drom speed column
-            # slope     only if an elevation 'ele' tag is found                 instantaneous slope!!not reliable
             if not self.gpx.has_field('time'):
+                if self.gpx.stride>1:
+                    self.gpx.close()
+                    self.gpx=self.LoadGpx(filename)             # fake times are generated for all points
                 # rare case, but time tag is not mandatory in gpx description
                 dlg = wx.MessageBox('Your gpx file does not seem to include time values. Do you want to generate time series?','Generate fake times?', wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION )
                 if dlg == wx.YES:
                     deltat=WxQuery("Enter time gap between GPS points",[("wxentry","Time gap in seconds",None,"1.0",'float')])[0]
-                    self.gpx.append_column('time','str')
-                    base=datetime.datetime.today()
-                    self.gpx['time']=[(base+datetime.timedelta(0,sec*deltat)).strftime("%Y-%m-%dT%H:%M:%SZ") for sec in range(0, self.gpx.get_row_count())]
-            #some fields such as 'speed' or 'distance' may be directly imported from gpx/fit/tcx file
-            if not self.gpx.has_field('deltat'):
-                self.gpx.append_column('deltat','float')                ;c+=1;progressdlg.Update(c,"Computing Time deltas")
-                self.gpx['deltat']=self.gpx.duration()                  ;c+=1;progressdlg.Update(c)
-            if not self.gpx.has_field('deltaxy'):
-                self.gpx.append_column('deltaxy','float')               ;c+=1;progressdlg.Update(c,"Computing Location deltas")
-                self.gpx['deltaxy']=self.gpx.hv_distance()              ;c+=1;progressdlg.Update(c)
-            if not self.gpx.has_field('distance'):
-                self.gpx.append_column('distance','float')              ;c+=1;progressdlg.Update(c,"Computing distances")
-                self.gpx['distance']=np.cumsum(self.gpx['deltaxy'])     ;c+=1;progressdlg.Update(c)
-            if not self.gpx.has_field('duration'):
-                self.gpx.append_column('duration','float')              ;c+=1;progressdlg.Update(c,"Computing durations")
-                self.gpx['duration']=np.cumsum(self.gpx['deltat'])      ;c+=1;progressdlg.Update(c)
-            if not self.gpx.has_field('course'):
-                self.gpx.append_column('course','float')                ;c+=1;progressdlg.Update(c,"Computing course")
-                self.gpx['course']=self.gpx.hv_course()                 ;c+=1;progressdlg.Update(c)
-            if not self.gpx.has_field('speed'):
-                self.gpx.append_column('speed','float')                 ;c+=1;progressdlg.Update(c,"Computing speed")
-                self.gpx['speed']=self.gpx.hv_speed(True)               ;c+=1;progressdlg.Update(c)
-            if not self.gpx.has_field('slope'):
-                self.gpx.append_column('slope','float')                 ;c+=1;progressdlg.Update(c,"Computing slope")
-                self.gpx['slope']=self.gpx.hv_slope(200,True)           ;c+=1;progressdlg.Update(c)
+                    self.gpx.append_column('time','M8[ns]')
+                    base=np.datetime64(datetime.datetime.utcnow(),'s')
+                    self.gpx['time']=base+np.arange(self.gpx.get_row_count())*np.timedelta64(int(deltat*1e9),'ns')
+            # standard indicators (deltat, deltaxy, distance, duration, course, speed, slope) are computed when first needed
+            # some fields such as 'speed' or 'distance' may be directly imported from gpx/fit/tcx file, and are kept
+            self.gpx.derive_standard_columns()
+            try:
+                # min/max/sum/count per time bucket of the columns read from file, for statistics of long tracks
+                self.gpx.build_rollups()
+            except (KeyError,ValueError):
+                pass                                # no time, or points not in time order
             progressdlg.Close()
             progressdlg.Destroy()
+            self.AttachGpx(filename)
+            if self.gpx.stride>1:
+                self.SetTitle(filename+" (preview)")
+                worker=threading.Thread(target=self.LoadFull,args=(filename,self.gpx))
+                worker.daemon=True
+                worker.start()
+
+        def LoadGpx(self,filename,maxpoints=None):
+            gpx=gpxobj.GpxObj()
+            gpx.set_cachedir(self.cache_dir)
+            if self.config.has_section("precision"):
+                gpx.set_precision(dict(self.config.items("precision")))
+            if filename[-4:]=='.fit' or filename[-4:]=='.FIT':
+                gpx.open_fit(filename,maxpoints)
+            elif filename[-4:]=='.npz' or filename[-4:]=='.NPZ':
+                gpx.open_npz(filename)
+            else:
+                gpx.open_gpx(filename,maxpoints)
+            return gpx
+
+        def LoadFull(self,filename,preview):
+            # worker thread: all points of filename, swapped in the main thread when loaded
+            full=self.LoadGpx(filename)
+            wx.CallAfter(self.SwapFull,filename,preview,full)
+
+        def SwapFull(self,filename,preview,full):
+            if self.gpx is not preview:
+                full.close()                            # another file was opened meanwhile
+                return
+            # current point and selection are given as rows of the whole file
+            rows=np.array(preview['idx'])
+            self.gpx.adopt(full)
+            try:
+                self.gpx.build_rollups()
+            except (KeyError,ValueError):
+                pass
+            self.gpx.clear_journal()
+            self.UpdateEditMenu()
+            pub.sendMessage("ValChanged",arg1=self.id)
+            if self.selstop>self.selstart:
+                pub.sendMessage("SelChanged",arg1=self.id,arg2=rows[min(self.selstart,len(rows)-1)],arg3=rows[min(self.selstop,len(rows)-1)])
+            pub.sendMessage("CurChanged",arg1=self.id,arg2=rows[min(getattr(self,'idx',0),len(rows)-1)])
+            self.SetTitle(filename)
+            (used,unpacked)=self.gpx.get_memory_usage()
+            self.sb.SetStatusText("%d points, %.1f MB (%.1f MB saved by column types)"%(self.gpx.get_row_count(),used/1048576.0,(unpacked-used)/1048576.0),0)
+
+        def Recompute(self,keys,inputs,func,typ='float'):
+            # func(snapshot) computes columns keys on a worker thread (see GpxObj.recompute()). widgets keep
+            # drawing the current columns until the new ones are swapped in
+            gpx=self.gpx
+            self.gpx.recompute(keys,inputs,func,typ,done=lambda:wx.CallAfter(self.SwapComputed,gpx))
+
+        def SetSlopeWindow(self,conv):
+            gpx=self.gpx
+            self.gpx.set_slope_window(conv,done=lambda:wx.CallAfter(self.SwapComputed,gpx))
+
+        def SwapComputed(self,gpx):
+            if self.gpx is not gpx:
+                return                                  # another file was opened meanwhile
+            if len(self.gpx.swap_ready())>0:
+                pub.sendMessage("ValChanged",arg1=self.id)
+
+        def DetachGpx(self):
+            if self.live!=None:
+                self.StopLive()
+            self.mapwidget.DetachGpx()
+            self.timewidget.DetachGpx()
+            for k in self.plugins:
+                self.plugins[k].DetachGpx()
+            # widgets only hold weak references: the columns are freed now, even if a script still holds the track
+            if self.gpx!=None:
+                self.gpx.close()
+            self.gpx=None
+            gpxobj.trim_memory()
+
+        def AttachGpx(self,title):
+            if self.config.has_option("app","undo_memory"):
+                self.gpx.set_journal_budget(self.config.getint("app","undo_memory")*1024*1024)
             self.gpx.set_unit('deltaxy','m')
             self.gpx.set_unit('deltat','s')
             # todo: check that the units are known
@@ -293,6 +376,8 @@ if __name__ == "__main__":
             #self.gpx.set_unit('speed','km/h')
             #self.gpx.set_unit('distance','m')
             #self.gpx.set_unit('duration','s')
+            self.gpx.clear_journal()                # nothing to undo in a freshly opened file
+            self.UpdateEditMenu()
             self.timewidget.AttachGpx(self.gpx)
             self.mapwidget.AttachGpx(self.gpx)
             self.gpxmenu.Enable(self.gpxmenu.FindItem("Units"),True)
@@ -303,9 +388,60 @@ if __name__ == "__main__":
             if 'wxShell' in self.plugins:
                 self.plugins["wxShell"].run(thispath()+os.sep+"scripts"+os.sep+"onOpenFile.py")
 
-            self.SetTitle(filename)
+            self.SetTitle(title)
+            (used,full)=self.gpx.get_memory_usage()
+            self.sb.SetStatusText("%d points, %.1f MB (%.1f MB saved by column types)"%(self.gpx.get_row_count(),used/1048576.0,(full-used)/1048576.0),0)
             self.__resize()
 
+        def OnLiveMenu(self,event):
+            # live tracking: NMEA sentences sent over tcp (gpsd, or a gps shared on the network) are appended
+            # to a new track every second. widgets are told which rows are new ("RowsAppended")
+            if self.live!=None:
+                self.StopLive()
+                return
+            (host,port)=WxQuery("Live tracking",[('wxentry','Host',None,'localhost','str'),
+                                                 ('wxentry','Port (gpsd: 2947)',None,2947,'int')])
+            try:
+                live=gpxobj.NmeaSocket(host,port)
+            except EnvironmentError as e:
+                wx.MessageBox("Could not connect to %s:%d\n%s"%(host,port,e),"Live tracking",wx.OK|wx.ICON_ERROR)
+                self.filemenu.Check(self.filemenu.FindItem("Live tracking..."),False)
+                return
+            self.DetachGpx()
+            self.gpx=gpxobj.GpxObj()
+            self.gpx.set_cachedir(self.cache_dir)
+            if self.config.has_section("precision"):
+                self.gpx.set_precision(dict(self.config.items("precision")))
+            self.gpx.open_live()
+            self.live=live
+            self.livetitle="Live: %s:%d"%(host,port)
+            self.livetimer=wx.Timer(self)
+            self.Bind(wx.EVT_TIMER,self.OnLiveTimer,self.livetimer)
+            self.livetimer.Start(1000)
+
+        def OnLiveTimer(self,event):
+            points=self.live.read()
+            if len(points['time'])>0:
+                first=self.gpx.append_rows(points)
+                if first==0:
+                    # widgets are attached when the first points are received
+                    self.gpx.derive_standard_columns()
+                    self.AttachGpx(self.livetitle)
+                else:
+                    pub.sendMessage("RowsAppended",arg1=self.id,arg2=first)
+                    self.sb.SetStatusText("%d points"%self.gpx.get_row_count(),0)
+                pub.sendMessage("CurChanged",arg1=self.id,arg2=self.gpx.get_last_row_idx())
+            if self.live.closed:
+                self.StopLive()
+                wx.MessageBox("Connection closed by the gps source","Live tracking",wx.OK|wx.ICON_INFORMATION)
+
+        def StopLive(self):
+            self.livetimer.Stop()
+            self.livetimer=None
+            self.live.close()
+            self.live=None
+            self.filemenu.Check(self.filemenu.FindItem("Live tracking..."),False)
+
         def OnUnitsMenu(self,event):
             li=[]
             un='|'.join(gpxobj.units.keys())
@@ -315,11 +451,14 @@ if __name__ == "__main__":
                     li.append(("wxcombo",str(head),un,self.gpx.get_unit(head)[0],'str'))
             res=WxQuery("Adjust units",li)
             i=0
+            self.gpx.start_group()
             for head in self.gpx.get_header_names():
                 if not head.startswith('_'):
                     self.gpx.set_unit(head,res[i])
                     i+=1
+            self.gpx.end_group()
             pub.sendMessage("ValChanged",arg1=self.id)
+            self.UpdateEditMenu()
             self.Refresh()
 
         def OnReplayMenu(self,event):
@@ -363,6 +502,7 @@ if __name__ == "__main__":
         def OnSigValChanged(self,arg1):
             if arg1==self.id:
                 return
+            self.UpdateEditMenu()
 
     class DemoApp(wx.App):
         def __init__(self):
@@ -86,6 +86,9 @@ class WxLineScatterWidget(wx.Panel):
         self.enablespan=True
         self.cursorcolor='#FF0000'
         self.cursorwidth=1
+        # points drawn for the visible x range, min/max envelope above (see window_data). None draws all points
+        self.maxpoints=None
+        self.plotdata={}                            # axis -> (plot,data,smooth) of all points
 
         self.gpxfig = Figure()
         self.ax1 = self.gpxfig.add_subplot(1,1,1)           # create a grid of 1 row, 1 col and put a subplot in the first cell of this grid
@@ -115,6 +118,7 @@ class WxLineScatterWidget(wx.Panel):
         pub.subscribe(self.OnSigCurChanged, "CurChanged")
         pub.subscribe(self.OnSigSelChanged, "SelChanged")
         pub.subscribe(self.OnSigValChanged, "ValChanged")
+        pub.subscribe(self.OnSigRowsAppended, "RowsAppended")
         
         #set background color to pure white
         #that code does not work on linux...
@@ -138,14 +142,17 @@ class WxLineScatterWidget(wx.Panel):
             self.Bind(wx.EVT_MENU, self.OnPopup, item)
 
     def x_to_num(self,value,scaled=True):
+        # value may be a single value or a whole column
         if self.xaxis=='time':
-            return dates.date2num(dateutil.parser.parse(value))
+            if isinstance(value,basestring):
+                value=gpxobj.parse_iso8601([value])[0]
+            return dates.epoch2num(np.asarray(value,dtype='M8[ns]').astype('int64')/1e9)
         else:
             if scaled: 
                 #return float(value)/self.gpx.get_scale(self.xaxis)
-                return float(value)*self.gpx.get_scale(self.xaxis)
+                return np.asarray(value,dtype='float')*self.gpx.get_scale(self.xaxis)
             else:
-                return float(value)
+                return np.asarray(value,dtype='float')
     
     def num_to_x(self,value,scaled=True):
         if self.xaxis=='time':
@@ -157,6 +164,12 @@ class WxLineScatterWidget(wx.Panel):
             else:
                 return value
                 
+    def x_to_index(self,value):
+        # row of the point at x axis position value. time uses the gpx time index (O(log n))
+        if self.xaxis=='time':
+            return int(self.gpx.get_time_index().nearest(np.datetime64(int(round(dates.num2epoch(value)*1e9)),'ns')))
+        return np.searchsorted(self.xvalues,value)
+
     def x_max(self):
         if self.xaxis=='time':
             return self.x_to_num(self.gpx[self.xaxis][self.gpx.get_row_count()-1])
@@ -226,20 +239,25 @@ class WxLineScatterWidget(wx.Panel):
             ## process data!!
             N=smooth
             #data=(1.0)*np.convolve(self.gpx[plot]*self.gpx.scale[plot], np.ones((N,))/N)[(N-1):]
-            data=(1.0)*np.convolve(self.gpx[(plot,True)], np.ones((N,))/N)[(N-1):]
+            try:
+                # average over the last N seconds, whatever the sampling rate
+                data=self.gpx.rolling(plot,N,scaled=True).mean() if N>1 else (1.0)*self.gpx[(plot,True)]
+            except (KeyError,ValueError):
+                # no time, or points not in time order: average over N points
+                data=(1.0)*np.convolve(self.gpx[(plot,True)], np.ones((N,))/N)[(N-1):]
             data[self.gpx['ok']==False]=np.NAN
             ##end of data processing
             #remove fill_between collection
             for coll in ax.collections:
                 ax.collections.remove(coll)
             #need to rebuild dates array in case something was deleted
-            self.xvalues=[]
-            for x in self.gpx[self.xaxis]:
-                self.xvalues.append(self.x_to_num(x))
-            ax.get_lines()[0].set_data(self.xvalues,data)
+            self.xvalues=self.x_to_num(self.gpx[self.xaxis])
+            self.plotdata[ax]=(plot,data,smooth)
+            x,y=self.window_data(plot,data,smooth)
+            ax.get_lines()[0].set_data(x,y)
             self.format_x_axis()
             if lineprops['fill']:
-                ax.fill_between(self.xvalues,0,data,facecolor=lineprops['color'], alpha=0.2)
+                ax.fill_between(x,0,y,facecolor=lineprops['color'], alpha=0.2)
             ax.get_lines()[0].set_color(lineprops['color'])
             ax.get_lines()[0].set_linewidth(lineprops['linewidth'])
             ax.get_lines()[0].set_marker(lineprops['marker'])
@@ -249,14 +267,18 @@ class WxLineScatterWidget(wx.Panel):
             ax.yaxis.label.set_color(lineprops['color'])
             if not yauto:
                 ax.set_ylim(ylo,yhi)
+            elif self.gpx.is_numeric(plot):
+                # range of enabled points, from time rollups
+                ax.set_ylim(*self.gpx.range_stats(plot,scaled=True)[:2])
             else:
-                ax.set_ylim(np.min(self.gpx[plot]*self.gpx.scale[plot]),np.max(self.gpx[plot]*self.gpx.scale[plot]))
+                ax.set_ylim(np.min(self.gpx[(plot,1)]),np.max(self.gpx[(plot,1)]))
             ax.set_visible(True)
             for tick in ax.get_yticklabels():
                 tick.set_color(lineprops['color'])
             ax.spines["right"].set_edgecolor(lineprops['color'])
             ax.tick_params(axis='y', colors=lineprops['color'])
         else:
+            self.plotdata.pop(ax,None)
             ax.get_lines()[0].set_data(self.xvalues, np.zeros(self.gpx.get_row_count()))
             ax.set_visible(False)
         self.cursor.set_color(self.cursorcolor)
@@ -265,12 +287,53 @@ class WxLineScatterWidget(wx.Panel):
         self.Draw(False)
         self.OnSize(None)
             
+    def window_data(self,plot,data,smooth):
+        # (x,y) drawn for the visible x range: its points, or if there are more than maxpoints, the min and max of
+        # groups of points (from the time rollups of plot when it is not smoothed, else from data)
+        if self.maxpoints==None or not np.all(self.xvalues[1:]>=self.xvalues[:-1]):
+            return self.xvalues,data
+        xlo,xhi=self.ax1.get_xlim()
+        a=max(np.searchsorted(self.xvalues,xlo)-1,0)
+        b=min(np.searchsorted(self.xvalues,xhi,'right')+1,len(self.xvalues))
+        if b-a<=self.maxpoints:
+            return self.xvalues[a:b],data[a:b]
+        groups=self.maxpoints//2
+        if smooth==1 and self.xaxis=='time' and self.gpx.is_numeric(plot):
+            try:
+                rollup=self.gpx.get_rollup(plot)
+                for p in rollup.periods:
+                    level=rollup.levels[p]
+                    ka=max(np.searchsorted(level['start'],a,'right')-1,0)
+                    kb=np.searchsorted(level['start'],b)
+                    if kb-ka<=groups:
+                        break
+                scale=self.gpx.get_scale(plot)
+                x=self.x_to_num(rollup.time(p)[ka:kb])
+                low,high=level['min'][ka:kb]*scale,level['max'][ka:kb]*scale
+                return np.repeat(x,2),np.dstack((low,high)).ravel()
+            except (KeyError,ValueError):
+                pass
+        starts=np.arange(a,b,-(-(b-a)//groups))
+        low,high=np.fmin.reduceat(data[a:b],starts-a),np.fmax.reduceat(data[a:b],starts-a)
+        return np.repeat(self.xvalues[starts],2),np.dstack((low,high)).ravel()
+
+    def RefineView(self):
+        # the x range changed: points of the new range (see window_data)
+        if self.maxpoints==None or self.gpx==None:
+            return
+        for ax,lineprops in ((self.ax1,self.lineprops1),(self.ax2,self.lineprops2),(self.ax3,self.lineprops3)):
+            if ax in self.plotdata:
+                x,y=self.window_data(*self.plotdata[ax])
+                ax.get_lines()[0].set_data(x,y)
+                if lineprops['fill']:
+                    for coll in list(ax.collections):
+                        ax.collections.remove(coll)
+                    ax.fill_between(x,0,y,facecolor=lineprops['color'], alpha=0.2)
+
     def AttachGpx(self,data):
-        self.gpx=data
-        self.xvalues=[]
+        self.gpx=gpxobj.weak(data)
         self.xaxis=self.gpx.get_header_names()[0]
-        for x in self.gpx[self.xaxis]:
-            self.xvalues.append(self.x_to_num(x))
+        self.xvalues=self.x_to_num(self.gpx[self.xaxis])
         self.ax1.set_xlabel('')
         self.ax1.plot(self.xvalues, np.zeros(self.gpx.get_row_count()),picker=5)
         self.ax2.plot(self.xvalues, np.zeros(self.gpx.get_row_count()),picker=5)
@@ -293,6 +356,8 @@ class WxLineScatterWidget(wx.Panel):
         
     def DetachGpx(self):
         self.gpx=None
+        self.plotdata={}
+        self.xvalues=None
         self.plot1='none'
         self.plot2='none'
         self.plot3='none'
@@ -310,6 +375,10 @@ class WxLineScatterWidget(wx.Panel):
         if self.span!=None:
             self.span.remove()
             self.span=None
+        # lines and fills hold arrays as long as the track
+        for ax in (self.ax1,self.ax2,self.ax3):
+            for artist in list(ax.get_lines())+list(ax.collections):
+                artist.remove()
 
     def OnSigSelChanged(self,arg1,arg2,arg3):
         if arg1==self.id:
@@ -327,6 +396,69 @@ class WxLineScatterWidget(wx.Panel):
         self.update_axis(self.ax2,self.plot2,self.ax2.get_xlim()[0],self.ax2.get_xlim()[1],self.autoy2, self.lineprops2, self.smooth2)
         self.update_axis(self.ax3,self.plot3,self.ax2.get_xlim()[0],self.ax2.get_xlim()[1],self.autoy3, self.lineprops3, self.smooth3)
     
+    def OnSigRowsAppended(self,arg1,arg2):
+        # live track: rows arg2.. were appended. if the x axis showed the last point, it follows the new ones
+        # (the whole track stays in view if it was, otherwise the view scrolls). only the new rows are
+        # converted and smoothed, and the plotted lines are extended with them. the last previous point is
+        # taken again, as it takes the value of the next one if it starts a segment
+        if arg1==self.id or self.gpx==None:
+            return
+        news=dict((ax,self.appended_data(plot,smooth,max(arg2-1,0))) for ax,(plot,data,smooth) in self.plotdata.items())
+        if arg2==0 or arg2!=len(self.xvalues) or any(new is None for new in news.values()):
+            self.OnSigValChanged(None)
+            return
+        xlo,xhi=self.ax1.get_xlim()
+        last=self.xvalues[arg2-1]
+        self.xvalues=self.extended(self.xvalues,arg2,self.x_to_num(self.gpx[self.xaxis][arg2:]))
+        if xlo<=last<=xhi:
+            shift=self.xvalues[-1]-last
+            self.ax1.set_xlim(xlo if xlo<=self.xvalues[0] else xlo+shift,xhi+shift)
+        for ax,lineprops,yauto in ((self.ax1,self.lineprops1,self.autoy1),(self.ax2,self.lineprops2,self.autoy2),(self.ax3,self.lineprops3,self.autoy3)):
+            if ax in self.plotdata:
+                plot,data,smooth=self.plotdata[ax]
+                new=news[ax]
+                self.plotdata[ax]=(plot,self.extended(data,arg2-1,new),smooth)
+                x,y=self.window_data(*self.plotdata[ax])
+                ax.get_lines()[0].set_data(x,y)
+                if lineprops['fill']:
+                    for coll in list(ax.collections):
+                        ax.collections.remove(coll)
+                    ax.fill_between(x,0,y,facecolor=lineprops['color'], alpha=0.2)
+                if yauto and np.isfinite(new).any():
+                    ylo,yhi=ax.get_ylim()
+                    ax.set_ylim(min(ylo,np.nanmin(new)),max(yhi,np.nanmax(new)))
+        self.Draw(False)
+
+    def appended_data(self,plot,smooth,first):
+        # plotted values of rows first.. (see update_axis), None if they can't be computed without the others
+        values=self.gpx[(plot,True)]
+        if smooth>1:
+            try:
+                if self.gpx.get_time_index().order is not None:
+                    return None
+                # rows of the windows of the new points
+                t=np.asarray(self.gpx['time'])
+                lo=np.searchsorted(t,t[first]-np.timedelta64(int(round(smooth*1e9)),'ns'),'right')
+            except KeyError:
+                return None
+            starts=np.union1d([0],self.gpx.segments[self.gpx.segments>=lo]-lo)
+            new=gpxobj.Rolling(values[lo:],t[lo:],smooth,starts).mean()[first-lo:]
+        else:
+            new=(1.0)*values[first:]
+        new[self.gpx['ok'][first:]==False]=np.NAN
+        return new
+
+    def extended(self,values,first,new):
+        # values[:first] followed by new, written in the memory after values when it has room (arrays grow
+        # by chunks, see gpxobj.grown()), so that a few new points do not copy the whole array
+        n=first+len(new)
+        buf=values.base
+        if not (isinstance(buf,np.ndarray) and buf.ndim==1 and buf.dtype==values.dtype and len(buf)>=n and \
+                buf.__array_interface__['data'][0]==values.__array_interface__['data'][0]):
+            buf=gpxobj.grown(values[:first],n)
+        buf[first:n]=new
+        return buf[:n]
+
     def OnSigCurChanged(self, arg1, arg2):
         if arg1==self.id:
             return
@@ -429,7 +561,7 @@ class WxLineScatterWidget(wx.Panel):
                  ('wxentry','Bottom',None,y1lo,'float'),
                  ('wxentry','Top',None,y1hi,'float'),
                  ('wxcheck','Auto Scale','-9|-8', self.autoy1,'bool'), #8
-                 ('wxhscale','Smooth','1|12|1|1',self.smooth1,'int'),
+                 ('wxhscale','Smooth (s)','1|12|1|1',self.smooth1,'int'),
                  ('wxcolor','Color',None,self.lineprops1['color'],'str'),
                  ('wxspin','Line width','0|12|1',self.lineprops1['linewidth'],'int'),
                  ('wxcombo','Marker','.|o|+|x|^|4|s|*|D',self.lineprops1['marker'],'str'),
@@ -441,7 +573,7 @@ class WxLineScatterWidget(wx.Panel):
                  ('wxentry','Bottom',None,y2lo,'float'),
                  ('wxentry','Top',None,y2hi,'float'),
                  ('wxcheck','Auto Scale','-20|-19', self.autoy2,'bool'),
-                 ('wxhscale','Smooth','1|12|1|1',self.smooth2,'int'),
+                 ('wxhscale','Smooth (s)','1|12|1|1',self.smooth2,'int'),
                  ('wxcolor','Color',None,self.lineprops2['color'],'str'),
                  ('wxspin','Line width','0|12|1',self.lineprops2['linewidth'],'int'),
                  ('wxcombo','Marker','.|o|+|x|^|4|s|*|D',self.lineprops2['marker'],'str'),
@@ -453,7 +585,7 @@ class WxLineScatterWidget(wx.Panel):
                  ('wxentry','Bottom',None,y3lo,'float'),
                  ('wxentry','Top',None,y3hi,'float'),
                  ('wxcheck','Auto Scale','-31|-30', self.autoy3,'bool'),
-                 ('wxhscale','Smooth','1|12|1|1',self.smooth3,'int'),
+                 ('wxhscale','Smooth (s)','1|12|1|1',self.smooth3,'int'),
                  ('wxcolor','Color',None,self.lineprops3['color'],'str'),
                  ('wxspin','Line width','0|12|1',self.lineprops3['linewidth'],'int'),
                  ('wxcombo','Marker','.|o|+|x|^|4|s|*|D',self.lineprops3['marker'],'str'),
@@ -505,8 +637,8 @@ class WxLineScatterWidget(wx.Panel):
         self.press = False
         if event.button==1 and self.span!=None:
             if where=='main':
-                idx1=np.searchsorted(self.ax1.get_lines()[0].get_data()[0],self.x0)
-                idx2=np.searchsorted(self.ax1.get_lines()[0].get_data()[0],event.xdata)
+                idx1=self.x_to_index(self.x0)
+                idx2=self.x_to_index(event.xdata)
                 self.selstart=min(idx1,idx2)
                 self.selstop=max(idx1,idx2)
                 if self.selstart==self.selstop:
@@ -542,6 +674,7 @@ class WxLineScatterWidget(wx.Panel):
             dx = event.xdata - self.x0
             dy = event.ydata - self.y0
             self.ax1.set_xlim(self.ax1.get_xlim()[0]-dx,self.ax1.get_xlim()[1]-dx)
+            self.RefineView()
             self.Draw(False)
         if where=='main' and self.press:
             self.span.set_bounds(self.x0,\
@@ -552,7 +685,7 @@ class WxLineScatterWidget(wx.Panel):
         if where=='main' and self.cursor!=None:
             self.cursor.set_xdata(event.xdata)
             xval=event.xdata
-            idx=np.searchsorted(self.ax1.get_lines()[0].get_data()[0],xval)
+            idx=self.x_to_index(xval)
             while self.gpx['ok'][idx]==False and idx>=0:        #look for nearest enabled point
                 idx-=1
             idx=clamp(idx,0,self.gpx.get_row_count()-1)
@@ -578,6 +711,7 @@ class WxLineScatterWidget(wx.Panel):
             nxlo=max(nxlo,xmin)
             self.ax1.set_xlim([nxlo,nxhi])
             self.format_x_axis()
+            self.RefineView()
         elif where=='left' or where=='right' or where=='3rd':
             if where=='left':
                 ax=self.ax1
@@ -588,8 +722,8 @@ class WxLineScatterWidget(wx.Panel):
             elif where=='3rd':
                 ax=self.ax3
                 plot=self.plot3
-            ymax=np.max(self.gpx[plot]*self.gpx.scale[plot])
-            ymin=np.min(self.gpx[plot]*self.gpx.scale[plot])
+            ymax=np.max(self.gpx[(plot,1)])
+            ymin=np.min(self.gpx[(plot,1)])
             ylo,yhi=ax.get_ylim()
             if event.button == 'down':
                 scale_factor = 1.2
@@ -613,31 +747,25 @@ class WxLineScatterWidget(wx.Panel):
         item = self.select_menu.FindItemById(event.GetId())
         text = item.GetText()
         if text=="Disable selected":
-            self.gpx['ok'][self.selstart:self.selstop]=False
+            self.gpx.set_ok((self.selstart,self.selstop),False)
         if text=="Enable selected":
-            self.gpx['ok'][self.selstart:self.selstop]=True
+            self.gpx.set_ok((self.selstart,self.selstop),True)
         if text=="Disable non selected":
-            self.gpx['ok'][:self.selstart]=False
-            self.gpx['ok'][self.selstop:]=False
+            self.gpx.set_ok([(0,self.selstart),(self.selstop,self.gpx.get_row_count())],False)
         if text=="Enable non selected":
-            self.gpx['ok'][:self.selstart]=True
-            self.gpx['ok'][self.selstop:]=True
+            self.gpx.set_ok([(0,self.selstart),(self.selstop,self.gpx.get_row_count())],True)
         if text=="Delete selected":
             if wx.MessageDialog(None, "Delete Points...?",\
                                 'Are you sure you want to delete these points',\
                                 wx.YES_NO | wx.ICON_QUESTION).ShowModal()==wx.ID_YES:
-                for _ in xrange(self.selstart, self.selstop):
-                    self.gpx.drop_row(self.selstart)            #each time we delete, the rest of the array is shifted. so we have to delete always the same index
+                self.gpx.drop_rows((self.selstart,self.selstop))
         if text=="Delete non selected":
             if wx.MessageDialog(None, "Delete Points...?",\
                                 'Are you sure you want to delete these points',\
                                 wx.YES_NO | wx.ICON_QUESTION).ShowModal()==wx.ID_YES:
-                for _ in xrange(self.selstop,self.gpx.get_row_count()):
-                    self.gpx.drop_row(self.selstop)             #delete first end of range, to avoid shifting selstop
-                for _ in xrange(0,self.selstart):
-                    self.gpx.drop_row(0)
+                self.gpx.drop_rows([(0,self.selstart),(self.selstop,self.gpx.get_row_count())])
         if text=="Toggle points":
-            self.gpx['ok']=np.invert(self.gpx['ok'])
+            self.gpx.set_ok(slice(None),np.invert(self.gpx['ok']))
         pub.sendMessage("ValChanged",arg1=self.id)
         self.update_axis(self.ax1,self.plot1,self.ax1.get_ylim()[0],self.ax1.get_ylim()[1],self.autoy1, self.lineprops1, self.smooth1)
         self.update_axis(self.ax2,self.plot2,self.ax2.get_ylim()[0],self.ax2.get_ylim()[1],self.autoy2, self.lineprops2, self.smooth2)
@@ -647,23 +775,23 @@ class WxLineScatterWidget(wx.Panel):
         if self.plot1!="none":
             msg1=self.plot1+\
                 " ("+str(self.gpx.get_unit(self.plot1)[0])+"): "\
-                +str(self.gpx[self.plot1][idx]*self.gpx.scale[self.plot1])
+                +str(self.gpx[(self.plot1,1)][idx])
         else:
             msg1=""
         if self.plot2!="none":
             msg2=self.plot2+\
                 " ("+str(self.gpx.get_unit(self.plot2)[0])+"): "\
-                +str(self.gpx[self.plot2][idx]*self.gpx.scale[self.plot2])
+                +str(self.gpx[(self.plot2,1)][idx])
         else:
             msg2=""
         if self.plot3!="none":
             msg3=self.plot3+\
                 " ("+str(self.gpx.get_unit(self.plot3)[0])+"): "\
-                +str(self.gpx[self.plot3][idx]*self.gpx.scale[self.plot3])
+                +str(self.gpx[(self.plot3,1)][idx])
         else:
             msg3=""
         pub.sendMessage("StatusChanged",arg1=self.id,\
-                            arg2=self.gpx['time'][idx],\
+                            arg2=gpxobj.format_iso8601(self.gpx['time'][idx]),\
                             arg3=msg1,\
                             arg4=msg2,\
                             arg5=msg3
@@ -676,6 +804,7 @@ class WxTimeWidget(WxLineScatterWidget):
         self.lineprops1=wxLineProps({'color':'#990000','fill':True})
         self.lineprops2=wxLineProps({'color':'#009900','fill':True})
         self.lineprops3=wxLineProps({'color':'#000099','fill':True})
+        self.maxpoints=4000
     
     def XAxisAllowed(self):
         return 'time|duration|distance'
@@ -84,37 +84,67 @@ class GpxMapLayer(WxMapLayer):
         self.currentindic='Arrowhead'
         self.currentzoom=25
         self.linewidth=2.0
+        self.projected=None                         # (zoom,left,top,lat and lon stamps) of screen coordinates
         pub.subscribe(self.OnSigCurChanged, "CurChanged")
         pub.subscribe(self.OnSigSelChanged, "SelChanged")
         pub.subscribe(self.OnSigValChanged, "ValChanged")
+        pub.subscribe(self.OnSigRowsAppended, "RowsAppended")
 
     def AttachGpx(self,data):
-        self.gpx=data
-        self._gpx=np.ones(self.gpx.get_row_count(),dtype={'names':['_x','_y','_r','_g','_b','_d'],'formats':['int','int','int','int','int','float']})
+        self.gpx=gpxobj.weak(data)
+        self.InitBuffer()
+        self.parent.EncloseGeoBbox(self.gpx.d['lat'].min(),self.gpx.d['lon'].min(),self.gpx.d['lat'].max(),self.gpx.d['lon'].max())
+        self.parent.Draw()
+        self.parent.Refresh()
+
+    def InitBuffer(self):
+        # screen coordinates and colors of each point (pixels fit in int32, color components in bytes)
+        self._gpx=np.ones(self.gpx.get_row_count(),dtype={'names':['_x','_y','_r','_g','_b'],'formats':['int32','int32','uint8','uint8','uint8']})
+        self._gpxbuf=self._gpx                      # grows by chunks for live tracks (see OnSigRowsAppended)
+        self.projected=None
         if self.gpx.has_field('speed'):
             self.BuildColorTable(self.trackcolorkey)
         else:
             self._gpx['_r']=255
             self._gpx['_g']=0
             self._gpx['_b']=0
-        self.parent.EncloseGeoBbox(self.gpx.d['lat'].min(),self.gpx.d['lon'].min(),self.gpx.d['lat'].max(),self.gpx.d['lon'].max())
-        self.parent.Draw()
-        self.parent.Refresh()
 
     def DetachGpx(self):
         self.gpx=None
         self._gpx=None
+        self._gpxbuf=None
+        self.bufferdata=None
 
     def DrawOffscreen(self,dc):
         if self.gpx==None:
             return
         self.NPLatLonToScreen()
-        self.bufferdata=np.dstack((self._gpx['_x'],self._gpx['_y'], \
-                                        self._gpx['_r']/255.0,self._gpx['_g']/255.0,self._gpx['_b']/255.0,
-                                        self.gpx['ok']*1.0)).flatten()
+        # only the points which are more than half a pixel away from the simplified track (see gpx.simplify()),
+        # and the points around enabled/disabled transitions
+        res=(math.pi*6378137)/(128*2**self.parent.zoom)*math.cos(math.radians(self.gpx.get_spatial_index().lat0))
+        ok=self.gpx['ok']
+        edges=np.flatnonzero(ok[1:]!=ok[:-1])
+        rows=np.union1d(self.gpx.simplify(res/2),np.concatenate((edges,edges+1)))
+        # zoomed in, only the lines which may cross the visible window (one window of margin) are drawn
+        w,h=self.parent.GetClientSize()
+        x,y=self._gpx['_x'][rows],self._gpx['_y'][rows]
+        near=(np.minimum(x[:-1],x[1:])<=2*w)&(np.maximum(x[:-1],x[1:])>=-w)& \
+             (np.minimum(y[:-1],y[1:])<=2*h)&(np.maximum(y[:-1],y[1:])>=-h)
+        keep=np.zeros(len(rows),dtype='bool')
+        keep[:-1]|=near
+        keep[1:]|=near
+        kept=np.flatnonzero(keep)
+        rows=rows[kept]
+        self.bufferdata=np.dstack((self._gpx['_x'][rows],self._gpx['_y'][rows], \
+                                        self._gpx['_r'][rows]/255.0,self._gpx['_g'][rows]/255.0,self._gpx['_b'][rows]/255.0,
+                                        ok[rows]*1.0)).flatten()
         pen=self.parent.renderer
         pen.SetLineWidth(self.linewidth)
-        pen.RGBALines(self.bufferdata)
+        # one line strip per track segment, and per part of it within the window
+        seg=np.searchsorted(self.gpx.segments,rows,'right')
+        first=np.flatnonzero(np.concatenate(([True],(np.diff(kept)>1)|(np.diff(seg)>0)))).astype('int32') if len(rows) else np.zeros(0,dtype='int32')
+        count=np.diff(np.append(first,len(rows))).astype('int32')
+        pen.RGBALines(self.bufferdata,first,count)
 
     def DrawOnscreen(self,dc):
         if self.currentindic=='Dot':
@@ -177,11 +207,11 @@ class GpxMapLayer(WxMapLayer):
         #    return False
         if not self.parent.dragging:
             if self.gpx!=None:
-                self._gpx['_d']=np.power((self._gpx['_x']-event.GetX()),2)+np.power((self._gpx['_y']-event.GetY()),2)
-                #i=np.argmin(self.gpx[('_d',0,1)])
-                #idx=self.gpx[('idx',0,1)][i]
-                i=np.argmin(self._gpx['_d'][np.where(self.gpx['ok']==True)])
-                idx=self.gpx['idx'][np.where(self.gpx['ok']==True)][i]
+                # nearest enabled point, from the spatial index of the track
+                (lat,lon)=self.parent.ScreenToGeo(event.GetX(),event.GetY())
+                idx=self.gpx.hv_nearest(lat,lon,True)
+                if idx==None:
+                    return False
                 self.current=idx
                 self.current_x=self._gpx['_x'][idx]
                 self.current_y=self._gpx['_y'][idx]
@@ -190,12 +220,13 @@ class GpxMapLayer(WxMapLayer):
                 self.parent.Refresh()
                 return False                # let other layer process this event
 
-    def BuildColorTable(self,meas):
+    def BuildColorTable(self,meas,lo=0):
+        # colors of rows lo.. (new rows of a live track take the colors of the current range)
         if meas not in self.gpx.get_header_names():
             #build palette from provided color
-            self._gpx['_r']=self.trackcolordefault[0]*255
-            self._gpx['_g']=self.trackcolordefault[1]*255
-            self._gpx['_b']=self.trackcolordefault[2]*255
+            self._gpx['_r'][lo:]=self.trackcolordefault[0]*255
+            self._gpx['_g'][lo:]=self.trackcolordefault[1]*255
+            self._gpx['_b'][lo:]=self.trackcolordefault[2]*255
             return
         cmin=self.gpx[meas].min()
         crange=self.gpx[meas].max()-cmin
@@ -209,28 +240,34 @@ class GpxMapLayer(WxMapLayer):
             #self._gpx['_g'][idx]= int(255*palette(value)[1])
             #self._gpx['_b'][idx]= int(255*palette(value)[2])
         ## wxPython without matplotlib
-        for idx in xrange(0,len(self.gpx[meas])-1):
+        for idx in xrange(lo,len(self.gpx[meas])-1 if lo==0 else len(self.gpx[meas])):
             value=(float(self.gpx[meas][idx]-cmin)/crange)
             self._gpx['_r'][idx]= FloatToRGB(value)[0]
             self._gpx['_g'][idx]= FloatToRGB(value)[1]
             self._gpx['_b'][idx]= FloatToRGB(value)[2]
 
-    def NPLatLonToScreen(self):
+    def NPLatLonToScreen(self,lo=0):
+        # screen coordinates of rows lo.., kept until the view or the positions change
         if self.gpx==None:
             return
         zoom=self.parent.zoom
         left=self.parent.left
         top=self.parent.top
+        view=(zoom,left,top,self.gpx.get_version('lat'),self.gpx.get_version('lon'))
+        if lo==0 and view==self.projected:
+            return
         #oshift=2 * math.pi * 6378137 / 2.0
         #res=(2*math.pi*6378137)/ (256*2**zoom)
         oshift=math.pi * 6378137
         res=(math.pi*6378137)/ (128*2**zoom)
-        self._gpx['_y'] = np.log(np.tan((self.gpx['lat']+90.0)*math.pi/360.0)) / (math.pi/180.0) *( oshift / 180 )
-        self._gpx['_x'] = self.gpx['lon'] * oshift / 180.0
-        self._gpx['_x']=(self._gpx['_x']+oshift)/res
-        self._gpx['_y']=(self._gpx['_y']+oshift)/res
-        self._gpx['_x']=self._gpx['_x']-left
-        self._gpx['_y']=((2 ** zoom) * 256)-self._gpx['_y']-top
+        _gpx=self._gpx[lo:]
+        _gpx['_y'] = np.log(np.tan((self.gpx['lat'][lo:]+90.0)*math.pi/360.0)) / (math.pi/180.0) *( oshift / 180 )
+        _gpx['_x'] = self.gpx['lon'][lo:] * oshift / 180.0
+        _gpx['_x']=(_gpx['_x']+oshift)/res
+        _gpx['_y']=(_gpx['_y']+oshift)/res
+        _gpx['_x']=_gpx['_x']-left
+        _gpx['_y']=((2 ** zoom) * 256)-_gpx['_y']-top
+        self.projected=view
 
     def OnLeftMouseDblClick(self,event):
         if not self.active:
@@ -265,11 +302,37 @@ class GpxMapLayer(WxMapLayer):
     def OnSigValChanged(self,arg1):
         if arg1==self.id:
             return
+        if self.gpx==None:
+            return
+        if self._gpx.shape[0]!=self.gpx.get_row_count():
+            # points were deleted or restored
+            self.InitBuffer()
         self.BuildColorTable(self.trackcolorkey)
         self.parent.Refresh()
         self.parent.Draw()
         self.parent.Refresh()
 
+    def OnSigRowsAppended(self,arg1,arg2):
+        # live track: only the new points (rows arg2..) are projected and colored
+        if arg1==self.id or self.gpx==None:
+            return
+        first=self._gpx.shape[0]
+        if first!=arg2:
+            self.InitBuffer()
+            first=0
+        else:
+            self._gpxbuf=gpxobj.grown(self._gpxbuf,self.gpx.get_row_count())
+            self._gpx=self._gpxbuf[:self.gpx.get_row_count()]
+            if self.gpx.has_field('speed'):
+                self.BuildColorTable(self.trackcolorkey,first)
+            else:
+                self._gpx['_r'][first:]=255
+                self._gpx['_g'][first:]=0
+                self._gpx['_b'][first:]=0
+        self.NPLatLonToScreen(first)
+        self.parent.Draw()
+        self.parent.Refresh()
+
     def OnSigCurChanged(self, arg1, arg2):
         if arg1==self.id:
             return